@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the Gelbe Seiten Scraper
+Runs against the recorded ajaxsuche fixture and the local stub server - no live site needed
+
+Measures parse throughput per backend, end-to-end pages/second under simulated latency
+(sync, async, pipelined), export throughput, peak RSS and the memory held by 100k kept
+results per layout (dicts, Records, columns), and compares with a stored baseline.
+
+Usage:
+    python3 bench_gelbeseiten.py                          # run and compare with bench_baseline.json
+                                                          # (exit 2 if there is none)
+    python3 bench_gelbeseiten.py --save-baseline          # store this run as the new baseline
+    python3 bench_gelbeseiten.py --latency 0.1 --copies 20 --tolerance 0.15 --fail-on-regression
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from gelbeseiten_parsers import PARSERS, get_parser
+from gelbeseiten_ratelimit import RateLimiter
+from gelbeseiten_records import Record, RecordBuffer
+from gelbeseiten_scraper import GelbeSeitenScraperComplete
+from gelbeseiten_sinks import SINKS, open_sink
+from gelbeseiten_stub import StubGelbeSeitenServer, load_entries, load_recording
+
+BASE_URL = "https://www.gelbeseiten.de"
+DEFAULT_BASELINE = Path(__file__).parent / "bench_baseline.json"
+
+# Metrics where a smaller number is better; all others are throughputs
+LOWER_IS_BETTER = ('peak_rss_mb', 'memory_dicts_mb', 'memory_records_mb', 'memory_columns_mb')
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (0 where unsupported)"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def timed(func: Callable, min_seconds: float = 0.5) -> float:
+    """Seconds per call, repeating func until at least min_seconds passed"""
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def fast_limiter() -> RateLimiter:
+    # The benchmark measures the scraper, not the politeness delay
+    return RateLimiter(rate=10000, max_rate=10000, burst=1000, backoff_base=0.01)
+
+
+def bench_parse(pages: List[str]) -> Dict[str, float]:
+    """records/second of every available parser backend over the fixture pages"""
+    records = sum(len(get_parser('soup')(html, BASE_URL)[1]) for html in pages)
+    metrics = {}
+    for name in PARSERS:
+        try:
+            parse = get_parser(name)
+        except ImportError:
+            continue
+        seconds = timed(lambda: [parse(html, BASE_URL) for html in pages])
+        metrics[f'parse_{name}_records_per_s'] = records / seconds
+    return metrics
+
+
+def bench_crawl(entries: List[str], latency: float, results_per_page: int,
+                concurrency: int) -> Dict[str, float]:
+    """End-to-end pages/second against the stub with `latency` seconds per request"""
+    pages = -(-len(entries) // results_per_page) + 1  # plus the empty page that ends the crawl
+    metrics = {}
+
+    def scraper(url: str) -> GelbeSeitenScraperComplete:
+        return GelbeSeitenScraperComplete("steuerberater", base_url=url, rate_limiter=fast_limiter())
+
+    with StubGelbeSeitenServer(entries=entries, latency=latency) as stub:
+        runs = {
+            'sync': lambda: scraper(stub.base_url).scrape_all(results_per_page=results_per_page),
+            'async': lambda: asyncio.run(scraper(stub.base_url).scrape_all_async(
+                results_per_page=results_per_page, concurrency=concurrency)),
+            'pipelined': lambda: scraper(stub.base_url).scrape_all_pipelined(
+                results_per_page=results_per_page),
+        }
+        for name, run in runs.items():
+            started = time.perf_counter()
+            results = run()
+            elapsed = time.perf_counter() - started
+            assert len(results) == len(entries), f"{name} crawl returned {len(results)} records"
+            metrics[f'crawl_{name}_pages_per_s'] = pages / elapsed
+    return metrics
+
+
+def bench_export(records: List[Dict[str, str]]) -> Dict[str, float]:
+    """records/second of the streaming sinks and the legacy full-rewrite CSV writers"""
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for suffix in SINKS:
+            if suffix == '.ndjson':
+                continue  # same writer as .jsonl
+
+            def write(suffix=suffix):
+                with open_sink(Path(tmp) / f"out{suffix}") as sink:
+                    for start in range(0, len(records), 10):
+                        sink.write_many(records[start:start + 10])
+            try:
+                seconds = timed(write)
+            except ImportError:
+                continue  # pyarrow missing
+            metrics[f'export_sink{suffix.replace(".", "_")}_records_per_s'] = len(records) / seconds
+
+        scraper = GelbeSeitenScraperComplete("steuerberater")
+        scraper.results = records
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics['export_to_csv_records_per_s'] = len(records) / timed(
+                lambda: scraper.export_to_csv(str(Path(tmp) / "export.csv")))
+        metrics['save_progress_records_per_s'] = len(records) / timed(
+            lambda: scraper.save_progress(str(Path(tmp) / "progress.csv")))
+    return metrics
+
+
+def fresh_copies(records: List[Dict[str, str]], count: int) -> Iterator[Dict[str, str]]:
+    """`count` records with their own string objects, like separately parsed pages produce"""
+    for i in range(count):
+        record = records[i % len(records)]
+        yield {field: value.encode('utf-8').decode('utf-8') for field, value in record.items()}
+
+
+def bench_memory(records: List[Dict[str, str]], count: int = 100000) -> Dict[str, float]:
+    """MB held by `count` kept results as dicts, slotted Records and a columnar RecordBuffer"""
+    layouts = {
+        'dicts': list,
+        'records': lambda items: [Record(item) for item in items],
+        'columns': RecordBuffer,
+    }
+    metrics = {}
+    for name, build in layouts.items():
+        tracemalloc.start()
+        kept = build(fresh_copies(records, count))
+        metrics[f'memory_{name}_mb'] = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+        tracemalloc.stop()
+        del kept
+    return metrics
+
+
+def run_benchmarks(latency: float = 0.02, copies: int = 10, results_per_page: int = 10,
+                   concurrency: int = 4, memory_records: int = 100000) -> Dict[str, float]:
+    """Run the whole suite; the fixture is replicated `copies` times for the crawl and export"""
+    pages = [page['payload']['html'] for page in load_recording()['pages']]
+    entries = load_entries() * copies
+    records = get_parser('soup')(''.join(entries), BASE_URL)[1]
+
+    metrics = {}
+    metrics.update(bench_parse(pages))
+    metrics.update(bench_crawl(entries, latency, results_per_page, concurrency))
+    metrics.update(bench_export(records))
+    if memory_records:
+        metrics.update(bench_memory(records, memory_records))
+    metrics['peak_rss_mb'] = peak_rss_mb()
+    return metrics
+
+
+def compare(metrics: Dict[str, float], baseline: Dict[str, float],
+            tolerance: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than `tolerance` (0.2 = 20%)"""
+    regressions = []
+    for name, value in metrics.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        change = (value - old) / old
+        worse = change > tolerance if name in LOWER_IS_BETTER else change < -tolerance
+        if worse:
+            regressions.append(f"{name}: {old:.1f} -> {value:.1f} ({change * 100:+.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Gelbe Seiten benchmarks")
+    parser.add_argument('--latency', type=float, default=0.02, help="Simulated seconds per request")
+    parser.add_argument('--copies', type=int, default=10, help="Fixture copies for crawl/export")
+    parser.add_argument('--concurrency', type=int, default=4, help="Requests in flight (async)")
+    parser.add_argument('--memory-records', type=int, default=100000,
+                        help="Kept results for the memory comparison (0 skips it)")
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown (0.2 = 20%%)")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    baseline_file = Path(args.baseline)
+    if not args.save_baseline and not baseline_file.exists():
+        # Fail before the run: a comparison that silently never happens is no regression check
+        parser.error(f"no baseline at {baseline_file} - run with --save-baseline first")
+
+    logging.getLogger().setLevel(logging.WARNING)
+    metrics = run_benchmarks(args.latency, args.copies, concurrency=args.concurrency,
+                             memory_records=args.memory_records)
+
+    print(f"{'metric':<42} {'value':>12}")
+    for name, value in metrics.items():
+        print(f"{name:<42} {value:>12.1f}")
+
+    if args.save_baseline:
+        baseline_file.write_text(json.dumps({
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'settings': {'latency': args.latency, 'copies': args.copies,
+                         'concurrency': args.concurrency},
+            'metrics': metrics,
+        }, indent=2))
+        print(f"\n✓ Baseline saved to {baseline_file}")
+        return
+
+    regressions = compare(metrics, json.loads(baseline_file.read_text())['metrics'], args.tolerance)
+    if regressions:
+        print(f"\n⚠️  {len(regressions)} regressions against {baseline_file}:")
+        for line in regressions:
+            print(f"   {line}")
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print(f"\n✓ No regressions against {baseline_file} (tolerance {args.tolerance * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Batch scraping of many search terms for the Gelbe Seiten Scraper
+All terms share one session, one connection pool and one rate budget; pages are
+interleaved round-robin so no term starves the others
+
+Usage:
+    python3 gelbeseiten_batch.py steuerberater ärzte zahnarzt --concurrency 4 --rate 2
+    python3 gelbeseiten_batch.py --terms-file branchen.txt --output-dir nightly --combined alle.csv
+"""
+
+import argparse
+import contextlib
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from gelbeseiten_ratelimit import RateLimiter
+from gelbeseiten_dedup import Deduplicator
+from gelbeseiten_metrics import CrawlMetrics, JsonSnapshotWriter, MetricsServer
+from gelbeseiten_shards import safe_name
+from gelbeseiten_sinks import FIELDNAMES, ResultSink, open_sink
+from gelbeseiten_transport import make_session
+
+logger = logging.getLogger(__name__)
+
+# The combined dataset records which term found a business first
+COMBINED_FIELDNAMES = FIELDNAMES + ['search_term']
+
+
+def read_terms(filename: str) -> List[str]:
+    """Search terms from a file, one per line ('#' starts a comment)"""
+    terms = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            term = line.split('#', 1)[0].strip()
+            if term and term not in terms:
+                terms.append(term)
+    return terms
+
+
+class _TermState:
+    """Crawl position and output of one search term"""
+
+    def __init__(self, scraper, output_file: str, max_results: int = None):
+        self.scraper = scraper
+        self.output_file = output_file
+        self.sink = open_sink(output_file)
+        self.max_results = max_results
+        self.started = False
+        self.position = 0
+        self.total_scraped = 0
+        self.done = False
+        self.failed = False
+
+    @property
+    def search_term(self) -> str:
+        return self.scraper.search_term
+
+
+class BatchScraper:
+    """
+    Scrape a list of search terms over one shared session and rate limiter
+
+    At most one page per term is in flight, so every term is committed in
+    position order. Free workers pick the next term round-robin, which keeps
+    the interleaving fair however many pages a term has.
+
+    Args:
+        search_terms: Terms to scrape (duplicates are ignored)
+        concurrency: Page requests in flight across all terms
+        rate_limiter: Shared RateLimiter (default: RateLimiter())
+        scraper_kwargs: Extra GelbeSeitenScraperComplete arguments (base_url, parser, cache, ...)
+    """
+
+    def __init__(self, search_terms: Iterable[str], concurrency: int = 4,
+                 rate_limiter: RateLimiter = None, scraper_kwargs: Dict = None):
+        self.search_terms = list(dict.fromkeys(search_terms))
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.scraper_kwargs = scraper_kwargs or {}
+
+        # One pooled connection per in-flight request, shared by all terms
+        self.session = make_session(pool_size=concurrency)
+
+    def _make_scraper(self, search_term: str):
+        from gelbeseiten_scraper import GelbeSeitenScraperComplete
+
+        return GelbeSeitenScraperComplete(
+            search_term=search_term, rate_limiter=self.rate_limiter,
+            session=self.session, **self.scraper_kwargs
+        )
+
+    @staticmethod
+    def _next_page(state: _TermState, results_per_page: int) -> Tuple[int, Optional[List[Dict[str, str]]]]:
+        """Worker task: warm up the term on its first page, then fetch and parse"""
+        if not state.started:
+            if not state.scraper.initialize_session():
+                return state.position, None
+            state.started = True
+        return state.scraper._fetch_and_parse(state.position, results_per_page)
+
+    def _commit(self, state: _TermState, page_results: Optional[List[Dict[str, str]]],
+                results_per_page: int, combined: Optional[ResultSink], dedup: Deduplicator) -> int:
+        """Write one finished page; returns the number of new combined records"""
+        if page_results is None:
+            logger.error(f"'{state.search_term}': too many consecutive failures, giving up")
+            state.done = state.failed = True
+            return 0
+        if not page_results:
+            logger.info(f"'{state.search_term}': no more results at position {state.position}")
+            state.done = True
+            return 0
+
+        if state.max_results:
+            page_results = page_results[:state.max_results - state.total_scraped]
+        state.total_scraped += len(page_results)
+        state.scraper._commit_page(page_results, state.position,
+                                   state.position + results_per_page,
+                                   state.total_scraped, state.sink)
+        state.position += results_per_page
+        if state.max_results and state.total_scraped >= state.max_results:
+            state.done = True
+
+        new_records = [{**record, 'search_term': state.search_term}
+                       for record in dedup.filter(page_results)]
+        if combined:
+            combined.write_many(new_records)
+        return len(new_records)
+
+    def run(self, output_dir: str = ".", combined_file: str = None,
+            max_results_per_term: int = None, results_per_page: int = 10) -> Dict[str, Dict]:
+        """
+        Scrape all terms
+
+        Args:
+            output_dir: Directory for the per-term files (gelbeseiten_<term>.csv)
+            combined_file: Deduplicated dataset of all terms (None: skip)
+            max_results_per_term: Limit per search term (None for all available)
+            results_per_page: Number of results per page
+
+        Returns:
+            Per-term summary: results, total_available, failed, output_file
+        """
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        states = {}
+        for term in self.search_terms:
+            output_file = Path(output_dir) / f"gelbeseiten_{safe_name(term)}.csv"
+            states[term] = _TermState(self._make_scraper(term), str(output_file),
+                                      max_results_per_term)
+
+        combined = open_sink(combined_file, fieldnames=COMBINED_FIELDNAMES) if combined_file else None
+        dedup = Deduplicator()
+        combined_count = 0
+        ready = deque(states.values())  # terms without a page in flight
+        pending = {}  # future -> term state
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                while ready or pending:
+                    while ready and len(pending) < self.concurrency:
+                        state = ready.popleft()
+                        future = executor.submit(self._next_page, state, results_per_page)
+                        pending[future] = state
+
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        state = pending.pop(future)
+                        _, page_results = future.result()
+                        combined_count += self._commit(state, page_results, results_per_page,
+                                                       combined, dedup)
+                        if not state.done:
+                            ready.append(state)
+        finally:
+            for state in states.values():
+                state.sink.close()
+            if combined:
+                combined.close()
+
+        logger.info(f"Batch complete: {len(states)} terms, {combined_count} unique results, "
+                    f"rate limiter {self.rate_limiter.stats()}")
+        return {
+            term: {
+                'results': state.total_scraped,
+                'total_available': state.scraper.total_available,
+                'failed': state.failed,
+                'output_file': state.output_file,
+            }
+            for term, state in states.items()
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape many Gelbe Seiten search terms in one run")
+    parser.add_argument('terms', nargs='*', help="Search terms")
+    parser.add_argument('--terms-file', help="File with one search term per line")
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--combined', help="Deduplicated output of all terms (.csv, .jsonl, .parquet)")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=1.0, help="Requests per second for all terms together")
+    parser.add_argument('--max-results', type=int, help="Limit per search term")
+    parser.add_argument('--parser', default='auto', help="Parser backend: auto, lxml, soup")
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on this port")
+    parser.add_argument('--metrics-json', help="Write a JSON metrics snapshot to this file every 30s")
+    args = parser.parse_args()
+
+    terms = list(args.terms)
+    if args.terms_file:
+        terms += read_terms(args.terms_file)
+    if not terms:
+        parser.error("no search terms given")
+
+    metrics = CrawlMetrics()
+    batch = BatchScraper(terms, concurrency=args.concurrency,
+                         rate_limiter=RateLimiter(rate=args.rate),
+                         scraper_kwargs={'parser': args.parser, 'metrics': metrics})
+    with contextlib.ExitStack() as stack:
+        if args.metrics_port:
+            stack.enter_context(MetricsServer(metrics.registry, port=args.metrics_port))
+        if args.metrics_json:
+            stack.enter_context(JsonSnapshotWriter(metrics.registry, args.metrics_json))
+        summary = batch.run(args.output_dir, args.combined, args.max_results)
+
+    for term, info in summary.items():
+        status = "✗" if info['failed'] else "✓"
+        print(f"{status} {term}: {info['results']} results -> {info['output_file']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of raw /ajaxsuche responses for the Gelbe Seiten Scraper
+gzip-compressed, keyed by (search term, position, page size, sortierung[, location]), with TTL and size cap
+
+Usage:
+    python3 gelbeseiten_cache.py reparse --cache-dir .gelbeseiten_cache --term steuerberater --output out.csv
+    python3 gelbeseiten_cache.py stats --cache-dir .gelbeseiten_cache
+    python3 gelbeseiten_cache.py evict --cache-dir .gelbeseiten_cache --ttl 604800 --max-mb 500
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Content-addressed store of raw responses
+
+    Every response lives in <directory>/<k[:2]>/<k>.json.gz where k is the
+    SHA-256 of its key. Reads refresh the file's mtime, so the size cap
+    evicts the least recently used responses first.
+
+    Expired responses with validators (ETag/Last-Modified) are kept by get()
+    and the TTL pass of evict() so they can be revalidated; only the size cap
+    drops them.
+
+    <directory>/chains/<s>.jsonl records, per search (s: SHA-256 of term,
+    sortierung and location), the page size of every stored position and the
+    position the crawl continued at (see link()), so pages() can follow the
+    crawl without guessing page sizes.
+
+    Args:
+        directory: Cache directory (created if missing)
+        ttl: Seconds a response stays valid (None: forever)
+        max_bytes: Size cap for all cached files (None: unlimited)
+    """
+
+    def __init__(self, directory: str = ".gelbeseiten_cache", ttl: float = None,
+                 max_bytes: int = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = sum(path.stat().st_size for path in self._files()) if max_bytes else 0
+
+    @staticmethod
+    def key(search_term: str, position: int, anzahl: int, sortierung: str = 'relevanz',
+            location: str = None) -> str:
+        parts = [search_term, position, anzahl, sortierung]
+        if location:
+            parts.append(location)
+        raw = json.dumps(parts)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json.gz"
+
+    def _chain_path(self, search_term: str, sortierung: str, location: Optional[str]) -> Path:
+        raw = json.dumps([search_term, sortierung, location])
+        return self.directory / "chains" / f"{hashlib.sha256(raw.encode('utf-8')).hexdigest()}.jsonl"
+
+    def _append_chain(self, search_term: str, sortierung: str, location: Optional[str], link: Dict):
+        path = self._chain_path(search_term, sortierung, location)
+        line = json.dumps(link) + '\n'
+        with self._lock:
+            path.parent.mkdir(exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def _files(self) -> Iterator[Path]:
+        return self.directory.glob('*/*.json.gz')
+
+    def _expired(self, fetched_at: float) -> bool:
+        return self.ttl is not None and time.time() - fetched_at > self.ttl
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Dict]:
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, search_term: str, position: int, anzahl: int,
+            sortierung: str = 'relevanz', location: str = None) -> Optional[Dict]:
+        """Cached response payload, None if missing or expired"""
+        path = self._path(self.key(search_term, position, anzahl, sortierung, location))
+        entry = self._read(path)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if self._expired(entry['fetched_at']):
+            # Responses with validators stay on disk for revalidation (see validators())
+            if not entry.get('validators'):
+                self._remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:  # evicted by another process since the read
+            pass
+        self.hits += 1
+        return entry['payload']
+
+    def validators(self, search_term: str, position: int, anzahl: int,
+                   sortierung: str = 'relevanz', location: str = None) -> Optional[Tuple[Dict, Dict]]:
+        """
+        (payload, validators) of a cached response, expired or not, if it has an
+        ETag or Last-Modified to revalidate it with - None otherwise
+        """
+        entry = self._read(self._path(self.key(search_term, position, anzahl, sortierung, location)))
+        if entry is None or not entry.get('validators'):
+            return None
+        return entry['payload'], entry['validators']
+
+    def put(self, search_term: str, position: int, anzahl: int, payload: Dict,
+            sortierung: str = 'relevanz', location: str = None, validators: Dict = None):
+        """
+        Store a response payload (atomically replaces an older copy)
+
+        Args:
+            validators: {'etag': ..., 'last_modified': ...} of the response, if the site sent any
+        """
+        path = self._path(self.key(search_term, position, anzahl, sortierung, location))
+        path.parent.mkdir(exist_ok=True)
+        entry = {
+            'search_term': search_term,
+            'position': position,
+            'anzahl': anzahl,
+            'sortierung': sortierung,
+            'location': location,
+            'fetched_at': time.time(),
+            'payload': payload,
+        }
+        if validators:
+            entry['validators'] = validators
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp, path)
+
+        self._append_chain(search_term, sortierung, location, {'position': position, 'anzahl': anzahl})
+
+        if self.max_bytes:
+            with self._lock:
+                self._size += path.stat().st_size - old_size
+                over = self._size > self.max_bytes
+            if over:
+                self.evict()
+
+    def link(self, search_term: str, position: int, anzahl: int, next_position: int,
+             sortierung: str = 'relevanz', location: str = None):
+        """
+        Record where the crawl continued after the page at `position`
+
+        Only needed when that is not position + anzahl, e.g. a crawl with a
+        PageSizeController advancing by the entries a page actually returned.
+        """
+        self._append_chain(search_term, sortierung, location,
+                           {'position': position, 'anzahl': anzahl, 'next': next_position})
+
+    def _chain(self, search_term: str, sortierung: str,
+               location: Optional[str]) -> Dict[int, Tuple[int, Optional[int]]]:
+        """position -> (anzahl, next position or None) of the latest crawl of a search"""
+        chain = {}
+        try:
+            with open(self._chain_path(search_term, sortierung, location), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        link = json.loads(line)
+                    except ValueError:  # torn last line of a crashed writer
+                        continue
+                    position, anzahl = link['position'], link['anzahl']
+                    previous = chain.get(position)
+                    if 'next' in link:
+                        chain[position] = (anzahl, link['next'])
+                    elif previous is None or previous[0] != anzahl:
+                        chain[position] = (anzahl, None)
+        except OSError:
+            pass
+        return chain
+
+    def _remove(self, path: Path):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            self._size -= size
+
+    def evict(self) -> int:
+        """
+        Drop expired responses without validators, then the least recently used
+        ones (with or without validators) above the size cap
+        """
+        files = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        removed = 0
+        if self.ttl is not None:
+            # A file is never older than its fetched_at, so mtime is a cheap pre-filter
+            cutoff = time.time() - self.ttl
+            kept = []
+            for mtime, size, path in files:
+                if mtime < cutoff:
+                    entry = self._read(path)
+                    if entry is not None and entry.get('validators'):
+                        kept.append((mtime, size, path))
+                        continue
+                    self._remove(path)
+                    removed += 1
+                else:
+                    kept.append((mtime, size, path))
+            files = kept
+
+        total = sum(size for _, size, _ in files)
+        with self._lock:
+            self._size = total
+        if self.max_bytes:
+            for mtime, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                removed += 1
+
+        if removed:
+            logger.info(f"Evicted {removed} cached responses")
+        return removed
+
+    def pages(self, search_term: str, sortierung: str = 'relevanz',
+              location: str = None) -> Iterator[Tuple[int, int, Dict]]:
+        """
+        Valid cached (position, anzahl, payload) of a search term in the order
+        the crawl requested them: from position 0, each page is followed by the
+        position the crawl continued at (position + anzahl unless link() said
+        otherwise). Loads one payload at a time; stops at the first position
+        without a valid page and warns if the chain went on beyond it.
+        """
+        chain = self._chain(search_term, sortierung, location)
+        position = 0
+        while position in chain:
+            anzahl, next_position = chain.pop(position)
+            entry = self._read(self._path(self.key(search_term, position, anzahl, sortierung, location)))
+            if entry is None or self._expired(entry['fetched_at']):
+                break
+            yield position, anzahl, entry['payload']
+            position = position + anzahl if next_position is None else next_position
+        if any(later > position for later in chain):
+            logger.warning(f"Cache has no page at position {position} - later pages were skipped")
+
+    def stats(self) -> Dict[str, int]:
+        files = list(self._files())
+        return {
+            'responses': len(files),
+            'bytes': sum(path.stat().st_size for path in files),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def main():
+    from gelbeseiten_scraper import GelbeSeitenScraperComplete
+
+    parser = argparse.ArgumentParser(description="Gelbe Seiten response cache")
+    parser.add_argument('command', choices=['reparse', 'stats', 'evict'])
+    parser.add_argument('--cache-dir', default='.gelbeseiten_cache')
+    parser.add_argument('--term', help="Search term to reparse")
+    parser.add_argument('--output', help="Output file (.csv, .jsonl, .parquet)")
+    parser.add_argument('--parser', default='auto', help="Parser backend: auto, lxml, soup")
+    parser.add_argument('--ttl', type=float, help="Seconds a response stays valid")
+    parser.add_argument('--max-mb', type=float, help="Size cap in MB")
+    args = parser.parse_args()
+
+    max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb else None
+    cache = ResponseCache(args.cache_dir, ttl=args.ttl, max_bytes=max_bytes)
+
+    if args.command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == 'evict':
+        print(f"Evicted {cache.evict()} responses")
+    else:
+        if not args.term or not args.output:
+            parser.error("reparse needs --term and --output")
+        scraper = GelbeSeitenScraperComplete(search_term=args.term, parser=args.parser, cache=cache)
+        results = scraper.reparse(output_file=args.output)
+        print(f"✓ {len(results)} results rebuilt from cache: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Distributed crawl coordinator for the Gelbe Seiten Scraper
+The coordinator splits (search term, position range) into leases in a shared SQLite
+queue; workers on any number of machines claim leases, fetch and parse them and
+commit one output file per lease. Expired leases (crashed or stalled workers) are
+re-issued, and the final merge deduplicates across leases.
+
+Usage:
+    python3 gelbeseiten_coordinator.py plan steuerberater --queue crawl.sqlite --lease-size 100
+    python3 gelbeseiten_coordinator.py work --queue crawl.sqlite --output-dir leases --workers 2
+    python3 gelbeseiten_coordinator.py status --queue crawl.sqlite
+    python3 gelbeseiten_coordinator.py merge --queue crawl.sqlite --output gelbeseiten_steuerberater.csv
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from gelbeseiten_ratelimit import RateLimiter
+from gelbeseiten_shards import merge_shards
+from gelbeseiten_sinks import JsonlSink
+
+logger = logging.getLogger(__name__)
+
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+
+class LeaseQueue:
+    """
+    Work queue of position ranges, shared by all workers through one SQLite file
+
+    A claimed lease belongs to its worker until `expires_at`; the worker extends
+    it with heartbeat() after every page. Once it expires, claim() hands it to
+    the next worker, and complete() from the old owner is rejected, so every
+    lease is committed exactly once.
+
+    Args:
+        filename: SQLite file holding the queue (on a disk all workers can reach)
+        lease_seconds: How long a claim is valid without a heartbeat
+        max_attempts: Claims after which a lease is marked failed
+    """
+
+    def __init__(self, filename: str = "gelbeseiten_queue.sqlite", lease_seconds: float = 120.0,
+                 max_attempts: int = 5):
+        self.filename = str(filename)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.filename, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS leases (
+                id INTEGER PRIMARY KEY,
+                search_term TEXT NOT NULL,
+                location TEXT NOT NULL DEFAULT '',
+                start INTEGER NOT NULL,
+                stop INTEGER NOT NULL,
+                page_size INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                records INTEGER,
+                output_file TEXT,
+                updated_at REAL NOT NULL,
+                UNIQUE (search_term, location, start)
+            );
+            CREATE INDEX IF NOT EXISTS leases_state ON leases (state, expires_at);
+        ''')
+
+    def _transaction(self, statements):
+        """Run statements(conn) in one write transaction (BEGIN IMMEDIATE locks out other writers)"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    def plan(self, search_term: str, total: int, lease_size: int = 100, page_size: int = 10,
+             location: str = None) -> int:
+        """
+        Add leases covering positions 0..total of a search (existing ranges are kept)
+
+        Returns:
+            Number of leases added
+        """
+        lease_size = max(page_size, lease_size - lease_size % page_size)
+        rows = [(search_term, location or '', start, min(start + lease_size, total), page_size,
+                 time.time())
+                for start in range(0, total, lease_size)]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO leases (search_term, location, start, stop, page_size, '
+                'updated_at) VALUES (?, ?, ?, ?, ?, ?)', rows
+            )
+            return conn.total_changes - before
+        added = self._transaction(insert)
+        logger.info(f"Planned {added} leases for '{search_term}' ({total} positions)")
+        return added
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """Lease the next pending (or expired) range to `worker`, None if there is none"""
+        def take(conn):
+            now = time.time()
+            row = conn.execute(
+                'SELECT id, search_term, location, start, stop, page_size, attempts FROM leases '
+                'WHERE state = ? OR (state = ? AND expires_at < ?) ORDER BY id LIMIT 1',
+                (PENDING, LEASED, now)
+            ).fetchone()
+            if not row:
+                return None
+            if row[6] >= self.max_attempts:
+                conn.execute('UPDATE leases SET state = ?, worker = NULL, updated_at = ? WHERE id = ?',
+                             (FAILED, now, row[0]))
+                logger.error(f"Lease {row[0]} failed {row[6]} times, giving up on it")
+                return take(conn)
+            conn.execute(
+                'UPDATE leases SET state = ?, worker = ?, expires_at = ?, attempts = attempts + 1, '
+                'updated_at = ? WHERE id = ?',
+                (LEASED, worker, now + self.lease_seconds, now, row[0])
+            )
+            return {'id': row[0], 'search_term': row[1], 'location': row[2] or None,
+                    'start': row[3], 'stop': row[4], 'page_size': row[5], 'attempt': row[6] + 1}
+        return self._transaction(take)
+
+    def heartbeat(self, lease_id: int, worker: str) -> bool:
+        """Extend a lease; False if it expired and went to another worker"""
+        def extend(conn):
+            return conn.execute(
+                'UPDATE leases SET expires_at = ? WHERE id = ? AND worker = ? AND state = ?',
+                (time.time() + self.lease_seconds, lease_id, worker, LEASED)
+            ).rowcount == 1
+        return self._transaction(extend)
+
+    def complete(self, lease_id: int, worker: str, records: int, output_file: str,
+                 exhausted_at: int = None) -> bool:
+        """
+        Commit a lease
+
+        Args:
+            lease_id: The lease
+            worker: Worker that claimed it (a stale owner is rejected)
+            records: Records written
+            output_file: Where they were written
+            exhausted_at: Position of the empty page that ended the results, if one was seen;
+                later leases of the same search are then done without fetching
+
+        Returns:
+            False if the lease was no longer owned by `worker`
+        """
+        def commit(conn):
+            now = time.time()
+            owned = conn.execute(
+                'UPDATE leases SET state = ?, records = ?, output_file = ?, expires_at = NULL, '
+                'updated_at = ? WHERE id = ? AND worker = ? AND state = ?',
+                (DONE, records, output_file, now, lease_id, worker, LEASED)
+            ).rowcount == 1
+            if owned and exhausted_at is not None:
+                conn.execute(
+                    'UPDATE leases SET state = ?, records = 0, updated_at = ? '
+                    'WHERE state = ? AND start >= ? AND (search_term, location) = '
+                    '(SELECT search_term, location FROM leases WHERE id = ?)',
+                    (DONE, now, PENDING, exhausted_at, lease_id)
+                )
+            return owned
+        return self._transaction(commit)
+
+    def release(self, lease_id: int, worker: str):
+        """Give a lease back for another attempt (after an error)"""
+        self._transaction(lambda conn: conn.execute(
+            'UPDATE leases SET state = ?, worker = NULL, expires_at = NULL, updated_at = ? '
+            'WHERE id = ? AND worker = ? AND state = ?',
+            (PENDING, time.time(), lease_id, worker, LEASED)
+        ))
+
+    def progress(self) -> Dict[str, int]:
+        """Lease count per state"""
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) FROM leases GROUP BY state').fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def done_files(self) -> List[str]:
+        """Output files of committed leases in position order"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT output_file FROM leases WHERE state = ? AND output_file IS NOT NULL '
+                'ORDER BY search_term, location, start', (DONE,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def plan_crawl(queue: LeaseQueue, search_term: str, location: str = None,
+               max_results: int = None, lease_size: int = 100, results_per_page: int = 10,
+               scraper_kwargs: Dict = None) -> int:
+    """
+    Split a search into leases, sized by the hit count of its search page
+
+    Args:
+        max_results: Positions to cover when the hit count is unknown (or to crawl less)
+
+    Returns:
+        Number of leases added
+    """
+    from gelbeseiten_scraper import GelbeSeitenScraperComplete
+
+    scraper = GelbeSeitenScraperComplete(search_term=search_term, location=location,
+                                         **(scraper_kwargs or {}))
+    scraper.initialize_session()
+    total = scraper.total_available
+    if max_results:
+        total = min(total, max_results) if total else max_results
+    if not total:
+        raise ValueError(f"Hit count of '{search_term}' unknown - pass max_results")
+    return queue.plan(search_term, total, lease_size, results_per_page, location)
+
+
+class CrawlWorker:
+    """
+    Claims leases and crawls them until the queue is drained
+
+    Each lease is written to <output_dir>/lease_<id>.jsonl through a temporary
+    file that is renamed on commit, so a re-issued lease simply replaces the
+    output of the worker that lost it.
+
+    Args:
+        queue: Shared LeaseQueue
+        output_dir: Directory for lease outputs (shared by all workers)
+        worker_id: Name in the queue (default: host-pid-random suffix, unique per worker)
+        requests_per_second: Rate of this worker
+        scraper_kwargs: Extra GelbeSeitenScraperComplete arguments (base_url, parser, ...)
+    """
+
+    def __init__(self, queue: LeaseQueue, output_dir: str = "leases", worker_id: str = None,
+                 requests_per_second: float = 1.0, scraper_kwargs: Dict = None):
+        self.queue = queue
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.requests_per_second = requests_per_second
+        self.scraper_kwargs = scraper_kwargs or {}
+        self.leases_done = 0
+        self.records_written = 0
+        self._scrapers = {}
+
+    def _scraper(self, search_term: str, location: Optional[str]):
+        """One warmed-up scraper (session, cookies) per search, reused across its leases"""
+        from gelbeseiten_scraper import GelbeSeitenScraperComplete
+
+        key = (search_term, location)
+        if key not in self._scrapers:
+            scraper = GelbeSeitenScraperComplete(
+                search_term=search_term, location=location,
+                rate_limiter=self.scraper_kwargs.get('rate_limiter') or RateLimiter(rate=self.requests_per_second),
+                **{k: v for k, v in self.scraper_kwargs.items() if k != 'rate_limiter'}
+            )
+            scraper.initialize_session()
+            self._scrapers[key] = scraper
+        return self._scrapers[key]
+
+    def process(self, lease: Dict) -> bool:
+        """Crawl one lease and commit it; False if it failed or was lost"""
+        scraper = self._scraper(lease['search_term'], lease['location'])
+        output_file = self.output_dir / f"lease_{lease['id']:06d}.jsonl"
+        tmp_file = output_file.with_name(f"{output_file.name}.{self.worker_id}.tmp")
+
+        records = 0
+        exhausted_at = None
+        lost = None
+        with JsonlSink(str(tmp_file)) as sink:
+            for position in range(lease['start'], lease['stop'], lease['page_size']):
+                anzahl = min(lease['page_size'], lease['stop'] - position)
+                _, page_results = scraper._fetch_and_parse(position, anzahl)
+                if page_results is None:
+                    lost = f"position {position} failed, releasing it"
+                    self.queue.release(lease['id'], self.worker_id)
+                    break
+                if not page_results:
+                    exhausted_at = position
+                    break
+                sink.write_many(page_results)
+                records += len(page_results)
+                if not self.queue.heartbeat(lease['id'], self.worker_id):
+                    lost = "expired and was re-issued, dropping it"
+                    break
+
+        if lost:
+            logger.warning(f"Lease {lease['id']} {lost}")
+            tmp_file.unlink(missing_ok=True)
+            return False
+        os.replace(tmp_file, output_file)
+        if not self.queue.complete(lease['id'], self.worker_id, records, str(output_file),
+                                   exhausted_at):
+            logger.warning(f"Lease {lease['id']} was re-issued before it could be committed")
+            return False
+        self.leases_done += 1
+        self.records_written += records
+        logger.info(f"Lease {lease['id']} ({lease['search_term']} {lease['start']}-{lease['stop']}) "
+                    f"done: {records} records")
+        return True
+
+    def run(self, max_leases: int = None) -> Dict[str, int]:
+        """Work until no lease is left (or max_leases were processed)"""
+        processed = 0
+        while max_leases is None or processed < max_leases:
+            lease = self.queue.claim(self.worker_id)
+            if lease is None:
+                break
+            try:
+                self.process(lease)
+            except Exception as e:
+                logger.error(f"Lease {lease['id']} failed: {e}")
+                self.queue.release(lease['id'], self.worker_id)
+            processed += 1
+        return {'leases': self.leases_done, 'records': self.records_written}
+
+
+def merge_leases(queue: LeaseQueue, output_file: str) -> Dict:
+    """Merge all committed lease outputs into one deduplicated file"""
+    stats = merge_shards(queue.done_files(), output_file)
+    stats['progress'] = queue.progress()
+    if stats['progress'][PENDING] or stats['progress'][LEASED]:
+        logger.warning(f"Merging before the crawl finished: {stats['progress']}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed Gelbe Seiten crawl")
+    parser.add_argument('command', choices=['plan', 'work', 'status', 'merge'])
+    parser.add_argument('search_terms', nargs='*', help="Search terms to plan")
+    parser.add_argument('--queue', default='gelbeseiten_queue.sqlite', help="Shared queue file")
+    parser.add_argument('--location', help="WO value for planned searches")
+    parser.add_argument('--max-results', type=int)
+    parser.add_argument('--lease-size', type=int, default=100, help="Positions per lease")
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--lease-seconds', type=float, default=120.0)
+    parser.add_argument('--output-dir', default='leases')
+    parser.add_argument('--workers', type=int, default=1, help="Workers on this machine")
+    parser.add_argument('--rate', type=float, default=1.0, help="Requests per second per worker")
+    parser.add_argument('--output', help="Merged output file")
+    args = parser.parse_args()
+
+    with LeaseQueue(args.queue, args.lease_seconds) as queue:
+        if args.command == 'plan':
+            if not args.search_terms:
+                parser.error("plan needs at least one search term")
+            for term in args.search_terms:
+                added = plan_crawl(queue, term, args.location, args.max_results,
+                                   args.lease_size, args.page_size)
+                print(f"✓ {term}: {added} leases")
+        elif args.command == 'work':
+            workers = [CrawlWorker(LeaseQueue(args.queue, args.lease_seconds), args.output_dir,
+                                   requests_per_second=args.rate)
+                       for _ in range(args.workers)]
+            threads = [threading.Thread(target=worker.run) for worker in workers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            print(f"✓ {sum(w.leases_done for w in workers)} leases, "
+                  f"{sum(w.records_written for w in workers)} records")
+        elif args.command == 'status':
+            print(json.dumps(queue.progress(), indent=2))
+        else:
+            output_file = args.output or 'gelbeseiten_merged.csv'
+            stats = merge_leases(queue, output_file)
+            print(f"✓ {stats['merged_unique']} businesses ({stats['duplicates_removed']} duplicates "
+                  f"removed): {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Dead-letter queue for failed page positions of the Gelbe Seiten Scraper
+A page that cannot be fetched no longer stalls or ends the crawl: its position
+goes into a persistent queue, the crawl moves on, and a background retrier
+fetches it again with its own, much slower backoff. A final reconciliation pass
+works off what is still queued and reports the position ranges that stay missing.
+
+Usage (pending and lost pages of earlier crawls):
+    python3 gelbeseiten_deadletter.py --queue gelbeseiten_deadletters.sqlite
+"""
+
+import argparse
+import json
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PENDING, RECOVERED, LOST = 'pending', 'recovered', 'lost'
+
+
+class DeadLetterQueue:
+    """
+    Failed page positions per crawl scope (SQLite, WAL)
+
+    Each entry remembers the page size it was requested with, the attempts
+    made and when the next one is due. Retries back off exponentially from
+    `backoff_base` up to `max_backoff` seconds; after `max_attempts` failed
+    retries a page is lost.
+
+    Args:
+        filename: SQLite file
+        max_attempts: Retries before a page counts as permanently missing
+        backoff_base: Seconds before the first retry
+        max_backoff: Longest wait between two retries
+    """
+
+    def __init__(self, filename: str = "gelbeseiten_deadletters.sqlite", max_attempts: int = 5,
+                 backoff_base: float = 10.0, max_backoff: float = 600.0):
+        self.filename = str(filename)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                scope TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                anzahl INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                error TEXT NOT NULL,
+                first_failed REAL NOT NULL,
+                next_attempt REAL NOT NULL,
+                PRIMARY KEY (scope, position)
+            )
+        ''')
+        self._conn.commit()
+
+    def backoff_delay(self, attempts: int) -> float:
+        """Seconds before retry number `attempts` + 1 (with up to 10% jitter)"""
+        delay = min(self.max_backoff, self.backoff_base * (2 ** max(0, attempts - 1)))
+        return delay * (1 + random.random() * 0.1)
+
+    def push(self, scope: str, position: int, anzahl: int, error: str = ''):
+        """Queue a failed page; a page queued before starts over as pending"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO dead_letters VALUES (?, ?, ?, ?, 0, ?, ?, ?) '
+                'ON CONFLICT (scope, position) DO UPDATE SET anzahl = excluded.anzahl, '
+                'status = excluded.status, attempts = 0, error = excluded.error, '
+                'next_attempt = excluded.next_attempt',
+                (scope, position, anzahl, PENDING, error, now, now + self.backoff_delay(1))
+            )
+        logger.warning(f"Position {position} of '{scope}' moved to the dead-letter queue ({error})")
+
+    def due(self, scope: str, now: float = None, limit: int = 10) -> List[Tuple[int, int]]:
+        """(position, anzahl) of pending pages whose next retry is due"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT position, anzahl FROM dead_letters '
+                'WHERE scope = ? AND status = ? AND next_attempt <= ? ORDER BY next_attempt LIMIT ?',
+                (scope, PENDING, time.time() if now is None else now, limit)
+            ).fetchall()
+
+    def next_due(self, scope: str) -> Optional[float]:
+        """Time of the earliest scheduled retry, None if nothing is pending"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT MIN(next_attempt) FROM dead_letters WHERE scope = ? AND status = ?',
+                (scope, PENDING)
+            ).fetchone()[0]
+
+    def pending(self, scope: str) -> List[Tuple[int, int]]:
+        """(position, anzahl) of every pending page, due or not"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT position, anzahl FROM dead_letters WHERE scope = ? AND status = ? '
+                'ORDER BY position', (scope, PENDING)
+            ).fetchall()
+
+    def recovered(self, scope: str, position: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE dead_letters SET status = ?, attempts = attempts + 1, error = ? '
+                'WHERE scope = ? AND position = ?', (RECOVERED, '', scope, position)
+            )
+        logger.info(f"Recovered position {position} of '{scope}' from the dead-letter queue")
+
+    def resolve(self, scope: str, position: int):
+        """The crawl itself fetched a queued position: it is no longer missing"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE dead_letters SET status = ?, error = ? '
+                'WHERE scope = ? AND position = ? AND status != ?',
+                (RECOVERED, '', scope, position, RECOVERED)
+            )
+
+    def clear(self, scope: str):
+        """Forget every entry of a scope (a fresh crawl starts with an empty queue)"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM dead_letters WHERE scope = ?', (scope,))
+
+    def failed(self, scope: str, position: int, error: str = '', final: bool = False) -> str:
+        """
+        Record a failed retry
+
+        Args:
+            final: Give up now instead of scheduling another retry
+
+        Returns:
+            The new status (PENDING or LOST)
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT attempts FROM dead_letters WHERE scope = ? AND position = ?', (scope, position)
+            ).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            status = LOST if final or attempts >= self.max_attempts else PENDING
+            self._conn.execute(
+                'UPDATE dead_letters SET status = ?, attempts = ?, error = ?, next_attempt = ? '
+                'WHERE scope = ? AND position = ?',
+                (status, attempts, error, time.time() + self.backoff_delay(attempts + 1), scope, position)
+            )
+        if status == LOST:
+            logger.error(f"Position {position} of '{scope}' is lost after {attempts} retries ({error})")
+        return status
+
+    def missing_ranges(self, scope: str) -> List[Tuple[int, int]]:
+        """Merged [start, end) position ranges of the pages still pending or lost"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT position, anzahl FROM dead_letters WHERE scope = ? AND status IN (?, ?) '
+                'ORDER BY position', (scope, PENDING, LOST)
+            ).fetchall()
+        ranges = []
+        for position, anzahl in rows:
+            if ranges and position <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], position + anzahl))
+            else:
+                ranges.append((position, position + anzahl))
+        return ranges
+
+    def stats(self, scope: str = None) -> Dict[str, int]:
+        """Entries per status (of one scope or all)"""
+        query = 'SELECT status, COUNT(*) FROM dead_letters'
+        params = ()
+        if scope is not None:
+            query += ' WHERE scope = ?'
+            params = (scope,)
+        with self._lock:
+            counts = dict(self._conn.execute(query + ' GROUP BY status', params).fetchall())
+        return {status: counts.get(status, 0) for status in (PENDING, RECOVERED, LOST)}
+
+    def scopes(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                'SELECT DISTINCT scope FROM dead_letters ORDER BY scope')]
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DeadLetterRetrier:
+    """
+    Background thread retrying the due pages of one crawl scope
+
+    Recovered pages are handed back through collect(), so the crawl loop
+    stays the only writer of its sink. reconcile() stops the thread and
+    makes the final pass.
+
+    The retrier shares the crawl's RateLimiter through `fetch`, so retries
+    count against the same request budget.
+
+    Args:
+        dead_letters: DeadLetterQueue to work off
+        fetch: fetch(position, anzahl) -> parsed records, None if the page failed again
+        scope: Crawl scope of the entries
+        poll_interval: Seconds between two looks for due pages
+    """
+
+    def __init__(self, dead_letters: DeadLetterQueue,
+                 fetch: Callable[[int, int], Optional[List[Dict[str, str]]]],
+                 scope: str, poll_interval: float = 1.0):
+        self.dead_letters = dead_letters
+        self.fetch = fetch
+        self.scope = scope
+        self.poll_interval = poll_interval
+        self._recovered: "queue.Queue[Tuple[int, List[Dict[str, str]]]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'DeadLetterRetrier':
+        self._thread = threading.Thread(target=self._run, name="dead-letter-retrier", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            for position, anzahl in self.dead_letters.due(self.scope):
+                if self._stop.is_set():
+                    return
+                self.retry(position, anzahl)
+            self._stop.wait(self.poll_interval)
+
+    def retry(self, position: int, anzahl: int, final: bool = False) -> bool:
+        """One retry of a queued page, True if it was recovered"""
+        try:
+            records = self.fetch(position, anzahl)
+            error = 'fetch failed'
+        except Exception as e:
+            records, error = None, str(e)
+        if records is None:
+            self.dead_letters.failed(self.scope, position, error, final)
+            return False
+        self.dead_letters.recovered(self.scope, position)
+        self._recovered.put((position, records))
+        return True
+
+    def collect(self) -> List[Tuple[int, List[Dict[str, str]]]]:
+        """(position, records) of the pages recovered since the last call"""
+        pages = []
+        while True:
+            try:
+                pages.append(self._recovered.get_nowait())
+            except queue.Empty:
+                return pages
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def reconcile(self, max_wait: float = 900.0) -> List[Tuple[int, int]]:
+        """
+        Final pass once the crawl is through: work off the pending pages on their
+        backoff schedule until each is recovered or lost
+
+        Args:
+            max_wait: Seconds to keep waiting for scheduled retries; then every page
+                still pending gets one last try
+
+        Returns:
+            [start, end) position ranges that are permanently missing
+        """
+        self.stop()
+        deadline = time.monotonic() + max_wait
+        while True:
+            pending = self.dead_letters.pending(self.scope)
+            if not pending:
+                break
+            if time.monotonic() >= deadline:
+                for position, anzahl in pending:
+                    self.retry(position, anzahl, final=True)
+                break
+            due = self.dead_letters.due(self.scope)
+            for position, anzahl in due:
+                self.retry(position, anzahl)
+            if not due:
+                wait = (self.dead_letters.next_due(self.scope) or 0) - time.time()
+                time.sleep(max(0.0, min(wait, deadline - time.monotonic())))
+        missing = self.dead_letters.missing_ranges(self.scope)
+        if missing:
+            logger.error(f"'{self.scope}' is missing positions "
+                         + ', '.join(f"{start}-{end - 1}" for start, end in missing))
+        return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the Gelbe Seiten dead-letter queue")
+    parser.add_argument('--queue', default='gelbeseiten_deadletters.sqlite')
+    parser.add_argument('--scope', help="Search term (term@location with a region)")
+    args = parser.parse_args()
+
+    with DeadLetterQueue(args.queue) as dead_letters:
+        for scope in [args.scope] if args.scope else dead_letters.scopes():
+            print(json.dumps({'scope': scope, **dead_letters.stats(scope),
+                              'missing': dead_letters.missing_ranges(scope)}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
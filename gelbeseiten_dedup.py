@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Record deduplication and entity matching for the Gelbe Seiten Scraper
+Normalizes phone, address and name, finds candidates through hashed blocking keys
+(PLZ + phone, PLZ + name prefix, detail_url) instead of comparing every pair, and
+merges duplicates keeping the richest fields
+
+Usage:
+    python3 gelbeseiten_dedup.py gelbeseiten_steuerberater.csv steuerberater_dedup.csv
+"""
+
+import argparse
+import hashlib
+import logging
+import re
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from gelbeseiten_sinks import open_sink, read_records
+
+logger = logging.getLogger(__name__)
+
+UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+# Legal forms and titles say nothing about which business it is
+NAME_NOISE_RE = re.compile(
+    r'\b(gmbh|mbh|partg|partgmbb|mbb|kg|ohg|gbr|ug|ag|ek|e\.\s?k|co|haftungsbeschraenkt|'
+    r'partnerschaftsgesellschaft|gesellschaft|dr|med|dipl|kfm|kffr|prof|rer|pol|oec|ing)\b\.?'
+)
+NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+STREET_RE = re.compile(r'(strasse|str\b\.?)')
+
+# Longer free-text wins when two records disagree
+LONGER_WINS = ('specialties', 'description', 'address')
+
+
+def normalize_phone(phone: str) -> str:
+    """Digits only, country code folded into the national 0 prefix"""
+    digits = re.sub(r'\D', '', phone or '')
+    if digits.startswith('0049'):
+        digits = '0' + digits[4:]
+    elif digits.startswith('49') and (phone or '').lstrip().startswith('+'):
+        digits = '0' + digits[2:]
+    return digits
+
+
+def normalize_name(name: str) -> str:
+    """Lower case, umlauts folded, legal forms/titles and punctuation removed"""
+    name = (name or '').lower().translate(UMLAUTS).replace('&', ' und ')
+    name = NAME_NOISE_RE.sub(' ', name)
+    return ' '.join(NON_ALNUM_RE.sub(' ', name).split())
+
+
+def normalize_address(address: str) -> str:
+    """'Am Spitzlberg 19 A' and 'am spitzlberg 19a' compare equal, Straße = Str."""
+    address = STREET_RE.sub('str', (address or '').lower().translate(UMLAUTS))
+    return NON_ALNUM_RE.sub('', address)
+
+
+def _block(kind: str, *parts: str) -> bytes:
+    return hashlib.blake2b('\x1f'.join((kind,) + parts).encode('utf-8'), digest_size=8).digest()
+
+
+class _Normalized:
+    __slots__ = ('url', 'plz', 'phone', 'name', 'address')
+
+    def __init__(self, record: Dict[str, str]):
+        self.url = record.get('detail_url') or ''
+        self.plz = (record.get('postal_code') or '').strip()
+        self.phone = normalize_phone(record.get('phone'))
+        self.name = normalize_name(record.get('name'))
+        self.address = normalize_address(record.get('address'))
+
+    def fields(self) -> Tuple[str, ...]:
+        return self.url, self.plz, self.phone, self.name, self.address
+
+    def blocking_keys(self) -> List[bytes]:
+        keys = []
+        if self.url:
+            keys.append(_block('u', self.url))
+        if self.phone:
+            keys.append(_block('p', self.plz, self.phone))
+        if self.name:
+            keys.append(_block('n', self.plz, self.name.replace(' ', '')[:4]))
+        return keys
+
+
+def merge_records(base: Dict[str, str], other: Dict[str, str]) -> Dict[str, str]:
+    """Combine two records of the same business, keeping the richest value of every field"""
+    merged = dict(base)
+    for field, value in other.items():
+        if not value:
+            continue
+        current = merged.get(field) or ''
+        if not current:
+            merged[field] = value
+        elif field == 'review_count':
+            if _as_int(value) > _as_int(current):
+                merged['review_count'] = value
+                merged['rating'] = other.get('rating') or merged.get('rating', '')
+        elif field in LONGER_WINS and len(value) > len(current):
+            merged[field] = value
+    return merged
+
+
+def _as_int(value: str) -> int:
+    digits = re.sub(r'\D', '', value or '')
+    return int(digits) if digits else 0
+
+
+class Deduplicator:
+    """
+    Incremental entity matcher
+
+    Every record is compared only with clusters sharing one of its blocking
+    keys, and with every distinct member of such a cluster. Two records are the same business if they have the same detail_url,
+    the same PLZ and phone number, or the same PLZ, a similar name
+    (SequenceMatcher ratio >= name_threshold) and no conflicting address.
+
+    Streaming: filter() yields each business the first time it is seen; only
+    the normalized keys of every business are kept, not the records.
+    Batch (keep_records=True): add everything, then records() returns the
+    merged clusters.
+
+    Args:
+        name_threshold: Minimum similarity of normalized names
+        keep_records: Keep and merge full records for records()
+    """
+
+    def __init__(self, name_threshold: float = 0.88, keep_records: bool = False):
+        self.name_threshold = name_threshold
+        self.keep_records = keep_records
+        self.duplicates = 0
+        self._clusters: List[Dict[str, str]] = []
+        self._normalized: List[List[_Normalized]] = []  # distinct members per cluster
+        self._blocks: Dict[bytes, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._normalized)
+
+    def _matches(self, a: _Normalized, b: _Normalized) -> bool:
+        if a.url and a.url == b.url:
+            return True
+        if a.plz and b.plz and a.plz != b.plz:
+            return False
+        if a.phone and a.phone == b.phone:
+            return True
+        if not a.name or not b.name:
+            return False
+        if a.address and b.address and a.address != b.address:
+            return False
+        return SequenceMatcher(None, a.name, b.name).ratio() >= self.name_threshold
+
+    def _find(self, norm: _Normalized, keys: List[bytes]) -> Optional[int]:
+        checked = set()
+        for key in keys:
+            for cluster_id in self._blocks.get(key, ()):
+                if cluster_id in checked:
+                    continue
+                checked.add(cluster_id)
+                if any(self._matches(norm, member) for member in self._normalized[cluster_id]):
+                    return cluster_id
+        return None
+
+    def add(self, record: Dict[str, str]) -> Tuple[int, bool]:
+        """
+        Match a record against everything seen so far
+
+        Returns:
+            (cluster id, True if it is a new business)
+        """
+        norm = _Normalized(record)
+        keys = norm.blocking_keys()
+        cluster_id = self._find(norm, keys)
+        is_new = cluster_id is None
+
+        if is_new:
+            cluster_id = len(self._normalized)
+            self._normalized.append([norm])
+            if self.keep_records:
+                self._clusters.append(dict(record))
+        else:
+            self.duplicates += 1
+            # Its phone, URL and name must match later records too, not just its keys
+            members = self._normalized[cluster_id]
+            if all(member.fields() != norm.fields() for member in members):
+                members.append(norm)
+            if self.keep_records:
+                self._clusters[cluster_id] = merge_records(self._clusters[cluster_id], record)
+
+        # A duplicate can bring new keys (e.g. a phone the first record lacked)
+        for key in keys:
+            members = self._blocks.setdefault(key, [])
+            if cluster_id not in members:
+                members.append(cluster_id)
+        return cluster_id, is_new
+
+    def is_new(self, record: Dict[str, str]) -> bool:
+        return self.add(record)[1]
+
+    def filter(self, records: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """Streaming pass: yield only records of businesses not seen before"""
+        for record in records:
+            if self.is_new(record):
+                yield record
+
+    def records(self) -> List[Dict[str, str]]:
+        """Merged record of every business, in first-seen order"""
+        if not self.keep_records:
+            raise RuntimeError("records() needs Deduplicator(keep_records=True)")
+        return list(self._clusters)
+
+
+def dedup_file(input_file: str, output_file: str, name_threshold: float = 0.88) -> Dict[str, int]:
+    """Batch pass over an existing export: write one merged record per business"""
+    dedup = Deduplicator(name_threshold, keep_records=True)
+    count = 0
+    for record in read_records(input_file):
+        dedup.add(record)
+        count += 1
+    with open_sink(output_file) as sink:
+        sink.write_many(dedup.records())
+    logger.info(f"{count} records -> {len(dedup)} businesses ({dedup.duplicates} duplicates merged)")
+    return {'records': count, 'unique': len(dedup), 'duplicates': dedup.duplicates}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate a Gelbe Seiten export")
+    parser.add_argument('input', help="Export to deduplicate (.csv or .jsonl)")
+    parser.add_argument('output', help="Deduplicated output (.csv, .jsonl, .parquet)")
+    parser.add_argument('--name-threshold', type=float, default=0.88,
+                        help="Minimum name similarity (0-1) for records without shared phone/URL")
+    args = parser.parse_args()
+
+    stats = dedup_file(args.input, args.output, args.name_threshold)
+    print(f"✓ {stats['records']} records, {stats['unique']} businesses, "
+          f"{stats['duplicates']} duplicates merged: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Detail-page enrichment for the Gelbe Seiten Scraper
+Follows every record's detail_url (/gsbiz/...) to add opening hours, fax and the
+email/website/phone the result list does not show. Detail pages are fetched
+concurrently under their own rate budget and cached per detail_url in SQLite
+
+Usage:
+    python3 gelbeseiten_enrich.py gelbeseiten_steuerberater.csv steuerberater_enriched.csv --rate 2
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+from gelbeseiten_ratelimit import THROTTLE_STATUS_CODES, RateLimiter
+from gelbeseiten_identity import USER_AGENT
+from gelbeseiten_sinks import FIELDNAMES, open_sink, read_records
+from gelbeseiten_transport import tune_session
+
+logger = logging.getLogger(__name__)
+
+# Fields only the detail page has
+DETAIL_FIELDNAMES = ['opening_hours', 'fax']
+ENRICHED_FIELDNAMES = FIELDNAMES + DETAIL_FIELDNAMES
+
+# Contact fields the detail page may fill in when the result list left them empty
+CONTACT_FIELDS = ['email', 'website', 'phone']
+
+# Detail pages that no longer exist are cached too, so re-runs skip them
+GONE_STATUS_CODES = (404, 410)
+
+
+def _schema_type(item: Dict) -> List[str]:
+    types = item.get('@type', [])
+    return types if isinstance(types, list) else [types]
+
+
+def _json_ld_items(soup) -> Iterator[Dict]:
+    """schema.org objects from <script type="application/ld+json"> blocks"""
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string or '')
+        except ValueError:
+            continue
+        stack = data if isinstance(data, list) else [data]
+        while stack:
+            item = stack.pop(0)
+            if isinstance(item, dict):
+                yield item
+                stack.extend(item.get('@graph', []))
+
+
+def _opening_hours_from_spec(specs) -> str:
+    """'Monday 08:00-17:00; ...' from schema.org openingHoursSpecification"""
+    hours = []
+    for spec in specs if isinstance(specs, list) else [specs]:
+        if not isinstance(spec, dict):
+            continue
+        days = spec.get('dayOfWeek', [])
+        days = days if isinstance(days, list) else [days]
+        days = ','.join(day.rstrip('/').rsplit('/', 1)[-1] for day in days)
+        hours.append(f"{days} {spec.get('opens', '')}-{spec.get('closes', '')}".strip())
+    return '; '.join(hours)
+
+
+def _itemprop(soup, name: str) -> str:
+    element = soup.find(attrs={'itemprop': name})
+    if not element:
+        return ''
+    value = element.get('content') or element.get('href') or element.get_text(' ', strip=True)
+    return value.replace('mailto:', '').replace('tel:', '').strip()
+
+
+def _is_external(url: str) -> bool:
+    host = urlparse(url).netloc
+    return bool(host) and 'gelbeseiten.de' not in host
+
+
+def parse_detail_html(html: str) -> Dict[str, str]:
+    """
+    Extract the extra fields of a /gsbiz/ detail page
+
+    Looks at schema.org JSON-LD first, then microdata, then the page's
+    mailto link and opening hours table.
+
+    Args:
+        html: Detail page HTML
+
+    Returns:
+        Dictionary with opening_hours, fax, email, website and phone (empty if missing)
+    """
+    details = {field: '' for field in DETAIL_FIELDNAMES + CONTACT_FIELDS}
+    if not html:
+        return details
+    soup = BeautifulSoup(html, 'html.parser')
+
+    for item in _json_ld_items(soup):
+        if not ({'LocalBusiness', 'Organization', 'ProfessionalService', 'AccountingService'}
+                & set(_schema_type(item))) and 'telephone' not in item:
+            continue
+        details['email'] = details['email'] or str(item.get('email', '')).replace('mailto:', '')
+        details['phone'] = details['phone'] or str(item.get('telephone', ''))
+        details['fax'] = details['fax'] or str(item.get('faxNumber', ''))
+        url = str(item.get('url', ''))
+        if _is_external(url):
+            details['website'] = details['website'] or url
+        if not details['opening_hours']:
+            if item.get('openingHoursSpecification'):
+                details['opening_hours'] = _opening_hours_from_spec(item['openingHoursSpecification'])
+            elif item.get('openingHours'):
+                hours = item['openingHours']
+                details['opening_hours'] = '; '.join(hours) if isinstance(hours, list) else str(hours)
+
+    # Microdata
+    details['email'] = details['email'] or _itemprop(soup, 'email')
+    details['phone'] = details['phone'] or _itemprop(soup, 'telephone')
+    details['fax'] = details['fax'] or _itemprop(soup, 'faxNumber')
+    if not details['opening_hours']:
+        details['opening_hours'] = '; '.join(
+            element.get('content') or element.get_text(' ', strip=True)
+            for element in soup.find_all(attrs={'itemprop': 'openingHours'})
+        )
+    if not details['website']:
+        url = _itemprop(soup, 'url')
+        if _is_external(url):
+            details['website'] = url
+
+    # Plain markup
+    if not details['email']:
+        mailto = soup.select_one('a[href^="mailto:"]')
+        if mailto:
+            details['email'] = mailto['href'][len('mailto:'):].split('?', 1)[0]
+    if not details['opening_hours']:
+        box = soup.select_one('[id*="oeffnungszeiten"], [class*="Oeffnungszeiten"]')
+        if box:
+            rows = [' '.join(cell.get_text(' ', strip=True) for cell in row.find_all(['th', 'td']))
+                    for row in box.find_all('tr')]
+            details['opening_hours'] = '; '.join(row for row in rows if row)
+
+    return {field: value.strip() for field, value in details.items()}
+
+
+def merge_details(record: Dict[str, str], details: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """Record with the detail fields added; contact fields are only filled when empty"""
+    merged = dict(record)
+    for field in DETAIL_FIELDNAMES:
+        merged[field] = merged.get(field) or ''
+    if not details:
+        return merged
+    for field in DETAIL_FIELDNAMES:
+        merged[field] = details.get(field) or merged[field]
+    for field in CONTACT_FIELDS:
+        if not merged.get(field) and details.get(field):
+            merged[field] = details[field]
+    return merged
+
+
+class DetailCache:
+    """
+    Extracted detail fields per detail_url (SQLite, WAL)
+
+    Args:
+        filename: SQLite file
+        ttl: Seconds an entry stays fresh (None: forever)
+    """
+
+    def __init__(self, filename: str = "gelbeseiten_details.sqlite", ttl: float = 30 * 24 * 3600):
+        self.filename = str(filename)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS details (
+                detail_url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                fields TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, detail_url: str) -> Optional[Dict[str, str]]:
+        """Cached fields, None if missing or stale ({} for pages that are gone)"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT fields, fetched_at FROM details WHERE detail_url = ?', (detail_url,)
+            ).fetchone()
+        if not row or (self.ttl is not None and time.time() - row[1] > self.ttl):
+            return None
+        return json.loads(row[0])
+
+    def put(self, detail_url: str, status: int, fields: Dict[str, str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO details VALUES (?, ?, ?, ?)',
+                (detail_url, status, json.dumps(fields, ensure_ascii=False), time.time())
+            )
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DetailEnricher:
+    """
+    Fetch detail pages concurrently and merge their fields into the records
+
+    Uses its own session and RateLimiter, so the detail budget is independent
+    of the result-list crawl. Records keep their order.
+
+    Args:
+        cache: DetailCache (None: fetch every page)
+        rate_limiter: Rate budget for detail pages (default: 1 request/second)
+        concurrency: Detail pages in flight
+        session: requests session to reuse (e.g. a scraper's, for its cookies and headers)
+    """
+
+    def __init__(self, cache: DetailCache = None, rate_limiter: RateLimiter = None,
+                 concurrency: int = 4, session: requests.Session = None):
+        self.cache = cache
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.concurrency = concurrency
+        self.session = session or requests.Session()
+        if session is None:
+            self.session.headers['User-Agent'] = USER_AGENT
+        tune_session(self.session, pool_size=concurrency)
+        self.fetched = 0
+        self.cached = 0
+
+    def _get(self, detail_url: str) -> Tuple[Optional[int], str]:
+        """One rate-limited GET: (status, html), status None on network errors"""
+        self.rate_limiter.acquire()
+        started = time.monotonic()
+        try:
+            response = self.session.get(detail_url, timeout=30)
+        except Exception as e:
+            self.rate_limiter.record_response(None, time.monotonic() - started)
+            logger.error(f"Error fetching detail page {detail_url}: {e}")
+            return None, ''
+        self.rate_limiter.record_response(
+            response.status_code, time.monotonic() - started, response.headers.get('Retry-After')
+        )
+        return response.status_code, response.text
+
+    def fetch_details(self, detail_url: str) -> Optional[Dict[str, str]]:
+        """
+        Detail fields of one business, from the cache or the network
+
+        Returns:
+            Extracted fields, {} for pages that are gone, None if all attempts failed
+        """
+        if self.cache:
+            cached = self.cache.get(detail_url)
+            if cached is not None:
+                self.cached += 1
+                return cached
+
+        max_retries = self.rate_limiter.max_retries
+        for attempt in range(1, max_retries + 1):
+            status, html = self._get(detail_url)
+            if status == 200:
+                details = parse_detail_html(html)
+            elif status in GONE_STATUS_CODES:
+                details = {}
+            else:
+                logger.warning(f"Detail page {detail_url} failed with status {status} "
+                               f"(attempt {attempt}/{max_retries})")
+                if status is not None and status not in THROTTLE_STATUS_CODES and status < 500:
+                    return None
+                if attempt < max_retries:
+                    time.sleep(self.rate_limiter.backoff_delay(attempt))
+                continue
+
+            self.fetched += 1
+            if self.cache:
+                self.cache.put(detail_url, status, details)
+            return details
+        return None
+
+    def enrich(self, records: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """
+        Yield every record merged with its detail fields, in input order
+
+        At most concurrency * 4 records are buffered, so this streams.
+        """
+        window = self.concurrency * 4
+        pending = deque()  # (record, future or None)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for record in records:
+                url = record.get('detail_url')
+                pending.append((record, executor.submit(self.fetch_details, url) if url else None))
+                while len(pending) >= window:
+                    yield self._merge(*pending.popleft())
+            while pending:
+                yield self._merge(*pending.popleft())
+        logger.info(f"Enrichment done: {self.fetched} detail pages fetched, {self.cached} from cache")
+
+    @staticmethod
+    def _merge(record: Dict[str, str], future) -> Dict[str, str]:
+        return merge_details(record, future.result() if future else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add detail-page fields to a Gelbe Seiten export")
+    parser.add_argument('input', help="Export to enrich (.csv or .jsonl)")
+    parser.add_argument('output', help="Enriched output (.csv, .jsonl, .parquet)")
+    parser.add_argument('--rate', type=float, default=1.0, help="Detail pages per second")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--cache', default='gelbeseiten_details.sqlite', help="Detail cache file")
+    parser.add_argument('--ttl-days', type=float, default=30, help="Refetch entries older than this")
+    args = parser.parse_args()
+
+    with DetailCache(args.cache, ttl=args.ttl_days * 24 * 3600) as cache, \
+            open_sink(args.output, fieldnames=ENRICHED_FIELDNAMES) as sink:
+        enricher = DetailEnricher(cache, RateLimiter(rate=args.rate), args.concurrency)
+        for record in enricher.enrich(read_records(args.input)):
+            sink.write(record)
+    print(f"✓ {sink.written} records enriched: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
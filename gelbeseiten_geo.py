@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Offline geo index over Gelbe Seiten results
+Loads an export (CSV, JSONL, Parquet or a RecordStore SQLite file), geocodes the
+postal codes against an offline PLZ centroid table and answers radius, PLZ and
+top-rated queries from NumPy arrays, a coarse lat/lon grid and inverted indexes
+on city and specialties - no linear scan over the records per query.
+
+The bundled gelbeseiten_plz.csv holds the centroids of the two-digit postal
+regions (Leitregionen), so distances are region-accurate only: neighbouring
+centroids lie about 35 km apart, and radius queries below that spacing are
+rejected. Pass a finer table with the same columns (plz,lat,lon[,name]), e.g.
+five-digit centroids from OpenGeoDB, via --plz-table; every postal code uses its
+longest known prefix.
+
+Usage:
+    python3 gelbeseiten_geo.py gelbeseiten_steuerberater.csv near 20354 --radius 50 --specialty steuerberat
+    python3 gelbeseiten_geo.py gelbeseiten_steuerberater.parquet top 8 --limit 10
+    python3 gelbeseiten_geo.py gelbeseiten.sqlite report --digits 2
+"""
+
+import argparse
+import bisect
+import csv
+import json
+import logging
+import math
+import re
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional for coverage_stats, required by GeoIndex
+    np = None
+
+from gelbeseiten_sinks import FIELDNAMES, parse_count, parse_rating, read_records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLZ_TABLE = Path(__file__).with_name('gelbeseiten_plz.csv')
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Fields export_to_csv and region_report count as "found"
+COVERAGE_FIELDS = ('email', 'website', 'logo_url')
+
+_TOKEN_RE = re.compile(r'[^\W\d_]{3,}')
+
+
+def load_plz_table(filename: Union[str, Path] = None) -> Dict[str, Tuple[float, float, str]]:
+    """
+    PLZ centroid table: postal code (prefix) -> (lat, lon, name)
+
+    Args:
+        filename: CSV with plz,lat,lon and optionally name (default: bundled Leitregionen)
+    """
+    table = {}
+    with open(filename or DEFAULT_PLZ_TABLE, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            table[row['plz'].strip()] = (float(row['lat']), float(row['lon']), row.get('name') or '')
+    return table
+
+
+def geocode(postal_code: str, table: Dict[str, Tuple[float, float, str]]) -> Optional[Tuple[float, float]]:
+    """(lat, lon) of the longest prefix of `postal_code` in the table, None if unknown"""
+    plz = (postal_code or '').strip()
+    for length in range(min(len(plz), 5), 1, -1):
+        hit = table.get(plz[:length])
+        if hit:
+            return hit[0], hit[1]
+    return None
+
+
+def haversine_km(lat, lon, lat0: float, lon0: float):
+    """Great-circle distance in km from (lat0, lon0); lat/lon may be NumPy arrays"""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lat0, lon0 = math.radians(lat0), math.radians(lon0)
+    a = (np.sin((lat - lat0) / 2) ** 2
+         + np.cos(lat) * math.cos(lat0) * np.sin((lon - lon0) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def table_resolution_km(table: Dict[str, Tuple[float, float, str]], sample: int = 500) -> float:
+    """
+    Typical spacing of the table's centroids: median distance to the nearest
+    other centroid (over at most `sample` centroids), rounded up to whole km
+
+    Records sharing a centroid are indistinguishable, so radius queries below
+    this spacing return arbitrary results.
+    """
+    points = np.array([(lat, lon) for lat, lon, _ in table.values()], dtype=np.float64).reshape(-1, 2)
+    if len(points) < 2:
+        return 0.0
+    step = max(1, len(points) // sample)
+    nearest = []
+    for i in range(0, len(points), step):
+        distances = haversine_km(points[:, 0], points[:, 1], points[i, 0], points[i, 1])
+        distances[i] = np.inf
+        nearest.append(distances.min())
+    return float(math.ceil(np.median(nearest)))
+
+
+def tokens(text: str) -> List[str]:
+    """Lower-case words of a specialties string ('Steuerberatung: Existenzgründung' -> 2 tokens)"""
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def _column(records: Sequence[Dict[str, str]], field: str) -> list:
+    """One field of all records; a columnar RecordBuffer hands out its column directly"""
+    if hasattr(records, 'column'):
+        return records.column(field)
+    return [record.get(field) or '' for record in records]
+
+
+def coverage_stats(records: Sequence[Dict[str, str]]) -> Dict[str, int]:
+    """
+    Number of records with each of COVERAGE_FIELDS filled, plus 'total'
+
+    Counts whole columns at once with NumPy (plain Python without it).
+    """
+    stats = {'total': len(records)}
+    for field in COVERAGE_FIELDS:
+        column = _column(records, field)
+        if np is not None:
+            stats[field] = int(np.count_nonzero(np.asarray(column, dtype=object).astype(bool)))
+        else:
+            stats[field] = sum(map(bool, column))
+    return stats
+
+
+def load_results(filename: str) -> List[Dict[str, str]]:
+    """
+    Records of an export (.csv, .jsonl, .parquet) or a RecordStore file (.sqlite/.db)
+
+    Removed records of a RecordStore are skipped; missing values become ''.
+    """
+    suffix = Path(filename).suffix.lower()
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(filename)
+        columns = {name: table.column(name).to_pylist() for name in table.column_names}
+        return [{name: ('' if values[i] is None else values[i]) for name, values in columns.items()}
+                for i in range(table.num_rows)]
+    if suffix in ('.sqlite', '.sqlite3', '.db'):
+        from gelbeseiten_store import REMOVED
+
+        conn = sqlite3.connect(filename)
+        try:
+            cursor = conn.execute(
+                f'SELECT {", ".join(FIELDNAMES)} FROM records WHERE change != ?', (REMOVED,)
+            )
+            return [{field: value or '' for field, value in zip(FIELDNAMES, row)} for row in cursor]
+        finally:
+            conn.close()
+    return list(read_records(filename))
+
+
+class GeoIndex:
+    """
+    In-memory query index over scraped records (requires numpy)
+
+    Coordinates, ratings and review counts live in NumPy arrays; a grid of
+    `cell_km` cells narrows radius queries to nearby records before the exact
+    haversine distance is computed. City and specialty words map to sorted
+    index arrays, postal codes are kept sorted for prefix ranges.
+    `resolution_km` is the spacing of the table's centroids, the smallest
+    radius within() accepts.
+
+    Args:
+        records: Records to index (dicts, Records or a RecordBuffer)
+        plz_table: Table from load_plz_table() (default: bundled Leitregionen)
+        cell_km: Edge length of the grid cells
+    """
+
+    def __init__(self, records: Iterable[Dict[str, str]],
+                 plz_table: Dict[str, Tuple[float, float, str]] = None, cell_km: float = 10.0):
+        if np is None:
+            raise ImportError("GeoIndex requires numpy (pip install numpy)")
+        self.records = records if isinstance(records, Sequence) else list(records)
+        self.plz_table = plz_table if plz_table is not None else load_plz_table()
+        self.cell_deg = cell_km / 111.0
+        self.resolution_km = table_resolution_km(self.plz_table)
+
+        postal_codes = [(value or '').strip() for value in _column(self.records, 'postal_code')]
+        self.postal_codes = np.array(postal_codes, dtype=str)
+        coordinates = {plz: geocode(plz, self.plz_table) for plz in set(postal_codes)}
+        points = [coordinates[plz] or (math.nan, math.nan) for plz in postal_codes]
+        points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        self.lat, self.lon = points[:, 0], points[:, 1]
+        self.located = ~np.isnan(self.lat)
+
+        self.rating = np.array([self._number(v, parse_rating) for v in _column(self.records, 'rating')],
+                               dtype=np.float64)
+        self.review_count = np.array(
+            [self._number(v, parse_count) for v in _column(self.records, 'review_count')],
+            dtype=np.float64
+        )
+        self.review_count = np.nan_to_num(self.review_count)
+
+        self._plz_order = np.argsort(self.postal_codes, kind='stable')
+        self._plz_sorted = self.postal_codes[self._plz_order]
+
+        self._grid = self._build_grid()
+        self._cities = self._inverted(_column(self.records, 'city'), lambda city: [city.strip().lower()])
+        self._specialties = self._inverted(_column(self.records, 'specialties'), tokens)
+        self._specialty_words = sorted(self._specialties)
+
+        logger.info(f"Indexed {len(self.records)} records, {int(self.located.sum())} geocoded")
+
+    @staticmethod
+    def _number(value, parse) -> float:
+        if isinstance(value, (int, float)):
+            return float(value)
+        number = parse(value or '')
+        return math.nan if number is None else float(number)
+
+    def _cell(self, lat, lon):
+        return np.floor(lat / self.cell_deg).astype(np.int64), np.floor(lon / self.cell_deg).astype(np.int64)
+
+    def _build_grid(self) -> Dict[Tuple[int, int], np.ndarray]:
+        located = np.flatnonzero(self.located)
+        rows, cols = self._cell(self.lat[located], self.lon[located])
+        grid = defaultdict(list)
+        for index, row, col in zip(located.tolist(), rows.tolist(), cols.tolist()):
+            grid[(row, col)].append(index)
+        return {cell: np.array(indices, dtype=np.int64) for cell, indices in grid.items()}
+
+    @staticmethod
+    def _inverted(values: list, keys) -> Dict[str, np.ndarray]:
+        index = defaultdict(list)
+        for i, value in enumerate(values):
+            for key in set(keys(value or '')):
+                if key:
+                    index[key].append(i)
+        return {key: np.array(indices, dtype=np.int64) for key, indices in index.items()}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def locate(self, where: Union[str, Tuple[float, float]]) -> Tuple[float, float]:
+        """(lat, lon) of a postal code or a (lat, lon) pair; ValueError for unknown codes"""
+        if isinstance(where, tuple):
+            return where
+        point = geocode(str(where), self.plz_table)
+        if point is None:
+            raise ValueError(f"No coordinates for postal code {where!r}")
+        return point
+
+    def with_city(self, city: str) -> np.ndarray:
+        """Indices of the records in a city (case-insensitive exact match)"""
+        return self._cities.get(city.strip().lower(), np.empty(0, dtype=np.int64))
+
+    def with_specialty(self, word: str) -> np.ndarray:
+        """Indices of the records with a specialty word starting with `word` ('steuerberat')"""
+        word = word.strip().lower()
+        start = bisect.bisect_left(self._specialty_words, word)
+        matches = []
+        for key in self._specialty_words[start:]:
+            if not key.startswith(word):
+                break
+            matches.append(self._specialties[key])
+        if not matches:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(matches))
+
+    def with_postal_prefix(self, prefix: str) -> np.ndarray:
+        """Indices of the records whose postal code starts with `prefix` ('8' for 8xxxx)"""
+        lo = np.searchsorted(self._plz_sorted, prefix, side='left')
+        hi = np.searchsorted(self._plz_sorted, prefix + '\uffff', side='left')
+        return np.sort(self._plz_order[lo:hi])
+
+    def _filter(self, candidates: np.ndarray, city: str = None, specialty: str = None) -> np.ndarray:
+        if city:
+            candidates = np.intersect1d(candidates, self.with_city(city), assume_unique=True)
+        if specialty:
+            candidates = np.intersect1d(candidates, self.with_specialty(specialty), assume_unique=True)
+        return candidates
+
+    def within(self, where: Union[str, Tuple[float, float]], radius_km: float,
+               specialty: str = None, city: str = None,
+               limit: int = None) -> List[Tuple[Dict[str, str], float]]:
+        """
+        Records within `radius_km` of a postal code or (lat, lon), nearest first
+
+        Args:
+            where: Postal code ('20354') or (lat, lon)
+            radius_km: Search radius, at least `resolution_km` (ValueError below)
+            specialty: Only records with a matching specialty word
+            city: Only records in this city
+            limit: At most this many results
+
+        Returns:
+            [(record, distance in km), ...]
+        """
+        if radius_km < self.resolution_km:
+            raise ValueError(f"radius_km={radius_km} is below the {self.resolution_km:.0f} km resolution "
+                             "of the PLZ table; pass a finer table (five-digit centroids)")
+        lat0, lon0 = self.locate(where)
+        d_lat = radius_km / 111.0
+        d_lon = radius_km / (111.0 * max(math.cos(math.radians(min(abs(lat0) + d_lat, 89.0))), 1e-6))
+        (row_lo, row_hi), (col_lo, col_hi) = (
+            self._cell(np.array([lat0 - d_lat, lat0 + d_lat]), np.array([lon0 - d_lon, lon0 + d_lon]))
+        )
+        cells = [self._grid[(row, col)]
+                 for row in range(int(row_lo), int(row_hi) + 1)
+                 for col in range(int(col_lo), int(col_hi) + 1)
+                 if (row, col) in self._grid]
+        if not cells:
+            return []
+        candidates = self._filter(np.sort(np.concatenate(cells)), city, specialty)
+        distances = haversine_km(self.lat[candidates], self.lon[candidates], lat0, lon0)
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')[:limit]
+        return [(self.records[i], float(distances[j])) for j, i in zip(order.tolist(), candidates[order].tolist())]
+
+    def top_rated(self, postal_prefix: str = '', specialty: str = None, city: str = None,
+                  limit: int = 10, min_reviews: int = 0) -> List[Dict[str, str]]:
+        """
+        Best-rated records of a postal region, by rating then review count
+
+        Args:
+            postal_prefix: Postal code prefix ('8' for 8xxxx, '' for all)
+            specialty: Only records with a matching specialty word
+            city: Only records in this city
+            limit: At most this many results
+            min_reviews: Ignore ratings with fewer reviews
+        """
+        candidates = self._filter(self.with_postal_prefix(postal_prefix), city, specialty)
+        rated = ~np.isnan(self.rating[candidates]) & (self.review_count[candidates] >= min_reviews)
+        candidates = candidates[rated]
+        order = np.lexsort((-self.review_count[candidates], -self.rating[candidates]))[:limit]
+        return [self.records[i] for i in candidates[order].tolist()]
+
+    def region_report(self, digits: int = 2) -> List[Dict]:
+        """
+        Aggregates per postal region (first `digits` digits), computed column-wise
+
+        Returns:
+            One dict per region: region, name, entries, email, website, logo_url,
+            rated, avg_rating, reviews - sorted by region
+        """
+        regions, inverse = np.unique(self.postal_codes.astype(f'<U{digits}'), return_inverse=True)
+        size = len(regions)
+        entries = np.bincount(inverse, minlength=size)
+        found = {
+            field: np.bincount(inverse, weights=np.asarray(_column(self.records, field), dtype=object)
+                               .astype(bool), minlength=size)
+            for field in COVERAGE_FIELDS
+        }
+        rated = ~np.isnan(self.rating)
+        rated_count = np.bincount(inverse, weights=rated, minlength=size)
+        rating_sum = np.bincount(inverse, weights=np.where(rated, self.rating, 0.0), minlength=size)
+        reviews = np.bincount(inverse, weights=self.review_count, minlength=size)
+
+        report = []
+        for i, region in enumerate(regions.tolist()):
+            report.append({
+                'region': region,
+                'name': self.plz_table.get(region, (0, 0, ''))[2],
+                'entries': int(entries[i]),
+                **{field: int(found[field][i]) for field in COVERAGE_FIELDS},
+                'rated': int(rated_count[i]),
+                'avg_rating': round(float(rating_sum[i] / rated_count[i]), 2) if rated_count[i] else None,
+                'reviews': int(reviews[i]),
+            })
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query Gelbe Seiten results by location")
+    parser.add_argument('input', help="Export (.csv, .jsonl, .parquet) or record store (.sqlite)")
+    parser.add_argument('command', choices=['near', 'top', 'report'])
+    parser.add_argument('where', nargs='?', default='',
+                        help="near: postal code or 'lat,lon'; top: postal code prefix")
+    parser.add_argument('--radius', type=float, default=50.0,
+                        help="near: radius in km; must not be below the PLZ table's centroid "
+                             "spacing (about 35 km for the bundled Leitregionen)")
+    parser.add_argument('--specialty', help="Specialty word (prefix), e.g. steuerberat")
+    parser.add_argument('--city')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--min-reviews', type=int, default=0)
+    parser.add_argument('--digits', type=int, default=2, help="report: postal code digits per region")
+    parser.add_argument('--plz-table', help="CSV plz,lat,lon[,name] (default: bundled Leitregionen)")
+    args = parser.parse_args()
+
+    index = GeoIndex(load_results(args.input), load_plz_table(args.plz_table))
+    if args.command == 'near':
+        if not args.where:
+            parser.error("near needs a postal code or 'lat,lon'")
+        where = args.where
+        if ',' in where:
+            lat, lon = where.split(',', 1)
+            where = (float(lat), float(lon))
+        try:
+            results = index.within(where, args.radius, args.specialty, args.city, args.limit)
+        except ValueError as e:
+            parser.error(str(e))
+        for record, distance in results:
+            print(json.dumps({'distance_km': round(distance, 1), **dict(record)}, ensure_ascii=False))
+    elif args.command == 'top':
+        for record in index.top_rated(args.where, args.specialty, args.city, args.limit, args.min_reviews):
+            print(json.dumps(dict(record), ensure_ascii=False))
+    else:
+        for row in index.region_report(args.digits):
+            print(json.dumps(row, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
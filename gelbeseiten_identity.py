@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Client identity pool for the Gelbe Seiten Scraper
+Several sessions, each with its own cookie jar, browser header profile, optional
+upstream proxy and rate limiter; requests go to identities by health score and
+failing identities are rotated out for a cool-down
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+
+from gelbeseiten_ratelimit import RateLimiter
+from gelbeseiten_transport import tune_session
+
+logger = logging.getLogger(__name__)
+
+# Browser header profiles; Origin/Referer are added per base URL (see browser_headers)
+HEADER_PROFILES: Dict[str, Dict[str, str]] = {
+    'chrome-macos': {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36',
+        'Accept': '*/*',
+        'Accept-Language': 'de-DE,de;q=0.9,en-US;q=0.8,en;q=0.7',
+        'sec-ch-ua': '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
+        'sec-ch-ua-mobile': '?0',
+        'sec-ch-ua-platform': '"macOS"',
+        'sec-fetch-dest': 'empty',
+        'sec-fetch-mode': 'cors',
+        'sec-fetch-site': 'same-origin',
+    },
+    'chrome-windows': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36',
+        'Accept': '*/*',
+        'Accept-Language': 'de-DE,de;q=0.9,en;q=0.8',
+        'sec-ch-ua': '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
+        'sec-ch-ua-mobile': '?0',
+        'sec-ch-ua-platform': '"Windows"',
+        'sec-fetch-dest': 'empty',
+        'sec-fetch-mode': 'cors',
+        'sec-fetch-site': 'same-origin',
+    },
+    'firefox-linux': {
+        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:144.0) Gecko/20100101 Firefox/144.0',
+        'Accept': '*/*',
+        'Accept-Language': 'de,en-US;q=0.7,en;q=0.3',
+        'sec-fetch-dest': 'empty',
+        'sec-fetch-mode': 'cors',
+        'sec-fetch-site': 'same-origin',
+    },
+    'safari-macos': {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/26.0 Safari/605.1.15',
+        'Accept': '*/*',
+        'Accept-Language': 'de-DE,de;q=0.9',
+        'sec-fetch-dest': 'empty',
+        'sec-fetch-mode': 'cors',
+        'sec-fetch-site': 'same-origin',
+    },
+}
+
+# User-Agent of the default profile, for sessions that need no full header set
+USER_AGENT = HEADER_PROFILES['chrome-macos']['User-Agent']
+
+# Responses that count against an identity (blocked, throttled, proxy trouble)
+FAILURE_STATUS_CODES = (403, 407, 429, 502, 503, 504)
+
+
+def browser_headers(profile: str, base_url: str) -> Dict[str, str]:
+    """Header set of a profile for requests to base_url"""
+    return {**HEADER_PROFILES[profile], 'Origin': base_url, 'Referer': f'{base_url}/'}
+
+
+class Identity:
+    """
+    One client identity: session (cookies, headers, proxy) plus its health
+
+    Args:
+        name: Label used in logs and stats
+        profile: Key of HEADER_PROFILES
+        proxy: Upstream proxy URL for http and https (None: direct)
+        rate_limiter: Pacing of this identity (default: RateLimiter())
+        window: Recent outcomes the error rate is computed over
+    """
+
+    def __init__(self, name: str, profile: str = 'chrome-macos', proxy: str = None,
+                 rate_limiter: RateLimiter = None, window: int = 20):
+        self.name = name
+        self.profile = profile
+        self.proxy = proxy
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.requests = 0
+        self.errors = 0
+        self.latency = 0.0  # EWMA of successful responses, seconds
+        self.consecutive_failures = 0
+        self.strikes = 0  # times rotated out
+        self.cooldown_until = 0.0
+        self.warmed = False
+        self._recent = deque(maxlen=window)  # True = failure
+        self.session = None
+        self.lock = threading.Lock()
+        self.reset_session()
+
+    def reset_session(self, base_url: str = None):
+        """Fresh session: empty cookie jar, this identity's headers and proxy"""
+        if self.session is not None:
+            self.session.close()
+        self.session = tune_session(requests.Session(), pool_size=4)
+        self.session.headers.update(HEADER_PROFILES[self.profile])
+        if base_url:
+            self.session.headers.update(browser_headers(self.profile, base_url))
+        if self.proxy:
+            self.session.proxies.update({'http': self.proxy, 'https': self.proxy})
+        self.warmed = False
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self._recent) / len(self._recent) if self._recent else 0.0
+
+    def score(self) -> float:
+        """Health score: high success rate and low latency win (0 while cooling down)"""
+        if time.monotonic() < self.cooldown_until:
+            return 0.0
+        return (1.0 - self.error_rate) / (0.1 + self.latency)
+
+    def record(self, status: Optional[int], latency: float) -> bool:
+        """Track one response; returns True if it counted as a failure"""
+        failed = status is None or status in FAILURE_STATUS_CODES
+        self.requests += 1
+        self._recent.append(failed)
+        if failed:
+            self.errors += 1
+            self.consecutive_failures += 1
+        else:
+            self.consecutive_failures = 0
+            self.latency = latency if self.requests == 1 else 0.8 * self.latency + 0.2 * latency
+        return failed
+
+    def stats(self) -> Dict:
+        return {
+            'name': self.name,
+            'profile': self.profile,
+            'proxy': self.proxy,
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': round(self.error_rate, 3),
+            'latency': round(self.latency, 4),
+            'score': round(self.score(), 3),
+            'strikes': self.strikes,
+            'cooling_down': time.monotonic() < self.cooldown_until,
+            'rate': round(self.rate_limiter.rate, 3),
+        }
+
+
+class IdentityPool:
+    """
+    Spread requests over identities weighted by their health score
+
+    An identity is rotated out after `max_consecutive_failures` failures in a
+    row or once its recent error rate exceeds `max_error_rate`: it cools down
+    for cooldown * 2**strikes seconds and comes back with a fresh session
+    (cookies are fetched again through the warm-up).
+
+    Args:
+        identities: The pool members
+        max_consecutive_failures: Failures in a row that rotate an identity out
+        max_error_rate: Recent error rate that rotates an identity out
+        min_samples: Outcomes needed before the error rate is trusted
+        cooldown: Base cool-down in seconds
+    """
+
+    def __init__(self, identities: Iterable[Identity], max_consecutive_failures: int = 3,
+                 max_error_rate: float = 0.5, min_samples: int = 10, cooldown: float = 60.0):
+        self.identities: List[Identity] = list(identities)
+        if not self.identities:
+            raise ValueError("IdentityPool needs at least one identity")
+        self.max_consecutive_failures = max_consecutive_failures
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.base_url = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_proxies(cls, proxies: Iterable[Optional[str]], profiles: Iterable[str] = None,
+                     rate: float = 1.0, **kwargs) -> 'IdentityPool':
+        """One identity per proxy (None = direct), header profiles assigned round-robin"""
+        profiles = list(profiles or HEADER_PROFILES)
+        identities = [
+            Identity(f"id{i}", profiles[i % len(profiles)], proxy, RateLimiter(rate=rate))
+            for i, proxy in enumerate(proxies)
+        ]
+        return cls(identities, **kwargs)
+
+    def bind(self, base_url: str):
+        """Set Origin/Referer of every identity for the site being crawled"""
+        self.base_url = base_url
+        for identity in self.identities:
+            identity.session.headers.update(browser_headers(identity.profile, base_url))
+
+    def acquire(self, warm_up: Callable[[Identity], bool] = None) -> Identity:
+        """
+        Pick an identity (weighted by score), warming it up first if needed
+
+        Waits when every identity is cooling down and gives up (RuntimeError)
+        when warm-ups keep failing.
+        """
+        failed_warm_ups = 0
+        while True:
+            with self._lock:
+                scores = [(identity.score(), identity) for identity in self.identities]
+                healthy = [(score, identity) for score, identity in scores if score > 0]
+                if not healthy:
+                    wait = min(identity.cooldown_until for identity in self.identities) - time.monotonic()
+                else:
+                    wait = 0
+                    pick = random.uniform(0, sum(score for score, _ in healthy))
+                    for score, identity in healthy:
+                        pick -= score
+                        if pick <= 0:
+                            break
+            if wait > 0:
+                logger.warning(f"All identities cooling down, waiting {wait:.1f}s")
+                time.sleep(wait)
+                continue
+
+            if warm_up and not identity.warmed:
+                with identity.lock:
+                    if not identity.warmed:
+                        identity.warmed = warm_up(identity)
+                if not identity.warmed:
+                    self.release(identity, None, 0.0)
+                    failed_warm_ups += 1
+                    if failed_warm_ups >= len(self.identities) * self.max_consecutive_failures:
+                        raise RuntimeError("No identity could be warmed up")
+                    continue
+            return identity
+
+    def release(self, identity: Identity, status: Optional[int], latency: float):
+        """Record the outcome of a request made with `identity`"""
+        with self._lock:
+            identity.record(status, latency)
+            rotate = (identity.consecutive_failures >= self.max_consecutive_failures or
+                      (len(identity._recent) >= self.min_samples
+                       and identity.error_rate > self.max_error_rate))
+            if rotate:
+                identity.strikes += 1
+                pause = self.cooldown * 2 ** (identity.strikes - 1)
+                identity.cooldown_until = time.monotonic() + pause
+                identity.consecutive_failures = 0
+                identity._recent.clear()
+                identity.reset_session(self.base_url)
+                logger.warning(f"Identity {identity.name} rotated out for {pause:.0f}s "
+                               f"(strike {identity.strikes})")
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [identity.stats() for identity in self.identities]
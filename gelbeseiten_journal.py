@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Crash-safe crawl journal for resumable Gelbe Seiten crawls
+Stores the last committed position, page size and cookies in SQLite (WAL)
+
+Every page goes through two steps: stage_page() before it is written to the
+output, commit_page() once it is on disk. If the crawl dies in between, the
+staged page is the one that may already be in the output, and
+drop_replayed() removes exactly those records when the page is fetched again.
+"""
+
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlJournal:
+    """
+    Persistent state of one crawl, updated in a single transaction per page
+
+    SQLite in WAL mode makes every commit atomic: after a crash the journal
+    holds either the state before or after the last page, never a mix.
+
+    Args:
+        filename: SQLite file holding the journal
+    """
+
+    def __init__(self, filename: str):
+        self.filename = str(filename)
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS crawl (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                search_term TEXT NOT NULL,
+                results_per_page INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                total_scraped INTEGER NOT NULL,
+                cookies TEXT NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0,
+                staged_position INTEGER,
+                staged_urls TEXT,
+                updated_at REAL NOT NULL
+            );
+        ''')
+        self._conn.commit()
+
+    def state(self) -> Optional[Dict]:
+        """Last committed crawl state, None if nothing was journaled yet"""
+        row = self._conn.execute(
+            'SELECT search_term, results_per_page, position, total_scraped, cookies, completed, '
+            'staged_position, staged_urls FROM crawl WHERE id = 1'
+        ).fetchone()
+        if not row:
+            return None
+        return {
+            'search_term': row[0],
+            'results_per_page': row[1],
+            'position': row[2],
+            'total_scraped': row[3],
+            'cookies': json.loads(row[4]),
+            'completed': bool(row[5]),
+            'staged_position': row[6],
+            'staged_urls': json.loads(row[7]) if row[7] else [],
+        }
+
+    def begin(self, search_term: str, results_per_page: int, cookies: Dict[str, str]):
+        """Start a fresh crawl, discarding any previous state"""
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO crawl VALUES (1, ?, ?, 0, 0, ?, 0, NULL, NULL, ?)',
+                (search_term, results_per_page, json.dumps(cookies), time.time())
+            )
+
+    def stage_page(self, position: int, detail_urls: Iterable[str]):
+        """Note the page at `position` is about to be written to the output"""
+        with self._conn:
+            self._conn.execute(
+                'UPDATE crawl SET staged_position = ?, staged_urls = ? WHERE id = 1',
+                (position, json.dumps(list(detail_urls)))
+            )
+
+    def commit_page(self, position: int, total_scraped: int, cookies: Dict[str, str] = None):
+        """
+        Record the staged page as done
+
+        Args:
+            position: Position the next page starts at
+            total_scraped: Results committed so far
+            cookies: Current session cookies (None keeps the stored ones)
+        """
+        with self._conn:
+            if cookies is None:
+                self._conn.execute(
+                    'UPDATE crawl SET position = ?, total_scraped = ?, staged_position = NULL, '
+                    'staged_urls = NULL, updated_at = ? WHERE id = 1',
+                    (position, total_scraped, time.time())
+                )
+            else:
+                self._conn.execute(
+                    'UPDATE crawl SET position = ?, total_scraped = ?, cookies = ?, '
+                    'staged_position = NULL, staged_urls = NULL, updated_at = ? WHERE id = 1',
+                    (position, total_scraped, json.dumps(cookies), time.time())
+                )
+
+    def mark_completed(self):
+        with self._conn:
+            self._conn.execute('UPDATE crawl SET completed = 1, updated_at = ? WHERE id = 1',
+                               (time.time(),))
+
+    def drop_replayed(self, position: int, records: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Drop records of a staged-but-uncommitted page that are already in the output"""
+        state = self.state()
+        if not state or state['staged_position'] != position:
+            return records
+        written = list(state['staged_urls'])
+        kept = []
+        for record in records:
+            if record.get('detail_url') in written:
+                written.remove(record['detail_url'])
+            else:
+                kept.append(record)
+        if len(kept) < len(records):
+            logger.info(f"Skipping {len(records) - len(kept)} results of position {position} "
+                        f"already written before the crash")
+        return kept
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Logo download stage for the Gelbe Seiten Scraper
+Downloads every record's logo_url concurrently under its own rate budget into a
+content-addressed store (one file per distinct image, however many URLs point
+to it), renders thumbnails in a process pool and adds hash and local paths to
+the record. URLs already in the store are not downloaded again.
+
+Usage:
+    python3 gelbeseiten_logos.py gelbeseiten_steuerberater.csv steuerberater_logos.csv --logo-dir logos
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: no thumbnails without it
+    Image = None
+
+from gelbeseiten_ratelimit import THROTTLE_STATUS_CODES, RateLimiter
+from gelbeseiten_sinks import FIELDNAMES, open_sink, read_records
+from gelbeseiten_transport import tune_session
+
+logger = logging.getLogger(__name__)
+
+# Fields the logo stage adds
+LOGO_FIELDNAMES = ['logo_sha256', 'logo_path', 'logo_thumbnail']
+LOGO_EXPORT_FIELDNAMES = FIELDNAMES + LOGO_FIELDNAMES
+
+CONTENT_TYPE_SUFFIXES = {
+    'image/png': '.png', 'image/jpeg': '.jpg', 'image/gif': '.gif',
+    'image/webp': '.webp', 'image/svg+xml': '.svg',
+}
+
+# Logos that no longer exist are remembered too, so re-runs skip them
+GONE_STATUS_CODES = (404, 410)
+
+
+def make_thumbnail(source: str, target: str, size: Tuple[int, int]) -> bool:
+    """Write a PNG thumbnail of `source` fitting into `size` (runs in a worker process)"""
+    try:
+        with Image.open(source) as image:
+            image.thumbnail(size)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=Path(target).parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, format='PNG')
+            os.replace(tmp, target)
+        return True
+    except Exception as e:  # not an image Pillow can read (e.g. SVG)
+        logger.debug(f"No thumbnail for {source}: {e}")
+        return False
+
+
+class LogoStore:
+    """
+    Content-addressed logo files plus an index of every URL seen
+
+    Images live in <directory>/objects/<h[:2]>/<h><suffix> and thumbnails in
+    <directory>/thumbs/<h[:2]>/<h>.png, where h is the SHA-256 of the image
+    bytes; <directory>/index.sqlite maps logo URLs to their hash.
+
+    Args:
+        directory: Store directory (created if missing)
+    """
+
+    def __init__(self, directory: str = "logos"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.directory / "index.sqlite"), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                sha256 TEXT,
+                path TEXT,
+                thumbnail TEXT,
+                fetched_at REAL NOT NULL
+            );
+        ''')
+        self._conn.commit()
+
+    def lookup(self, url: str) -> Optional[Dict[str, str]]:
+        """Stored logo fields of a URL ({} for logos that are gone), None if never fetched"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status, sha256, path, thumbnail FROM urls WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[0] != 200:
+            return {}
+        return {'logo_sha256': row[1], 'logo_path': row[2], 'logo_thumbnail': row[3] or ''}
+
+    def object_path(self, sha256: str, suffix: str) -> Path:
+        return self.directory / "objects" / sha256[:2] / f"{sha256}{suffix}"
+
+    def thumbnail_path(self, sha256: str) -> Path:
+        return self.directory / "thumbs" / sha256[:2] / f"{sha256}.png"
+
+    def store(self, data: bytes, content_type: str = '') -> Tuple[str, Path, bool]:
+        """
+        Write image bytes unless an identical image is stored already
+
+        Returns:
+            (sha256, path, True if the file is new)
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        suffix = CONTENT_TYPE_SUFFIXES.get(content_type.split(';')[0].strip().lower(), '.img')
+        path = self.object_path(sha256, suffix)
+        if path.exists():
+            return sha256, path, False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return sha256, path, True
+
+    def record(self, url: str, status: int, fields: Dict[str, str] = None):
+        fields = fields or {}
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?, ?)',
+                (url, status, fields.get('logo_sha256'), fields.get('logo_path'),
+                 fields.get('logo_thumbnail'), time.time())
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            urls, images = self._conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT sha256) FROM urls'
+            ).fetchone()
+        return {'urls': urls, 'images': images}
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LogoDownloader:
+    """
+    Adds local logo files to records
+
+    Downloads run in a bounded thread pool under their own RateLimiter;
+    thumbnails are rendered in a process pool (skipped without Pillow) and
+    only waited for when their record is yielded, so download threads never
+    block on them. The same URL requested twice in one run is downloaded
+    once. Records keep their order.
+
+    Args:
+        store: LogoStore to write into
+        rate_limiter: Rate budget for logo downloads (default: 2 requests/second)
+        concurrency: Downloads in flight
+        thumbnail_size: Bounding box of thumbnails (None: no thumbnails)
+        thumbnail_workers: Processes rendering thumbnails
+        session: requests session to reuse
+    """
+
+    def __init__(self, store: LogoStore, rate_limiter: RateLimiter = None, concurrency: int = 8,
+                 thumbnail_size: Optional[Tuple[int, int]] = (128, 128), thumbnail_workers: int = 2,
+                 session: requests.Session = None):
+        self.store = store
+        self.rate_limiter = rate_limiter or RateLimiter(rate=2.0)
+        self.concurrency = concurrency
+        self.thumbnail_size = thumbnail_size if Image is not None else None
+        if thumbnail_size and Image is None:
+            logger.warning("Pillow is not installed - logos are stored without thumbnails")
+        self.thumbnail_workers = thumbnail_workers
+        self.session = tune_session(session or requests.Session(), pool_size=concurrency)
+        self.downloaded = 0
+        self.reused = 0
+        self._in_flight: Dict[str, Future] = {}
+        self._thumbnail_jobs: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._thumbnails = None
+
+    def _get(self, url: str) -> Tuple[Optional[int], bytes, str]:
+        """One rate-limited GET: (status, body, content type), status None on network errors"""
+        self.rate_limiter.acquire()
+        started = time.monotonic()
+        try:
+            response = self.session.get(url, timeout=30)
+        except Exception as e:
+            self.rate_limiter.record_response(None, time.monotonic() - started)
+            logger.error(f"Error fetching logo {url}: {e}")
+            return None, b'', ''
+        self.rate_limiter.record_response(
+            response.status_code, time.monotonic() - started, response.headers.get('Retry-After')
+        )
+        return response.status_code, response.content, response.headers.get('Content-Type', '')
+
+    def fetch_logo(self, url: str) -> Optional[Dict[str, str]]:
+        """
+        Logo fields of one URL, from the store or the network
+
+        Returns:
+            Logo fields, {} for logos that are gone, None if all attempts failed
+        """
+        stored = self.store.lookup(url)
+        if stored is not None:
+            with self._lock:
+                self.reused += 1
+            return stored
+
+        max_retries = self.rate_limiter.max_retries
+        for attempt in range(1, max_retries + 1):
+            status, body, content_type = self._get(url)
+            if status == 200 and body:
+                sha256, path, is_new = self.store.store(body, content_type)
+                fields = {'logo_sha256': sha256, 'logo_path': str(path), 'logo_thumbnail': ''}
+                if self._thumbnails is not None:
+                    thumbnail = self.store.thumbnail_path(sha256)
+                    if thumbnail.exists():
+                        fields['logo_thumbnail'] = str(thumbnail)
+                    else:
+                        self._submit_thumbnail(sha256, path, thumbnail)
+                with self._lock:
+                    self.downloaded += 1
+                self.store.record(url, 200, fields)
+                return fields
+            if status in GONE_STATUS_CODES:
+                self.store.record(url, status)
+                return {}
+            logger.warning(f"Logo {url} failed with status {status} (attempt {attempt}/{max_retries})")
+            if status is not None and status not in THROTTLE_STATUS_CODES and status < 500:
+                return None
+            if attempt < max_retries:
+                time.sleep(self.rate_limiter.backoff_delay(attempt))
+        return None
+
+    def _submit_thumbnail(self, sha256: str, path: Path, thumbnail: Path):
+        """Render a thumbnail in the process pool, once per image; _merge picks it up"""
+        with self._lock:
+            if sha256 not in self._thumbnail_jobs:
+                self._thumbnail_jobs[sha256] = self._thumbnails.submit(
+                    make_thumbnail, str(path), str(thumbnail), self.thumbnail_size)
+
+    def _submit(self, executor: ThreadPoolExecutor, url: str) -> Future:
+        with self._lock:
+            future = self._in_flight.get(url)
+            if future is None:
+                future = self._in_flight[url] = executor.submit(self.fetch_logo, url)
+            return future
+
+    def process(self, records: Iterable[Dict[str, str]]) -> Iterator[Dict[str, str]]:
+        """
+        Yield every record with the logo fields added, in input order
+
+        At most concurrency * 4 records are buffered, so this streams.
+        """
+        window = self.concurrency * 4
+        pending = deque()  # (record, future or None)
+        thumbnails = (ProcessPoolExecutor(max_workers=self.thumbnail_workers)
+                      if self.thumbnail_size else None)
+        self._thumbnails = thumbnails
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for record in records:
+                    url = record.get('logo_url')
+                    pending.append((record, self._submit(executor, url) if url else None))
+                    while len(pending) >= window:
+                        yield self._merge(*pending.popleft())
+                while pending:
+                    yield self._merge(*pending.popleft())
+        finally:
+            self._thumbnails = None
+            self._in_flight.clear()
+            self._thumbnail_jobs.clear()
+            if thumbnails:
+                thumbnails.shutdown()
+        logger.info(f"Logos done: {self.downloaded} downloaded, {self.reused} already stored")
+
+    def _merge(self, record: Dict[str, str], future: Optional[Future]) -> Dict[str, str]:
+        merged = dict(record)
+        fields = (future.result() if future else None) or {}
+        if future:
+            url = record['logo_url']
+            with self._lock:
+                # Later records with this URL are answered by the store index
+                if self._in_flight.get(url) is future:
+                    del self._in_flight[url]
+            if fields.get('logo_sha256') and not fields['logo_thumbnail']:
+                self._resolve_thumbnail(url, fields)
+        for field in LOGO_FIELDNAMES:
+            merged[field] = fields.get(field, '')
+        return merged
+
+
+    def _resolve_thumbnail(self, url: str, fields: Dict[str, str]):
+        """Wait for the image's thumbnail and add it to `fields` and the store index"""
+        with self._lock:
+            job = self._thumbnail_jobs.pop(fields['logo_sha256'], None)
+        if job is not None and not job.result():
+            return
+        thumbnail = self.store.thumbnail_path(fields['logo_sha256'])
+        if thumbnail.exists():
+            # The dict is shared by every record waiting on this download
+            fields['logo_thumbnail'] = str(thumbnail)
+            self.store.record(url, 200, fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the logos of a Gelbe Seiten export")
+    parser.add_argument('input', help="Export with logo_url (.csv or .jsonl)")
+    parser.add_argument('output', help="Output with logo_sha256/logo_path/logo_thumbnail")
+    parser.add_argument('--logo-dir', default='logos', help="Content-addressed logo store")
+    parser.add_argument('--rate', type=float, default=2.0, help="Logo downloads per second")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--thumbnail-size', type=int, default=128, help="Thumbnail edge in px (0: none)")
+    parser.add_argument('--thumbnail-workers', type=int, default=2)
+    args = parser.parse_args()
+
+    size = (args.thumbnail_size, args.thumbnail_size) if args.thumbnail_size else None
+    with LogoStore(args.logo_dir) as store, \
+            open_sink(args.output, fieldnames=LOGO_EXPORT_FIELDNAMES) as sink:
+        downloader = LogoDownloader(store, RateLimiter(rate=args.rate), args.concurrency,
+                                    size, args.thumbnail_workers)
+        for record in downloader.process(read_records(args.input)):
+            sink.write(record)
+        stats = store.stats()
+    print(f"✓ {sink.written} records, {stats['images']} distinct logos for {stats['urls']} URLs: "
+          f"{args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Crawl metrics for the Gelbe Seiten Scraper
+Counters, gauges and histograms for every stage (fetch, retry, parse, write, queues),
+exported as a Prometheus text endpoint or as periodic JSON snapshots - stdlib only
+
+Usage:
+    metrics = CrawlMetrics()
+    scraper = GelbeSeitenScraperComplete("steuerberater", metrics=metrics)
+    with MetricsServer(metrics.registry, port=9108), JsonSnapshotWriter(metrics.registry, "metrics.json"):
+        scraper.scrape_all(output_file="steuerberater.csv")
+"""
+
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PARSE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+ENTRIES_BUCKETS = (0, 1, 5, 10, 25, 50, 100)
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Dict[str, str] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {value:g}" for name, labels, value in self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count, optionally split by labels"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(key), value) for key, value in sorted(self._values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            if list(self._values) == [()]:
+                return self._values[()]
+            return {','.join(f"{k}={v}" for k, v in key) or '': value
+                    for key, value in sorted(self._values.items())}
+
+
+class Gauge(Counter):
+    """Current value (queue depth, rate, total hits)"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Distribution over fixed buckets plus sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def _samples(self):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append((f"{self.name}_bucket", _format_labels((), {'le': f"{bound:g}"}), cumulative))
+        samples.append((f"{self.name}_bucket", _format_labels((), {'le': '+Inf'}), count))
+        samples.append((f"{self.name}_sum", '', total))
+        samples.append((f"{self.name}_count", '', count))
+        return samples
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self._count,
+                'sum': self._sum,
+                'avg': self._sum / self._count if self._count else 0.0,
+                'buckets': dict(zip([f"{bound:g}" for bound in self.buckets] + ['+Inf'], self._counts)),
+            }
+
+
+class Registry:
+    """Named collection of metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._register(Gauge(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float]) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        return {'timestamp': time.time(),
+                'metrics': {name: metric.snapshot() for name, metric in list(self._metrics.items())}}
+
+
+class CrawlMetrics:
+    """
+    The metrics one crawl records
+
+    Args:
+        registry: Registry to add the metrics to (default: a new one)
+    """
+
+    def __init__(self, registry: Registry = None):
+        self.registry = registry or Registry()
+        r = self.registry
+        self.requests = r.counter('gelbeseiten_requests_total', 'HTTP requests by status code')
+        self.request_seconds = r.histogram('gelbeseiten_request_seconds', 'HTTP request latency',
+                                           LATENCY_BUCKETS)
+        self.retries = r.counter('gelbeseiten_retries_total', 'Page fetches retried after a failure')
+        self.dead_letters = r.counter('gelbeseiten_dead_letters_total',
+                                      'Failed pages moved to the dead-letter queue')
+        self.not_modified = r.counter('gelbeseiten_not_modified_total',
+                                      'Cached pages revalidated with a 304 instead of refetched')
+        self.cache_hits = r.counter('gelbeseiten_cache_hits_total', 'Pages served from the response cache')
+        self.parse_seconds = r.histogram('gelbeseiten_parse_seconds', 'Parse time per page', PARSE_BUCKETS)
+        self.entries_per_page = r.histogram('gelbeseiten_entries_per_page', 'Entries found per page',
+                                            ENTRIES_BUCKETS)
+        self.records_written = r.counter('gelbeseiten_records_written_total', 'Records written to the sink')
+        self.queue_depth = r.gauge('gelbeseiten_queue_depth', 'Items waiting per queue')
+        self.page_size = r.gauge('gelbeseiten_page_size', 'Entries requested per page (anzahl)')
+        self.rate = r.gauge('gelbeseiten_rate_limit', 'Current rate limiter rate (requests/second)')
+        self.total_available = r.gauge('gelbeseiten_total_available', 'Results the search reports')
+
+    def observe_request(self, status, seconds: float):
+        self.requests.inc(status=status if status is not None else 'error')
+        self.request_seconds.observe(seconds)
+
+    def observe_parse(self, seconds: float, entries: int):
+        self.parse_seconds.observe(seconds)
+        self.entries_per_page.observe(entries)
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint: /metrics (Prometheus text format) and /metrics.json
+
+    Args:
+        registry: Registry to expose
+        host: Interface to bind (default: localhost only)
+        port: Port (0 picks a free one)
+    """
+
+    def __init__(self, registry: Registry, host: str = '127.0.0.1', port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry.snapshot()).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics at {self.url}/metrics")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class JsonSnapshotWriter:
+    """
+    Write registry snapshots to a JSON file every `interval` seconds (and on stop)
+
+    The file is replaced atomically, so readers never see half a snapshot.
+    """
+
+    def __init__(self, registry: Registry, filename: str, interval: float = 30.0):
+        self.registry = registry
+        self.filename = str(filename)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def write(self):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.registry.snapshot(), f, indent=2)
+        os.replace(tmp, self.filename)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logger.error(f"Error writing metrics snapshot: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="gelbeseiten-metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.write()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Adaptive page size for the Gelbe Seiten ajaxsuche endpoint
+Probes the largest `anzahl` the endpoint honours (checked by the entries a page
+actually returns) and shrinks the page again when latency or errors rise
+"""
+
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PageSizeController:
+    """
+    Page size negotiation, one instance per crawl
+
+    The size doubles after every full page answered within `max_latency`
+    until it reaches `maximum` or the endpoint is seen to truncate pages:
+    a page with fewer entries than requested that is not the end of the
+    results (known from total_available, or because the next page still has
+    entries) caps the size at what it returned. Slow pages and failed
+    fetches halve the size, never below `minimum`.
+
+    The crawl must advance `position` by the entries a page returned, not by
+    the size requested, so a truncated page skips nothing.
+
+    Args:
+        initial: First page size
+        minimum: Smallest page size
+        maximum: Largest page size ever requested
+        max_latency: Seconds per request above which pages get smaller
+        growth: Factor the size grows by per healthy full page
+    """
+
+    def __init__(self, initial: int = 10, minimum: int = 10, maximum: int = 100,
+                 max_latency: float = 5.0, growth: float = 2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_latency = max_latency
+        self.growth = growth
+        self.size = max(minimum, min(initial, maximum))
+        self.cap = maximum  # largest size the endpoint is known to honour
+        self._short_page: Optional[int] = None  # entries of a short page that may be a cap
+
+    def _set_cap(self, entries: int):
+        if entries < self.cap:
+            self.cap = max(1, entries)
+            logger.info(f"Endpoint returns at most {self.cap} entries per page")
+        self.size = min(self.size, self.cap)
+
+    def record(self, position: int, requested: int, entries: int, seconds: float,
+               total_available: int = 0):
+        """
+        Adapt to one answered page
+
+        Args:
+            position: Position the page was fetched at
+            requested: anzahl sent
+            entries: Entries the page contained
+            seconds: Request latency
+            total_available: Hit count of the search (0 if unknown)
+        """
+        if self._short_page is not None and entries:
+            # The previous short page was not the end, so it was the endpoint's limit
+            self._set_cap(self._short_page)
+        self._short_page = None
+
+        if 0 < entries < requested:
+            if total_available and position + entries < total_available:
+                self._set_cap(entries)
+            elif not total_available:
+                self._short_page = entries
+            return
+
+        if seconds > self.max_latency:
+            self.shrink(f"{seconds:.1f}s for {requested} entries")
+        elif entries == requested and seconds <= self.max_latency / 2:
+            self.size = min(self.cap, self.maximum, int(self.size * self.growth))
+
+    def record_failure(self):
+        """A fetch of the current size failed"""
+        self.shrink("failed request")
+
+    def shrink(self, reason: str):
+        size = max(min(self.minimum, self.cap), self.size // 2)
+        if size != self.size:
+            logger.info(f"Page size {self.size} -> {size} ({reason})")
+        self.size = size
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Parser backends for /ajaxsuche result HTML
+BeautifulSoup (reference) and lxml (precompiled XPath) produce field-for-field identical records
+"""
+
+import base64
+import json
+import logging
+import re
+from typing import Callable, Dict, List, Tuple
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml is optional
+    lxml = None
+
+logger = logging.getLogger(__name__)
+
+REVIEW_COUNT_RE = re.compile(r'(\d+)')
+# "38.902 Treffer" in the result list header of /suche/... pages
+TOTAL_HITS_RES = [
+    re.compile(r'id="mod-TrefferlisteInfo"[^>]*>\s*([\d.]+)'),
+    re.compile(r'([\d.]+)\s*(?:</[^>]+>\s*)*Treffer\b'),
+]
+
+
+def decode_base64(encoded_str: str) -> str:
+    """Decode base64 encoded string"""
+    try:
+        decoded = base64.b64decode(encoded_str).decode('utf-8')
+        return decoded
+    except Exception as e:
+        logger.debug(f"Failed to decode base64: {e}")
+        return ""
+
+
+def parse_total_hits(html: str) -> int:
+    """Total number of hits announced on a search page, 0 if not found"""
+    for pattern in TOTAL_HITS_RES:
+        match = pattern.search(html)
+        if match:
+            digits = match.group(1).replace('.', '')
+            if digits:
+                return int(digits)
+    return 0
+
+
+# Keys an /ajaxsuche payload may carry the hit count in
+TOTAL_HITS_KEYS = ('gesamtanzahl', 'anzahlTreffer', 'trefferAnzahl', 'total')
+
+
+def total_hits_from_payload(response_data: Dict) -> int:
+    """Hit count from an /ajaxsuche payload (JSON field or announced in its HTML), 0 if absent"""
+    for key in TOTAL_HITS_KEYS:
+        value = response_data.get(key)
+        if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+            return int(value)
+    return parse_total_hits(response_data.get('html') or '')
+
+
+def empty_record() -> Dict[str, str]:
+    return {
+        'name': '',
+        'address': '',
+        'city': '',
+        'postal_code': '',
+        'phone': '',
+        'website': '',
+        'email': '',
+        'logo_url': '',
+        'rating': '',
+        'review_count': '',
+        'specialties': '',
+        'description': '',
+        'detail_url': ''
+    }
+
+
+def absolute_url(url: str, base_url: str) -> str:
+    if url.startswith('http'):
+        return url
+    return base_url + url
+
+
+def logo_url(src: str, base_url: str) -> str:
+    """Logo URL from an <img src>, '' for the placeholder pixel"""
+    # Check if it's not the placeholder pixel
+    if 'pixel.png' in src or src in ['1px', '']:
+        return ''
+    # Make sure it's a full URL
+    if src.startswith('http'):
+        return src
+    if src.startswith('/'):
+        return base_url + src
+    return src
+
+
+def split_address(full_text: str, city_postal: str) -> Tuple[str, str, str]:
+    """Split the address block into (street, postal_code, city)"""
+    postal_code = city = ''
+    if city_postal:
+        # Split postal code and city (e.g., "20354 Hamburg")
+        parts = city_postal.split(None, 1)
+        if len(parts) == 2:
+            postal_code, city = parts
+
+    # Extract street address (everything before the postal code)
+    address_only = full_text
+    if city_postal:
+        address_only = full_text.split(city_postal)[0]
+    # Remove trailing comma and extra spaces
+    return address_only.rstrip(', ').strip(), postal_code, city
+
+
+def email_from_chat_parameters(parameters: str) -> str:
+    """E-mail address from the chat button's data-parameters JSON"""
+    try:
+        chat_data = json.loads(parameters)
+        if 'inboxConfig' in chat_data:
+            organization = chat_data['inboxConfig'].get('organizationQuery', {})
+            generic = organization.get('generic', {})
+            if 'email' in generic:
+                return generic['email']
+    except Exception as e:
+        logger.debug(f"Error parsing chat data: {e}")
+    return ''
+
+
+def review_count(review_text: str) -> str:
+    # Extract number (e.g., "122 Bewertungen" -> "122")
+    review_match = REVIEW_COUNT_RE.search(review_text)
+    return review_match.group(1) if review_match else ''
+
+
+# ---------------------------------------------------------------------------
+# BeautifulSoup backend (reference implementation)
+# ---------------------------------------------------------------------------
+
+TREFFER_CLASS_RE = re.compile(r'mod-Treffer')
+GSBIZ_HREF_RE = re.compile(r'/gsbiz/')
+CHAT_BUTTON_ID_RE = re.compile(r'mod-Chat__button')
+RATING_CLASS_RE = re.compile(r'mod-BewertungKompakt__number')
+REVIEW_CLASS_RE = re.compile(r'mod-BewertungKompakt__text')
+SPECIALTY_CLASS_RE = re.compile(r'mod-Treffer--besteBranche')
+
+
+def parse_html_soup(html: str, base_url: str) -> Tuple[int, List[Dict[str, str]]]:
+    """
+    Parse result HTML with BeautifulSoup
+
+    Returns:
+        (number of <article> entries found, records with a name)
+    """
+    results = []
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Find all business entries
+    entries = soup.find_all('article', class_=TREFFER_CLASS_RE)
+
+    for entry in entries:
+        try:
+            data = empty_record()
+
+            # Extract name
+            name_tag = entry.find('h2', class_='mod-Treffer__name')
+            if name_tag:
+                data['name'] = name_tag.get_text(strip=True)
+
+            # Extract detail URL
+            detail_link = entry.find('a', href=GSBIZ_HREF_RE)
+            if detail_link:
+                data['detail_url'] = absolute_url(detail_link['href'], base_url)
+
+            # Extract LOGO URL
+            logo_img = entry.find('img', class_='mod-Treffer__logo')
+            if logo_img and logo_img.get('src'):
+                data['logo_url'] = logo_url(logo_img['src'], base_url)
+
+            # Extract address
+            address_container = entry.find('address', class_='mod-AdresseKompakt')
+            if address_container:
+                address_text_div = address_container.find('div', class_='mod-AdresseKompakt__adress-text')
+                if address_text_div:
+                    # Get full text
+                    full_text = address_text_div.get_text(strip=True)
+
+                    # Extract postal code and city
+                    city_postal = ''
+                    city_span = address_text_div.find('span', class_='mod-AdresseKompakt__adress__ort')
+                    if city_span:
+                        city_postal = city_span.get_text(strip=True)
+                    data['address'], postal_code, city = split_address(full_text, city_postal)
+                    if postal_code:
+                        data['postal_code'] = postal_code
+                        data['city'] = city
+
+            # Extract phone
+            phone_container = entry.find('div', class_='mod-TelefonnummerKompakt')
+            if phone_container:
+                phone_link = phone_container.find('a', class_='mod-TelefonnummerKompakt__phoneNumber')
+                if phone_link:
+                    data['phone'] = phone_link.get_text(strip=True)
+
+            # Extract WEBSITE URL (base64 encoded)
+            # Note: BeautifulSoup converts all HTML attributes to lowercase!
+            website_container = entry.find('div', class_='mod-WebseiteKompakt')
+            if website_container:
+                website_span = website_container.find('span', class_='mod-WebseiteKompakt__text')
+                if website_span:
+                    encoded_url = website_span.get('data-webseitelink', '')
+                    if encoded_url:
+                        decoded = decode_base64(encoded_url)
+                        if decoded and decoded.startswith('http'):
+                            data['website'] = decoded
+
+            # Extract email from chat button data
+            chat_button = entry.find('button', id=CHAT_BUTTON_ID_RE)
+            if chat_button and chat_button.get('data-parameters'):
+                data['email'] = email_from_chat_parameters(chat_button['data-parameters'])
+
+            # Extract rating
+            rating_span = entry.find('span', class_=RATING_CLASS_RE)
+            if rating_span:
+                data['rating'] = rating_span.get_text(strip=True)
+
+            # Extract review count
+            review_span = entry.find('span', class_=REVIEW_CLASS_RE)
+            if review_span:
+                data['review_count'] = review_count(review_span.get_text(strip=True))
+
+            # Extract specialties
+            specialty_tag = entry.find('p', class_=SPECIALTY_CLASS_RE)
+            if specialty_tag:
+                data['specialties'] = specialty_tag.get_text(strip=True)
+
+            # Extract description
+            desc_tag = entry.find('div', class_='mod-Treffer__freitext')
+            if desc_tag:
+                data['description'] = desc_tag.get_text(strip=True)
+
+            # Only add if we have at least a name
+            if data['name']:
+                results.append(data)
+
+        except Exception as e:
+            logger.error(f"Error parsing entry: {e}")
+            continue
+
+    return len(entries), results
+
+
+# ---------------------------------------------------------------------------
+# lxml backend
+# ---------------------------------------------------------------------------
+
+def _has_class(name: str) -> str:
+    """XPath predicate: one of the element's classes is exactly `name`"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+if lxml is not None:
+    # Selectors mirror the BeautifulSoup finds above; regex class matchers
+    # become substring tests, exact class matchers become token tests.
+    X_ENTRIES = etree.XPath("//article[contains(@class, 'mod-Treffer')]")
+    X_NAME = etree.XPath(f".//h2[{_has_class('mod-Treffer__name')}][1]")
+    X_DETAIL = etree.XPath(".//a[contains(@href, '/gsbiz/')][1]")
+    X_LOGO = etree.XPath(f".//img[{_has_class('mod-Treffer__logo')}][1]")
+    X_ADDRESS = etree.XPath(f".//address[{_has_class('mod-AdresseKompakt')}][1]")
+    X_ADDRESS_TEXT = etree.XPath(f".//div[{_has_class('mod-AdresseKompakt__adress-text')}][1]")
+    X_CITY = etree.XPath(f".//span[{_has_class('mod-AdresseKompakt__adress__ort')}][1]")
+    X_PHONE = etree.XPath(f".//div[{_has_class('mod-TelefonnummerKompakt')}][1]")
+    X_PHONE_LINK = etree.XPath(f".//a[{_has_class('mod-TelefonnummerKompakt__phoneNumber')}][1]")
+    X_WEBSITE = etree.XPath(f".//div[{_has_class('mod-WebseiteKompakt')}][1]")
+    X_WEBSITE_SPAN = etree.XPath(f".//span[{_has_class('mod-WebseiteKompakt__text')}][1]")
+    X_CHAT = etree.XPath(".//button[contains(@id, 'mod-Chat__button')][1]")
+    X_RATING = etree.XPath(".//span[contains(@class, 'mod-BewertungKompakt__number')][1]")
+    X_REVIEWS = etree.XPath(".//span[contains(@class, 'mod-BewertungKompakt__text')][1]")
+    X_SPECIALTY = etree.XPath(".//p[contains(@class, 'mod-Treffer--besteBranche')][1]")
+    X_DESCRIPTION = etree.XPath(f".//div[{_has_class('mod-Treffer__freitext')}][1]")
+    # Same strings as BeautifulSoup's get_text: no comments, no script/style content
+    X_TEXT = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+
+
+def _first(xpath, element):
+    found = xpath(element)
+    return found[0] if found else None
+
+
+def _text(element) -> str:
+    """Equivalent of BeautifulSoup's get_text(strip=True)"""
+    return ''.join(s.strip() for s in X_TEXT(element) if s.strip())
+
+
+def parse_html_lxml(html: str, base_url: str) -> Tuple[int, List[Dict[str, str]]]:
+    """
+    Parse result HTML with lxml and precompiled XPath selectors
+
+    Returns:
+        (number of <article> entries found, records with a name)
+    """
+    if lxml is None:
+        raise ImportError("The lxml parser backend requires lxml: pip3 install lxml")
+
+    results = []
+    if not html.strip():
+        return 0, results
+
+    try:
+        root = lxml.html.document_fromstring(html)
+    except etree.ParserError:
+        return 0, results
+    entries = X_ENTRIES(root)
+
+    for entry in entries:
+        try:
+            data = empty_record()
+
+            name_tag = _first(X_NAME, entry)
+            if name_tag is not None:
+                data['name'] = _text(name_tag)
+
+            detail_link = _first(X_DETAIL, entry)
+            if detail_link is not None:
+                data['detail_url'] = absolute_url(detail_link.get('href'), base_url)
+
+            logo_img = _first(X_LOGO, entry)
+            if logo_img is not None and logo_img.get('src'):
+                data['logo_url'] = logo_url(logo_img.get('src'), base_url)
+
+            address_container = _first(X_ADDRESS, entry)
+            if address_container is not None:
+                address_text_div = _first(X_ADDRESS_TEXT, address_container)
+                if address_text_div is not None:
+                    full_text = _text(address_text_div)
+                    city_postal = ''
+                    city_span = _first(X_CITY, address_text_div)
+                    if city_span is not None:
+                        city_postal = _text(city_span)
+                    data['address'], postal_code, city = split_address(full_text, city_postal)
+                    if postal_code:
+                        data['postal_code'] = postal_code
+                        data['city'] = city
+
+            phone_container = _first(X_PHONE, entry)
+            if phone_container is not None:
+                phone_link = _first(X_PHONE_LINK, phone_container)
+                if phone_link is not None:
+                    data['phone'] = _text(phone_link)
+
+            # lxml lowercases attribute names as well
+            website_container = _first(X_WEBSITE, entry)
+            if website_container is not None:
+                website_span = _first(X_WEBSITE_SPAN, website_container)
+                if website_span is not None:
+                    encoded_url = website_span.get('data-webseitelink', '')
+                    if encoded_url:
+                        decoded = decode_base64(encoded_url)
+                        if decoded and decoded.startswith('http'):
+                            data['website'] = decoded
+
+            chat_button = _first(X_CHAT, entry)
+            if chat_button is not None and chat_button.get('data-parameters'):
+                data['email'] = email_from_chat_parameters(chat_button.get('data-parameters'))
+
+            rating_span = _first(X_RATING, entry)
+            if rating_span is not None:
+                data['rating'] = _text(rating_span)
+
+            review_span = _first(X_REVIEWS, entry)
+            if review_span is not None:
+                data['review_count'] = review_count(_text(review_span))
+
+            specialty_tag = _first(X_SPECIALTY, entry)
+            if specialty_tag is not None:
+                data['specialties'] = _text(specialty_tag)
+
+            desc_tag = _first(X_DESCRIPTION, entry)
+            if desc_tag is not None:
+                data['description'] = _text(desc_tag)
+
+            if data['name']:
+                results.append(data)
+
+        except Exception as e:
+            logger.error(f"Error parsing entry: {e}")
+            continue
+
+    return len(entries), results
+
+
+PARSERS: Dict[str, Callable[[str, str], Tuple[int, List[Dict[str, str]]]]] = {
+    'soup': parse_html_soup,
+    'lxml': parse_html_lxml,
+}
+
+
+def get_parser(name: str = 'auto') -> Callable[[str, str], Tuple[int, List[Dict[str, str]]]]:
+    """
+    Look up a parser backend
+
+    Args:
+        name: 'soup', 'lxml' or 'auto' (lxml if installed, else BeautifulSoup)
+    """
+    if name == 'auto':
+        name = 'lxml' if lxml is not None else 'soup'
+    if name not in PARSERS:
+        raise ValueError(f"Unknown parser backend '{name}' (use {', '.join(PARSERS)} or auto)")
+    if name == 'lxml' and lxml is None:
+        raise ImportError("The lxml parser backend requires lxml: pip3 install lxml")
+    return PARSERS[name]
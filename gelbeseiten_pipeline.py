@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Pipelined crawl for the Gelbe Seiten Scraper
+A fetch thread feeds raw /ajaxsuche payloads through a bounded queue into a process pool for parsing
+"""
+
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Tuple
+
+from gelbeseiten_parsers import get_parser
+from gelbeseiten_sinks import ResultSink
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the fetch stage in the raw queue
+_FETCH_DONE = None
+
+
+def parse_payload(response_data: Dict, base_url: str,
+                  parser: str) -> Tuple[int, List[Dict[str, str]], float]:
+    """Parse one raw /ajaxsuche payload in a worker process: (entries, records, parse seconds)"""
+    if not response_data or 'html' not in response_data:
+        return 0, [], 0.0
+    started = time.perf_counter()
+    entries_found, results = get_parser(parser)(response_data['html'], base_url)
+    return entries_found, results, time.perf_counter() - started
+
+
+def _ignore_sigint():
+    # Ctrl-C is handled by the parent, which shuts the pool down cleanly
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class ParsePipeline:
+    """
+    Fetch and parse concurrently: network I/O never waits for parsing and vice versa
+
+    The fetch thread walks the positions with scraper.fetch_page and blocks as
+    soon as `queue_size` raw pages are waiting (backpressure). The main thread
+    hands queued pages to a ProcessPoolExecutor running the scraper's parser
+    backend and emits parsed pages either in position order or as soon as
+    they are ready.
+
+    Args:
+        scraper: GelbeSeitenScraperComplete providing session, rate limiter and parser
+        parse_workers: Parser processes (default: all cores)
+        queue_size: Raw pages allowed to wait between fetch and parse stage
+        ordered: Emit pages in position order (False: as soon as they are parsed)
+    """
+
+    def __init__(self, scraper, parse_workers: int = None, queue_size: int = 16,
+                 ordered: bool = True):
+        self.scraper = scraper
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.ordered = ordered
+
+    def _fetch_stage(self, raw_queue: queue.Queue, stop: threading.Event,
+                     results_per_page: int):
+        """Fetch pages one after another until told to stop or a page fails"""
+        position = 0
+        try:
+            while not stop.is_set():
+                response_data = self.scraper._fetch_with_retries(position, results_per_page)
+                item = (position, response_data)
+                # Blocks while the parse stage is behind - but keeps checking for stop
+                while not stop.is_set():
+                    try:
+                        raw_queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if response_data is None:
+                    logger.error("Too many consecutive failures, stopping.")
+                    break
+                position += results_per_page
+        finally:
+            while True:
+                try:
+                    raw_queue.put(_FETCH_DONE, timeout=0.1)
+                    break
+                except queue.Full:
+                    if stop.is_set():
+                        break
+
+    def run(self, max_results: int = None, results_per_page: int = 10,
+            sink: ResultSink = None) -> Iterator[Dict[str, str]]:
+        """
+        Crawl and yield records page by page
+
+        Args:
+            max_results: Maximum number of results to fetch (None for all available)
+            results_per_page: Number of results per page
+            sink: Optional ResultSink every parsed page is appended to
+
+        Yields:
+            Scraped result dictionaries
+        """
+        scraper = self.scraper
+        if not scraper.initialize_session():
+            logger.error("Failed to initialize session")
+            return
+
+        raw_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        fetcher = threading.Thread(
+            target=self._fetch_stage, args=(raw_queue, stop, results_per_page),
+            name="gelbeseiten-fetch", daemon=True
+        )
+        pool = ProcessPoolExecutor(max_workers=self.parse_workers, initializer=_ignore_sigint)
+
+        pending = {}  # future -> position
+        parsed = {}  # position -> page results, waiting to be emitted
+        next_emit = 0
+        end_position = None  # first position without results
+        fetch_done = False
+        total_scraped = 0
+        max_in_flight = self.parse_workers * 2
+
+        fetcher.start()
+        try:
+            while True:
+                # Feed the pool, but never let more than max_in_flight pages pile up in it
+                while not fetch_done and len(pending) < max_in_flight:
+                    try:
+                        item = raw_queue.get(timeout=0.1 if not pending else 0.001)
+                    except queue.Empty:
+                        break
+                    if item is _FETCH_DONE:
+                        fetch_done = True
+                        break
+                    position, response_data = item
+                    if response_data is None:
+                        end_position = position if end_position is None else min(end_position, position)
+                        continue
+                    if end_position is not None and position > end_position:
+                        continue  # fetched ahead past the last page
+                    future = pool.submit(parse_payload, response_data, scraper.base_url, scraper.parser)
+                    pending[future] = position
+
+                scraper.metrics.queue_depth.set(raw_queue.qsize(), queue='raw')
+                scraper.metrics.queue_depth.set(len(pending), queue='parse')
+                if pending:
+                    done, _ = wait(list(pending), timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        position = pending.pop(future)
+                        entries_found, page_results, parse_seconds = future.result()
+                        scraper.metrics.observe_parse(parse_seconds, entries_found)
+                        logger.info(f"Found {entries_found} entries in this page")
+                        if not page_results:
+                            logger.info(f"No more results found at position {position}")
+                            end_position = position if end_position is None else min(end_position, position)
+                            stop.set()
+                        parsed[position] = page_results
+
+                # Emit what is ready
+                if self.ordered:
+                    ready = []
+                    while next_emit in parsed:
+                        ready.append((next_emit, parsed.pop(next_emit)))
+                        next_emit += results_per_page
+                else:
+                    ready = sorted(parsed.items())
+                    parsed.clear()
+
+                for position, page_results in ready:
+                    if end_position is not None and position >= end_position:
+                        continue
+                    if max_results and total_scraped >= max_results:
+                        break
+                    total_scraped += len(page_results)
+                    scraper._log_progress(total_scraped)
+                    if sink:
+                        sink.write_many(page_results)
+                        scraper.metrics.records_written.inc(len(page_results))
+                    yield from page_results
+
+                if max_results and total_scraped >= max_results:
+                    logger.info(f"Reached max_results limit: {max_results}")
+                    break
+                if fetch_done and not pending:
+                    break
+        finally:
+            # Normal end, max_results, consumer stopped iterating or Ctrl-C
+            stop.set()
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True, cancel_futures=True)
+            fetcher.join(timeout=60)
+
+        logger.info(f"Scraping complete. Total results: {total_scraped}")
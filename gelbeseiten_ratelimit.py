@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Adaptive rate limiting for the Gelbe Seiten Scraper
+Token bucket with AIMD adaptation, exponential backoff with jitter and Retry-After
+"""
+
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Status codes that mean "slow down" rather than "this page is broken"
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) into seconds from now"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Token bucket whose refill rate adapts to how the server is coping
+
+    Healthy responses raise the rate additively, throttling responses (429/503),
+    errors and latency spikes cut it multiplicatively. A Retry-After header
+    blocks all requests until the given time has passed.
+
+    Args:
+        rate: Initial requests per second
+        min_rate: Lower bound for the adapted rate
+        max_rate: Upper bound for the adapted rate
+        burst: Bucket capacity (requests that may go out back-to-back)
+        increase: Requests per second added after each healthy response
+        decrease: Factor the rate is multiplied by on throttling/errors
+        latency_spike: A response slower than this multiple of the average
+            latency counts as a spike
+        backoff_base: First retry delay in seconds
+        backoff_max: Upper bound for retry delays in seconds
+        max_retries: Consecutive failures after which a crawl gives up
+    """
+
+    def __init__(self, rate: float = 1.0, min_rate: float = 0.2, max_rate: float = 10.0,
+                 burst: int = 1, increase: float = 0.05, decrease: float = 0.5,
+                 latency_spike: float = 3.0, backoff_base: float = 2.0,
+                 backoff_max: float = 60.0, max_retries: int = 5):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_spike = latency_spike
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retries = max_retries
+
+        self._rate = rate
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._avg_latency = None
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+    @property
+    def rate(self) -> float:
+        """Current requests per second"""
+        return self._rate
+
+    @rate.setter
+    def rate(self, value: float):
+        with self._lock:
+            self._rate = value
+
+    def _reserve(self) -> float:
+        """Take a token and return how long the caller has to wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self._rate)
+            self._last_refill = now
+            self._tokens -= 1
+            self.requests += 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def acquire(self):
+        """Block until the next request may be sent"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_response(self, status: Optional[int], latency: float,
+                        retry_after: Optional[str] = None):
+        """
+        Adapt the rate to the outcome of a request
+
+        Args:
+            status: HTTP status code, None if the request raised
+            latency: Seconds the request took
+            retry_after: Raw Retry-After header, if any
+        """
+        with self._lock:
+            old_rate = self._rate
+            spike = (self._avg_latency is not None
+                     and latency > self._avg_latency * self.latency_spike)
+
+            if status in THROTTLE_STATUS_CODES:
+                self.throttled += 1
+                self._rate = max(self.min_rate, self._rate * self.decrease)
+                delay = parse_retry_after(retry_after)
+                if delay:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            elif status is None or status >= 500:
+                self.errors += 1
+                self._rate = max(self.min_rate, self._rate * self.decrease)
+            elif spike:
+                self._rate = max(self.min_rate, self._rate * self.decrease)
+            elif status == 200:
+                self._rate = min(self.max_rate, self._rate + self.increase)
+
+            # Only healthy answers feed the latency baseline
+            if status == 200 and not spike:
+                if self._avg_latency is None:
+                    self._avg_latency = latency
+                else:
+                    self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+
+            if self._rate < old_rate:
+                logger.info(f"Rate limiter backing off: {old_rate:.2f} -> {self._rate:.2f} req/s "
+                            f"(status {status}, {latency:.2f}s)")
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (1-based): exponential with jitter"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        delay = random.uniform(delay / 2, delay)
+        with self._lock:
+            blocked = self._blocked_until - time.monotonic()
+        return max(delay, blocked)
+
+    def stats(self) -> Dict[str, float]:
+        """Snapshot of the limiter state for progress logging"""
+        with self._lock:
+            return {
+                'rate': round(self._rate, 3),
+                'avg_latency': round(self._avg_latency or 0.0, 3),
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'errors': self.errors,
+            }
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory records for the Gelbe Seiten Scraper
+A parsed entry as a plain dict costs a hash table per record; Record keeps the
+export fields in slots and RecordBuffer can hold a whole crawl as columns.
+Repeated values (city, postal code, specialties, rating) are interned, so
+thousands of records in the same city share one string.
+
+Both behave like the dicts they replace: record['city'], record.get('email'),
+dict(record) and iteration over a buffer all work unchanged. Entries of a
+columnar buffer are RecordViews, so record['email'] = ... writes to the column.
+"""
+
+import sys
+from collections.abc import MutableMapping, Sequence
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from gelbeseiten_sinks import FIELDNAMES
+
+# Fields with few distinct values across a crawl
+INTERNED_FIELDS = frozenset(('city', 'postal_code', 'specialties', 'rating'))
+
+_FIELD_SET = frozenset(FIELDNAMES)
+
+
+def _compact(field: str, value):
+    if field in INTERNED_FIELDS and type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+class Record(MutableMapping):
+    """
+    One result entry: the FIELDNAMES in slots, anything else in a small overflow dict
+
+    Export fields always exist (default ''); deleting one resets it to ''.
+    """
+
+    __slots__ = tuple(FIELDNAMES) + ('_extra',)
+
+    def __init__(self, fields: Dict[str, str] = None, **kwargs):
+        for field in FIELDNAMES:
+            setattr(self, field, '')
+        self._extra: Optional[Dict[str, str]] = None
+        for source in (fields, kwargs):
+            if source:
+                for key, value in source.items():
+                    self[key] = value
+
+    def __getitem__(self, key: str):
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key in _FIELD_SET:
+            setattr(self, key, _compact(key, value))
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in _FIELD_SET:
+            setattr(self, key, '')
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from FIELDNAMES
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return len(FIELDNAMES) + (len(self._extra) if self._extra else 0)
+
+    def __repr__(self) -> str:
+        return f"Record({dict(self)!r})"
+
+    def to_dict(self) -> Dict[str, str]:
+        return dict(self)
+
+
+class RecordView(MutableMapping):
+    """
+    One row of a columnar RecordBuffer, read from and written to its columns
+
+    Fields the row never had (None in their column) are missing, like in the
+    record that was appended. The view stays bound to its position, so it is
+    invalid after the buffer is cleared.
+    """
+
+    __slots__ = ('_buffer', '_index')
+
+    def __init__(self, buffer: 'RecordBuffer', index: int):
+        self._buffer = buffer
+        self._index = index
+
+    def __getitem__(self, key: str):
+        column = self._buffer._columns.get(key)
+        value = None if column is None else column[self._index]
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        columns = self._buffer._columns
+        if key not in columns:
+            columns[key] = [None] * self._buffer._length
+        columns[key][self._index] = _compact(key, value)
+
+    def __delitem__(self, key: str):
+        column = self._buffer._columns.get(key)
+        if column is None or column[self._index] is None:
+            raise KeyError(key)
+        column[self._index] = '' if key in _FIELD_SET else None
+
+    def __iter__(self) -> Iterator[str]:
+        index = self._index
+        return (field for field, column in self._buffer._columns.items() if column[index] is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"RecordView({dict(self)!r})"
+
+    def to_dict(self) -> Dict[str, str]:
+        return dict(self)
+
+
+class RecordBuffer(Sequence):
+    """
+    List-like store of records for self.results and other in-memory collections
+
+    Args:
+        columnar: Keep one list per field instead of one Record per entry
+            (smallest footprint; indexing returns a RecordView into the columns)
+    """
+
+    def __init__(self, records: Iterable[Dict[str, str]] = (), columnar: bool = True):
+        self.columnar = columnar
+        self._rows: List[Record] = []
+        self._columns: Dict[str, list] = {field: [] for field in FIELDNAMES}
+        self._length = 0
+        self.extend(records)
+
+    def append(self, record: Dict[str, str]):
+        if not self.columnar:
+            self._rows.append(record if isinstance(record, Record) else Record(record))
+            return
+        for field, value in record.items():
+            column = self._columns.get(field)
+            if column is None:
+                # A field outside FIELDNAMES: earlier rows did not have it
+                column = self._columns[field] = [None] * self._length
+            column.append(_compact(field, value))
+        self._length += 1
+        for field, column in self._columns.items():
+            if len(column) < self._length:
+                column.append('' if field in _FIELD_SET else None)
+
+    def extend(self, records: Iterable[Dict[str, str]]):
+        for record in records:
+            self.append(record)
+
+    def clear(self):
+        self._rows.clear()
+        for column in self._columns.values():
+            column.clear()
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length if self.columnar else len(self._rows)
+
+    def __getitem__(self, index):
+        if not self.columnar:
+            return self._rows[index]
+        if isinstance(index, slice):
+            return [RecordView(self, i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("RecordBuffer index out of range")
+        return RecordView(self, index)
+
+    def __iter__(self) -> Iterator[MutableMapping]:
+        if not self.columnar:
+            return iter(self._rows)
+        return (RecordView(self, i) for i in range(self._length))
+
+    def column(self, field: str) -> list:
+        """All values of one field (the live column of a columnar buffer, not a copy)"""
+        if not self.columnar:
+            return [record.get(field, '') for record in self._rows]
+        return self._columns[field]
@@ -5,16 +5,31 @@ Extracts ALL tax consultant data including emails, websites, and logos
 """
 
 import requests
-from bs4 import BeautifulSoup
+import asyncio
 import csv
-import json
+import functools
 import time
-import re
-import base64
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, Optional, Tuple
 import logging
 from pathlib import Path
 
+from gelbeseiten_cache import ResponseCache
+from gelbeseiten_deadletter import DeadLetterQueue, DeadLetterRetrier
+from gelbeseiten_dedup import Deduplicator
+from gelbeseiten_geo import coverage_stats
+from gelbeseiten_identity import Identity, IdentityPool, browser_headers
+from gelbeseiten_journal import CrawlJournal
+from gelbeseiten_metrics import CrawlMetrics
+from gelbeseiten_pagesize import PageSizeController
+from gelbeseiten_records import RecordBuffer
+from gelbeseiten_transport import WarmupCache, make_session, tune_session
+from gelbeseiten_parsers import decode_base64, get_parser, parse_total_hits, total_hits_from_payload
+from gelbeseiten_pipeline import ParsePipeline
+from gelbeseiten_ratelimit import RateLimiter
+from gelbeseiten_sinks import FIELDNAMES, ParquetSink, ResultSink, open_sink
+from gelbeseiten_store import DUPLICATE, UNCHANGED, RecordStore
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -24,52 +39,107 @@ logger = logging.getLogger(__name__)
 
 
 class GelbeSeitenScraperComplete:
-    def __init__(self, search_term: str = "steuerberater"):
-        self.base_url = "https://www.gelbeseiten.de"
+    def __init__(self, search_term: str = "steuerberater",
+                 base_url: str = "https://www.gelbeseiten.de",
+                 rate_limiter: RateLimiter = None, parser: str = "auto",
+                 cache: ResponseCache = None, location: str = None,
+                 session: requests.Session = None, metrics: CrawlMetrics = None,
+                 identity_pool: IdentityPool = None, compact: str = None,
+                 warmup_cache: WarmupCache = None):
+        self.base_url = base_url.rstrip('/')
         self.ajax_url = f"{self.base_url}/ajaxsuche"
         self.search_term = search_term
-        self.session = requests.Session()
+        # WO parameter: city, PLZ or region (None searches bundesweit)
+        self.location = location
+        self.sortierung = 'relevanz'
+        # Scrapers of a batch share one session (connection pool and cookies)
+        self.session = session or make_session()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # Optional raw response cache: hits skip the network, see reparse()
+        self.cache = cache
+        # Optional cookies from an earlier run: initialize_session() skips the search page
+        self.warmup_cache = warmup_cache
+        # 'soup' (BeautifulSoup), 'lxml' or 'auto' (lxml when installed)
+        self.parser = parser
+        self._parse_html = get_parser(parser)
+        # Request, retry, parse and write metrics (see gelbeseiten_metrics)
+        self.metrics = metrics or CrawlMetrics()
         
         # Set up headers to mimic a real browser
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36',
-            'Accept': '*/*',
-            'Accept-Language': 'de-DE,de;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Origin': self.base_url,
-            'Referer': f'{self.base_url}/',
-            'sec-ch-ua': '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"macOS"',
-            'sec-fetch-dest': 'empty',
-            'sec-fetch-mode': 'cors',
-            'sec-fetch-site': 'same-origin',
-        })
-        
-        self.results = []
+        self.session.headers.update(browser_headers('chrome-macos', self.base_url))
+        
+        # Optional pool of sessions (cookies, header profile, proxy) used instead of self.session
+        self.identity_pool = identity_pool
+        if identity_pool:
+            identity_pool.bind(self.base_url)
+        
+        # Kept results: plain dicts, or a RecordBuffer of slotted records / columns
+        if compact not in (None, 'records', 'columns'):
+            raise ValueError(f"compact must be None, 'records' or 'columns', not {compact!r}")
+        self.results = RecordBuffer(columnar=compact == 'columns') if compact else []
         self.total_available = 0
+        # Run id in the RecordStore of the last crawl that used one
+        self.last_run_id = None
+        self.last_entries_found = 0  # entries on the last parsed page
+        # [start, end) positions the last crawl with a dead-letter queue could not fetch
+        self.missing_ranges: List[Tuple[int, int]] = []
         
     def initialize_session(self):
         """Initialize session by visiting the main page to get cookies"""
+        logger.info(f"Initializing session for search term: '{self.search_term}'...")
+        if self.identity_pool:
+            # Every identity gets its own cookie jar
+            for identity in self.identity_pool.identities:
+                identity.warmed = self._warm_up(identity.session)
+                if not identity.warmed:
+                    self.identity_pool.release(identity, None, 0.0)
+            return any(identity.warmed for identity in self.identity_pool.identities)
+        
+        if self.warmup_cache:
+            cached = self.warmup_cache.get(self.base_url, self._store_scope())
+            if cached:
+                cookies, total = cached
+                self.session.cookies.update(cookies)
+                if total:
+                    self._set_total_available(total)
+                logger.info("Session initialized from cached cookies")
+                return True
+        
+        if not self._warm_up(self.session):
+            return False
+        if self.warmup_cache:
+            self.warmup_cache.put(self.base_url, self._store_scope(),
+                                  requests.utils.dict_from_cookiejar(self.session.cookies),
+                                  self.total_available)
+        return True
+    
+    def _warm_up(self, session: requests.Session) -> bool:
+        """Visit the search page with `session` to collect its cookies"""
         try:
-            logger.info(f"Initializing session for search term: '{self.search_term}'...")
-            response = self.session.get(
-                f"{self.base_url}/suche/{self.search_term}/bundesweit",
+            response = session.get(
+                f"{self.base_url}/suche/{self.search_term}/{self.location or 'bundesweit'}",
                 timeout=30
             )
             logger.info(f"Session initialized. Status: {response.status_code}")
+            if response.status_code == 200:
+                self._set_total_available(parse_total_hits(response.text))
             return response.status_code == 200
         except Exception as e:
             logger.error(f"Error initializing session: {e}")
             return False
     
+    def _warm_up_identity(self, identity: Identity) -> bool:
+        return self._warm_up(identity.session)
+    
+    def _set_total_available(self, total: int):
+        if total and total != self.total_available:
+            self.total_available = total
+            self.metrics.total_available.set(total)
+            logger.info(f"Search reports {total} results")
+    
     def decode_base64(self, encoded_str: str) -> str:
         """Decode base64 encoded string"""
-        try:
-            decoded = base64.b64decode(encoded_str).decode('utf-8')
-            return decoded
-        except Exception as e:
-            logger.debug(f"Failed to decode base64: {e}")
-            return ""
+        return decode_base64(encoded_str)
     
     def fetch_page(self, position: int, anzahl: int = 10) -> Dict:
         """
@@ -82,7 +152,30 @@ class GelbeSeitenScraperComplete:
         Returns:
             Dictionary with response data
         """
+        return self.fetch_page_timed(position, anzahl)[0]
+    
+    def fetch_page_timed(self, position: int, anzahl: int = 10,
+                         session: requests.Session = None) -> Tuple[Dict, float]:
+        """
+        fetch_page, also returning the request latency (0.0 for cache hits and errors)
+        
+        The latency is returned rather than stored on the scraper, so threads
+        fetching side by side never read each other's timings.
+        
+        Args:
+            position: Starting position (0-based, increments by anzahl)
+            anzahl: Number of results per page
+            session: Session to send the request with (default: self.session;
+                ignored when an identity pool is set)
+        """
         try:
+            if self.cache:
+                cached = self.cache.get(self.search_term, position, anzahl, self.sortierung, self.location)
+                if cached is not None:
+                    self.metrics.cache_hits.inc()
+                    logger.info(f"Using cached page at position {position}")
+                    return cached, 0.0
+            
             # Prepare multipart form data
             data = {
                 'umkreis': '-1',
@@ -90,30 +183,89 @@ class GelbeSeitenScraperComplete:
                 'WAS': self.search_term,
                 'position': str(position),
                 'anzahl': str(anzahl),
-                'sortierung': 'relevanz'
+                'sortierung': self.sortierung
             }
+            if self.location:
+                data['WO'] = self.location
+            
+            # An expired cached copy with an ETag/Last-Modified is revalidated instead of refetched
+            stale = self.cache.validators(self.search_term, position, anzahl, self.sortierung,
+                                          self.location) if self.cache else None
+            headers = {}
+            if stale:
+                if stale[1].get('etag'):
+                    headers['If-None-Match'] = stale[1]['etag']
+                if stale[1].get('last_modified'):
+                    headers['If-Modified-Since'] = stale[1]['last_modified']
             
             logger.info(f"Fetching results from position {position}...")
             
-            response = self.session.post(
-                self.ajax_url,
-                data=data,
-                timeout=30
+            identity = self.identity_pool.acquire(self._warm_up_identity) if self.identity_pool else None
+            session = identity.session if identity else (session or self.session)
+            
+            self.rate_limiter.acquire()
+            if identity:
+                identity.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = session.post(
+                    self.ajax_url,
+                    data=data,
+                    headers=headers,
+                    timeout=30
+                )
+            except Exception:
+                self.rate_limiter.record_response(None, time.monotonic() - started)
+                self.metrics.observe_request(None, time.monotonic() - started)
+                if identity:
+                    identity.rate_limiter.record_response(None, time.monotonic() - started)
+                    self.identity_pool.release(identity, None, time.monotonic() - started)
+                raise
+            latency = time.monotonic() - started
+            self.rate_limiter.record_response(
+                response.status_code,
+                latency,
+                response.headers.get('Retry-After')
             )
+            if identity:
+                identity.rate_limiter.record_response(
+                    response.status_code, latency, response.headers.get('Retry-After')
+                )
+                self.identity_pool.release(identity, response.status_code, latency)
+            self.metrics.observe_request(response.status_code, latency)
+            self.metrics.rate.set(self.rate_limiter.rate)
             
+            if response.status_code == 304 and stale:
+                logger.info(f"Page at position {position} not modified, using cached copy")
+                self.metrics.not_modified.inc()
+                self.cache.put(self.search_term, position, anzahl, stale[0],
+                               self.sortierung, self.location, stale[1])
+                return stale[0], latency
             if response.status_code == 200:
                 logger.info(f"Successfully fetched page at position {position}")
                 try:
-                    return response.json()
+                    response_data = response.json()
                 except:
-                    return {'html': response.text}
+                    response_data = {'html': response.text}
+                if self.cache:
+                    validators = {key: response.headers[header] for key, header in
+                                  (('etag', 'ETag'), ('last_modified', 'Last-Modified'))
+                                  if response.headers.get(header)}
+                    self.cache.put(self.search_term, position, anzahl, response_data,
+                                   self.sortierung, self.location, validators)
+                return response_data, latency
+            elif response.status_code in (401, 403) and self.warmup_cache:
+                # The cached cookies may be what got us blocked
+                self.warmup_cache.invalidate(self.base_url)
+                logger.error(f"Failed to fetch page. Status: {response.status_code}")
+                return {}, latency
             else:
                 logger.error(f"Failed to fetch page. Status: {response.status_code}")
-                return {}
+                return {}, latency
                 
         except Exception as e:
             logger.error(f"Error fetching page at position {position}: {e}")
-            return {}
+            return {}, 0.0
     
     def parse_results(self, response_data: Dict) -> List[Dict[str, str]]:
         """
@@ -125,155 +277,19 @@ class GelbeSeitenScraperComplete:
         Returns:
             List of dictionaries containing business information
         """
-        results = []
-        
         if not response_data or 'html' not in response_data:
-            return results
-        
-        html = response_data['html']
-        soup = BeautifulSoup(html, 'html.parser')
+            return []
         
-        # Find all business entries
-        entries = soup.find_all('article', class_=re.compile(r'mod-Treffer'))
+        if not self.total_available:
+            # Fallback when the search page did not announce the hit count
+            self._set_total_available(total_hits_from_payload(response_data))
         
-        logger.info(f"Found {len(entries)} entries in this page")
+        started = time.perf_counter()
+        entries_found, results = self._parse_html(response_data['html'], self.base_url)
+        self.metrics.observe_parse(time.perf_counter() - started, entries_found)
         
-        for entry in entries:
-            try:
-                data = {
-                    'name': '',
-                    'address': '',
-                    'city': '',
-                    'postal_code': '',
-                    'phone': '',
-                    'website': '',
-                    'email': '',
-                    'logo_url': '',
-                    'rating': '',
-                    'review_count': '',
-                    'specialties': '',
-                    'description': '',
-                    'detail_url': ''
-                }
-                
-                # Extract name
-                name_tag = entry.find('h2', class_='mod-Treffer__name')
-                if name_tag:
-                    data['name'] = name_tag.get_text(strip=True)
-                
-                # Extract detail URL
-                detail_link = entry.find('a', href=re.compile(r'/gsbiz/'))
-                if detail_link:
-                    href = detail_link['href']
-                    if href.startswith('http'):
-                        data['detail_url'] = href
-                    else:
-                        data['detail_url'] = self.base_url + href
-                
-                # Extract LOGO URL
-                logo_img = entry.find('img', class_='mod-Treffer__logo')
-                if logo_img and logo_img.get('src'):
-                    logo_src = logo_img['src']
-                    # Check if it's not the placeholder pixel
-                    if 'pixel.png' not in logo_src and logo_src not in ['1px', '']:
-                        # Make sure it's a full URL
-                        if logo_src.startswith('http'):
-                            data['logo_url'] = logo_src
-                        elif logo_src.startswith('/'):
-                            data['logo_url'] = self.base_url + logo_src
-                        else:
-                            data['logo_url'] = logo_src
-                
-                # Extract address
-                address_container = entry.find('address', class_='mod-AdresseKompakt')
-                if address_container:
-                    address_text_div = address_container.find('div', class_='mod-AdresseKompakt__adress-text')
-                    if address_text_div:
-                        # Get full text
-                        full_text = address_text_div.get_text(strip=True)
-                        
-                        # Extract postal code and city
-                        city_span = address_text_div.find('span', class_='mod-AdresseKompakt__adress__ort')
-                        if city_span:
-                            city_postal = city_span.get_text(strip=True)
-                            # Split postal code and city (e.g., "20354 Hamburg")
-                            parts = city_postal.split(None, 1)
-                            if len(parts) == 2:
-                                data['postal_code'] = parts[0]
-                                data['city'] = parts[1]
-                        
-                        # Extract street address (everything before the postal code)
-                        address_only = full_text
-                        if city_postal:
-                            address_only = full_text.split(city_postal)[0]
-                        # Remove trailing comma and extra spaces
-                        data['address'] = address_only.rstrip(', ').strip()
-                
-                # Extract phone
-                phone_container = entry.find('div', class_='mod-TelefonnummerKompakt')
-                if phone_container:
-                    phone_link = phone_container.find('a', class_='mod-TelefonnummerKompakt__phoneNumber')
-                    if phone_link:
-                        data['phone'] = phone_link.get_text(strip=True)
-                
-                # Extract WEBSITE URL (base64 encoded)
-                # Note: BeautifulSoup converts all HTML attributes to lowercase!
-                website_container = entry.find('div', class_='mod-WebseiteKompakt')
-                if website_container:
-                    website_span = website_container.find('span', class_='mod-WebseiteKompakt__text')
-                    if website_span:
-                        # HTML attributes are lowercase in BeautifulSoup
-                        encoded_url = website_span.get('data-webseitelink', '')
-                        if encoded_url:
-                            decoded = self.decode_base64(encoded_url)
-                            if decoded and decoded.startswith('http'):
-                                data['website'] = decoded
-                
-                # Extract email from chat button data
-                chat_button = entry.find('button', id=re.compile(r'mod-Chat__button'))
-                if chat_button and chat_button.get('data-parameters'):
-                    try:
-                        chat_data_str = chat_button['data-parameters']
-                        chat_data = json.loads(chat_data_str)
-                        if 'inboxConfig' in chat_data:
-                            organization = chat_data['inboxConfig'].get('organizationQuery', {})
-                            generic = organization.get('generic', {})
-                            if 'email' in generic:
-                                data['email'] = generic['email']
-                    except Exception as e:
-                        logger.debug(f"Error parsing chat data: {e}")
-                
-                # Extract rating
-                rating_span = entry.find('span', class_=re.compile(r'mod-BewertungKompakt__number'))
-                if rating_span:
-                    data['rating'] = rating_span.get_text(strip=True)
-                
-                # Extract review count
-                review_span = entry.find('span', class_=re.compile(r'mod-BewertungKompakt__text'))
-                if review_span:
-                    review_text = review_span.get_text(strip=True)
-                    # Extract number (e.g., "122 Bewertungen" -> "122")
-                    review_match = re.search(r'(\d+)', review_text)
-                    if review_match:
-                        data['review_count'] = review_match.group(1)
-                
-                # Extract specialties
-                specialty_tag = entry.find('p', class_=re.compile(r'mod-Treffer--besteBranche'))
-                if specialty_tag:
-                    data['specialties'] = specialty_tag.get_text(strip=True)
-                
-                # Extract description
-                desc_tag = entry.find('div', class_='mod-Treffer__freitext')
-                if desc_tag:
-                    data['description'] = desc_tag.get_text(strip=True)
-                
-                # Only add if we have at least a name
-                if data['name']:
-                    results.append(data)
-                
-            except Exception as e:
-                logger.error(f"Error parsing entry: {e}")
-                continue
+        self.last_entries_found = entries_found
+        logger.info(f"Found {entries_found} entries in this page")
         
         return results
     
@@ -283,11 +299,7 @@ class GelbeSeitenScraperComplete:
             return
         
         try:
-            fieldnames = [
-                'name', 'address', 'postal_code', 'city', 'phone', 
-                'email', 'website', 'logo_url', 'rating', 'review_count', 
-                'specialties', 'description', 'detail_url'
-            ]
+            fieldnames = FIELDNAMES
             
             with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
@@ -302,77 +314,602 @@ class GelbeSeitenScraperComplete:
         except Exception as e:
             logger.error(f"Error saving progress: {e}")
     
-    def scrape_all(self, max_results: int = None, results_per_page: int = 10, 
-                   output_file: str = None) -> List[Dict[str, str]]:
+    def _log_progress(self, total_scraped: int):
+        """Log crawl progress, as percentage when the total is known"""
+        if self.total_available > 0:
+            progress = (total_scraped / self.total_available) * 100
+            logger.info(f"Progress: {total_scraped}/{self.total_available} ({progress:.1f}%)")
+        else:
+            logger.info(f"Total scraped so far: {total_scraped}")
+        logger.debug(f"Rate limiter: {self.rate_limiter.stats()}")
+
+    def _store_scope(self) -> str:
+        """Name of this crawl in a RecordStore: search term, plus the region if set"""
+        return f"{self.search_term}@{self.location}" if self.location else self.search_term
+
+    def _start_crawl(self, results_per_page: int, journal: CrawlJournal = None,
+                     resume: bool = False) -> Optional[Tuple[int, int]]:
         """
-        Scrape all results with pagination
+        Warm up the session, or restore it from the journal when resuming
+        
+        Returns:
+            (start position, results already committed), None if the session failed
+        """
+        state = journal.state() if journal and resume else None
+        
+        if state:
+            if state['search_term'] != self.search_term:
+                raise ValueError(f"Journal {journal.filename} belongs to search term "
+                                 f"'{state['search_term']}', not '{self.search_term}'")
+            if state['results_per_page'] != results_per_page:
+                raise ValueError(f"Journal {journal.filename} was written with "
+                                 f"results_per_page={state['results_per_page']}")
+            self.session.cookies.update(state['cookies'])
+            logger.info(f"Resuming crawl at position {state['position']} "
+                        f"({state['total_scraped']} results already committed)")
+            return state['position'], state['total_scraped']
+        
+        if not self.initialize_session():
+            return None
+        if journal:
+            journal.begin(self.search_term, results_per_page,
+                          requests.utils.dict_from_cookiejar(self.session.cookies))
+        return 0, 0
+
+    def _commit_page(self, page_results: List[Dict[str, str]], position: int, next_position: int,
+                     total_scraped: int, sink: ResultSink = None, journal: CrawlJournal = None):
+        """Write a page to the sink, then record it in the journal"""
+        detail_urls = [r['detail_url'] for r in page_results]
+        if journal:
+            journal.stage_page(position, detail_urls)
+        if sink:
+            sink.write_many(page_results)
+            self.metrics.records_written.inc(len(page_results))
+        if journal:
+            # The page must be on disk before the journal says it is done
+            if sink:
+                sink.flush()
+            journal.commit_page(
+                next_position, total_scraped, requests.utils.dict_from_cookiejar(self.session.cookies)
+            )
+
+    def _retry_session(self) -> requests.Session:
+        """Session of the dead-letter retrier: the crawl's headers and cookies, its own connections"""
+        session = make_session(pool_size=1)
+        session.headers.update(self.session.headers)
+        session.cookies.update(self.session.cookies)
+        return session
+
+    def _refetch(self, session: requests.Session, position: int,
+                 anzahl: int) -> Optional[List[Dict[str, str]]]:
+        """Fetch and parse a dead-lettered page (None if it failed again)"""
+        response_data, _ = self.fetch_page_timed(position, anzahl, session)
+        if not response_data or 'html' not in response_data:
+            return None
+        # Not parse_results: the crawl loop reads last_entries_found of its own pages
+        return self._parse_html(response_data['html'], self.base_url)[1]
+
+    def _take_recovered(self, retrier: DeadLetterRetrier, sink: ResultSink = None,
+                        store: RecordStore = None, run_id: int = None,
+                        dedup: Deduplicator = None) -> List[Dict[str, str]]:
+        """Write the pages the retrier recovered since the last call, return their records"""
+        records = []
+        for position, page_results in retrier.collect():
+            if dedup:
+                page_results = list(dedup.filter(page_results))
+            self._commit_page(page_results, position, position, 0, sink)
+            if store:
+                store.upsert_page(run_id, page_results)
+            records.extend(page_results)
+        return records
+
+    def iter_results(self, max_results: int = None, results_per_page: int = 10,
+                     sink: ResultSink = None, journal: CrawlJournal = None,
+                     resume: bool = False, store: RecordStore = None,
+                     incremental: bool = False, stop_after_unchanged: int = 50,
+                     dedup: Deduplicator = None,
+                     page_size: PageSizeController = None,
+                     dead_letters: DeadLetterQueue = None) -> Iterator[Dict[str, str]]:
+        """
+        Scrape all results with pagination, yielding each record as it is parsed
+        
+        Nothing is accumulated, so memory stays flat however long the crawl runs.
         
         Args:
             max_results: Maximum number of results to fetch (None for all available)
             results_per_page: Number of results per page
-            output_file: CSV file to save results (saves every 100 results)
+            sink: Optional ResultSink every parsed page is appended to
+            journal: Optional CrawlJournal updated after every page
+            resume: Continue from the journal's last committed position
+            store: Optional RecordStore every page is upserted into (one run per call)
+            incremental: Stop once `stop_after_unchanged` known, unchanged records
+                in a row were seen (needs store; such runs never mark records removed)
+            stop_after_unchanged: Length of that run of unchanged records
+            dedup: Optional Deduplicator dropping businesses already seen (also across
+                crawls sharing it, e.g. several search terms)
+            page_size: Optional PageSizeController choosing anzahl per page (starting from
+                its own initial size); positions then advance by the entries returned
+            dead_letters: Optional DeadLetterQueue: a failed page is queued and retried in
+                the background while the crawl moves on (recovered pages are yielded out of
+                order); a crawl that reaches the end finishes with a reconciliation pass,
+                see self.missing_ranges
             
-        Returns:
-            List of all scraped results
+        Yields:
+            Scraped result dictionaries
         """
-        if not self.initialize_session():
+        started = self._start_crawl(results_per_page, journal, resume)
+        if started is None:
             logger.error("Failed to initialize session")
-            return []
+            return
         
-        position = 0
-        total_scraped = 0
+        position, total_scraped = started
+        resume_position = position if resume and journal else None
         consecutive_failures = 0
         
-        while True:
-            # Check if we've reached max_results
-            if max_results and total_scraped >= max_results:
-                logger.info(f"Reached max_results limit: {max_results}")
-                break
-            
-            # Fetch page
-            response_data = self.fetch_page(position, results_per_page)
-            
-            if not response_data:
-                consecutive_failures += 1
-                logger.warning(f"No data returned for position {position} (failure {consecutive_failures}/3)")
-                if consecutive_failures >= 3:
-                    logger.error("Too many consecutive failures, stopping.")
+        run_id = store.start_run(self._store_scope(), incremental) if store else None
+        self.last_run_id = run_id
+        reached_end = False
+        run_complete = False
+        unchanged_streak = 0
+        
+        retrier = None
+        if dead_letters:
+            if resume_position is None:
+                # Entries of earlier crawls describe those runs, not this one
+                dead_letters.clear(self._store_scope())
+            # Own session: the retrier thread never shares connections with the crawl loop
+            retry_fetch = functools.partial(self._refetch, self._retry_session())
+            retrier = DeadLetterRetrier(dead_letters, retry_fetch, self._store_scope()).start()
+        self.missing_ranges = []
+        
+        try:
+            while True:
+                if retrier:
+                    recovered = self._take_recovered(retrier, sink, store, run_id, dedup)
+                    total_scraped += len(recovered)
+                    yield from recovered
+                
+                # Check if we've reached max_results
+                if max_results and total_scraped >= max_results:
+                    logger.info(f"Reached max_results limit: {max_results}")
                     break
-                time.sleep(2)
-                continue
-            
-            consecutive_failures = 0  # Reset on success
-            
-            # Parse results
-            page_results = self.parse_results(response_data)
-            
-            if not page_results:
-                logger.info(f"No more results found at position {position}")
-                break
-            
-            self.results.extend(page_results)
-            total_scraped += len(page_results)
+                
+                # Fetch page
+                anzahl = page_size.size if page_size else results_per_page
+                self.metrics.page_size.set(anzahl)
+                response_data, request_seconds = self.fetch_page_timed(position, anzahl)
+                
+                if not response_data:
+                    consecutive_failures += 1
+                    max_retries = self.rate_limiter.max_retries
+                    logger.warning(f"No data returned for position {position} (failure {consecutive_failures}/{max_retries})")
+                    # The endpoint may cap pages below the requested size: skip only as far
+                    # as the last answered page reached, so queue and crawl cover the same range
+                    skipped = anzahl
+                    if page_size and self.last_entries_found:
+                        skipped = min(anzahl, self.last_entries_found)
+                    if dead_letters:
+                        # Leave the page to the retrier instead of holding up the crawl
+                        dead_letters.push(self._store_scope(), position, skipped, "no data returned")
+                        self.metrics.dead_letters.inc()
+                    if consecutive_failures >= max_retries:
+                        logger.error("Too many consecutive failures, stopping.")
+                        break
+                    if page_size:
+                        page_size.record_failure()
+                    if dead_letters:
+                        position += skipped
+                        continue
+                    self.metrics.retries.inc()
+                    time.sleep(self.rate_limiter.backoff_delay(consecutive_failures))
+                    continue
+                
+                consecutive_failures = 0  # Reset on success
+                if dead_letters:
+                    dead_letters.resolve(self._store_scope(), position)
+                
+                # Parse results
+                page_results = self.parse_results(response_data)
+                step = results_per_page
+                if page_size:
+                    page_size.record(position, anzahl, self.last_entries_found,
+                                     request_seconds, self.total_available)
+                    step = self.last_entries_found
+                    if self.cache and page_results and step != anzahl:
+                        # Lets reparse() follow the crawl past the truncated page
+                        self.cache.link(self.search_term, position, anzahl, position + step,
+                                        self.sortierung, self.location)
+                
+                if not page_results:
+                    logger.info(f"No more results found at position {position}")
+                    reached_end = True
+                    # A resumed run has not seen the pages committed before the crash,
+                    # so it must not mark their records removed
+                    run_complete = not resume_position
+                    if journal:
+                        journal.mark_completed()
+                    break
+                
+                # A crash between sink write and journal commit leaves this page in the output
+                if position == resume_position:
+                    page_results = journal.drop_replayed(position, page_results)
+                if dedup:
+                    page_results = list(dedup.filter(page_results))
+                
+                total_scraped += len(page_results)
+                self._log_progress(total_scraped)
+                
+                # Append the page to the output before handing it out
+                self._commit_page(page_results, position, position + step,
+                                  total_scraped, sink, journal)
+                if store:
+                    for status in store.upsert_page(run_id, page_results):
+                        if status == UNCHANGED:
+                            unchanged_streak += 1
+                        elif status != DUPLICATE:
+                            unchanged_streak = 0
+                yield from page_results
+                
+                if incremental and unchanged_streak >= stop_after_unchanged:
+                    logger.info(f"{unchanged_streak} known, unchanged records in a row - "
+                                f"stopping incremental crawl at position {position}")
+                    break
+                
+                # Move to next page (pacing is done by the rate limiter in fetch_page)
+                position += step
             
-            # Log progress
-            if self.total_available > 0:
-                progress = (total_scraped / self.total_available) * 100
-                logger.info(f"Progress: {total_scraped}/{self.total_available} ({progress:.1f}%)")
-            else:
-                logger.info(f"Total scraped so far: {total_scraped}")
+            if retrier and reached_end:
+                # Only a crawl that reached the end waits for its queued pages;
+                # max_results/incremental stops leave them pending for a resumed run
+                self.missing_ranges = retrier.reconcile()
+                recovered = self._take_recovered(retrier, sink, store, run_id, dedup)
+                total_scraped += len(recovered)
+                yield from recovered
+                # Pages that stayed missing may hold records that still exist
+                run_complete = run_complete and not self.missing_ranges
+            elif retrier:
+                retrier.stop()
+                self.missing_ranges = dead_letters.missing_ranges(self._store_scope())
+        finally:
+            if retrier:
+                retrier.stop()
+            if store:
+                store.finish_run(run_id, complete=run_complete)
+        
+        logger.info(f"Scraping complete. Total results: {total_scraped}")
+    
+    def _open_outputs(self, output_file: str, sink: ResultSink, journal_file: str,
+                      resume: bool) -> Tuple[Optional[ResultSink], Optional[CrawlJournal]]:
+        """Create the sink and journal scrape_all/scrape_all_async were asked for"""
+        if resume and not journal_file:
+            if not output_file:
+                raise ValueError("resume=True needs a journal_file or an output_file")
+            journal_file = f"{output_file}.journal"
+        if journal_file and (isinstance(sink, ParquetSink) or
+                             (sink is None and output_file and Path(output_file).suffix.lower() == '.parquet')):
+            # Row groups are buffered and the footer is only written on close, so the
+            # journal would mark pages done that are not on disk, and resume cannot append
+            raise ValueError("Parquet output cannot be journaled or resumed - write .csv or .jsonl "
+                             "and convert it afterwards (gelbeseiten_sinks.py)")
+        journal = CrawlJournal(journal_file) if journal_file else None
+        if sink is None and output_file:
+            sink = open_sink(output_file, append=resume)
+        return sink, journal
+
+    def scrape_all(self, max_results: int = None, results_per_page: int = 10, 
+                   output_file: str = None, sink: ResultSink = None,
+                   keep_results: bool = True, journal_file: str = None,
+                   resume: bool = False, store: RecordStore = None,
+                   incremental: bool = False, stop_after_unchanged: int = 50,
+                   delta_file: str = None, dedup: Deduplicator = None,
+                   page_size: PageSizeController = None,
+                   dead_letters: DeadLetterQueue = None) -> List[Dict[str, str]]:
+        """
+        Scrape all results with pagination
+        
+        Args:
+            max_results: Maximum number of results to fetch (None for all available)
+            results_per_page: Number of results per page
+            output_file: File every page is appended to (.csv, .jsonl or .parquet)
+            sink: ResultSink to write to instead of output_file
+            keep_results: Collect results in self.results (disable for huge crawls)
+            journal_file: SQLite journal recording the crawl position after every page
+                (not with .parquet output - it is only complete once closed)
+            resume: Continue an interrupted crawl from the journal
+                (default journal: <output_file>.journal)
+            store: RecordStore to upsert every page into
+            incremental: Stop paging after `stop_after_unchanged` known, unchanged records
+            stop_after_unchanged: Unchanged records in a row that end an incremental crawl
+            delta_file: Export what this run added/changed/removed (needs store)
+            dedup: Deduplicator filtering repeated businesses before they are written
+            page_size: PageSizeController negotiating anzahl (results_per_page is then ignored,
+                except as the page size recorded in the journal)
+            dead_letters: DeadLetterQueue for pages that fail; the crawl moves on and
+                self.missing_ranges lists what the final reconciliation could not recover
             
-            # Save progress every 100 results
-            if output_file and total_scraped % 100 == 0:
-                self.save_progress(output_file)
+        Returns:
+            List of all scraped results (only those of this run when resuming)
+        """
+        if (incremental or delta_file) and not store:
+            raise ValueError("incremental crawls and delta exports need a store")
+        own_sink = sink is None and output_file
+        sink, journal = self._open_outputs(output_file, sink, journal_file, resume)
+        
+        try:
+            for result in self.iter_results(max_results, results_per_page, sink, journal, resume,
+                                            store, incremental, stop_after_unchanged, dedup,
+                                            page_size, dead_letters):
+                if keep_results:
+                    self.results.append(result)
+        finally:
+            if own_sink:
+                sink.close()
+            if journal:
+                journal.close()
+        
+        if delta_file and self.last_run_id:
+            changes = store.export_delta(self.last_run_id, delta_file)
+            logger.info(f"Delta of run {self.last_run_id}: {changes} changes written to {delta_file}")
+        
+        return self.results
+
+    def reparse(self, output_file: str = None, sink: ResultSink = None,
+                keep_results: bool = True) -> List[Dict[str, str]]:
+        """
+        Rebuild the results from the response cache alone - no network
+        
+        Walks the cached pages from position 0 the way the crawl did (a page
+        of size n is followed by the page at position + n) and parses them
+        with the current parser backend, one page in memory at a time.
+        
+        Args:
+            output_file: File the results are written to (.csv, .jsonl or .parquet)
+            sink: ResultSink to write to instead of output_file
+            keep_results: Collect results in self.results
             
-            # Move to next page
-            position += results_per_page
+        Returns:
+            List of all parsed results
+        """
+        if not self.cache:
+            raise ValueError("reparse needs a scraper created with cache=ResponseCache(...)")
+        
+        own_sink = sink is None and output_file
+        if own_sink:
+            sink = open_sink(output_file)
+        
+        total_parsed = 0
+        try:
+            for position, anzahl, payload in self.cache.pages(self.search_term, self.sortierung,
+                                                              self.location):
+                page_results = self.parse_results(payload)
+                if not page_results:
+                    break
+                total_parsed += len(page_results)
+                if sink:
+                    sink.write_many(page_results)
+                if keep_results:
+                    self.results.extend(page_results)
+        finally:
+            if own_sink:
+                sink.close()
+        
+        logger.info(f"Reparse complete. Total results: {total_parsed}")
+        return self.results
+
+    def scrape_all_pipelined(self, max_results: int = None, results_per_page: int = 10,
+                             output_file: str = None, sink: ResultSink = None,
+                             keep_results: bool = True, parse_workers: int = None,
+                             queue_size: int = 16, ordered: bool = True) -> List[Dict[str, str]]:
+        """
+        Scrape all results with fetching and parsing running side by side
+        
+        A fetch thread queues raw pages, a process pool parses them (see
+        gelbeseiten_pipeline.ParsePipeline). With ordered=True the result
+        list is the same as the one scrape_all produces.
+        
+        Args:
+            max_results: Maximum number of results to fetch (None for all available)
+            results_per_page: Number of results per page
+            output_file: File every page is appended to (.csv, .jsonl or .parquet)
+            sink: ResultSink to write to instead of output_file
+            keep_results: Collect results in self.results (disable for huge crawls)
+            parse_workers: Parser processes (default: all cores)
+            queue_size: Raw pages allowed to wait for a parser (backpressure)
+            ordered: Emit pages in position order (False: as soon as they are parsed)
             
-            # Be respectful with rate limiting
-            time.sleep(1)
+        Returns:
+            List of all scraped results
+        """
+        own_sink = sink is None and output_file
+        if own_sink:
+            sink = open_sink(output_file)
+        
+        pipeline = ParsePipeline(self, parse_workers, queue_size, ordered)
+        try:
+            for result in pipeline.run(max_results, results_per_page, sink):
+                if keep_results:
+                    self.results.append(result)
+        finally:
+            if own_sink:
+                sink.close()
         
-        logger.info(f"Scraping complete. Total results: {len(self.results)}")
         return self.results
-    
+
+    def _fetch_with_retries(self, position: int, anzahl: int) -> Optional[Dict]:
+        """Fetch one page, retrying like the sync loop does (None if all attempts failed)"""
+        max_retries = self.rate_limiter.max_retries
+        for attempt in range(1, max_retries + 1):
+            response_data = self.fetch_page(position, anzahl)
+            if response_data:
+                return response_data
+            logger.warning(f"No data returned for position {position} (failure {attempt}/{max_retries})")
+            if attempt < max_retries:
+                self.metrics.retries.inc()
+                time.sleep(self.rate_limiter.backoff_delay(attempt))
+        return None
+
+    def _fetch_and_parse(self, position: int, anzahl: int) -> Tuple[int, List[Dict[str, str]]]:
+        """
+        Fetch and parse one page
+
+        Returns:
+            (position, page_results) - page_results is None if all attempts failed
+        """
+        response_data = self._fetch_with_retries(position, anzahl)
+        if response_data is None:
+            return position, None
+        return position, self.parse_results(response_data)
+
+    async def scrape_all_async(self, max_results: int = None, results_per_page: int = 10,
+                               output_file: str = None, concurrency: int = 4,
+                               requests_per_second: float = None, sink: ResultSink = None,
+                               keep_results: bool = True, journal_file: str = None,
+                               resume: bool = False) -> List[Dict[str, str]]:
+        """
+        Scrape all results with up to `concurrency` page requests in flight
+
+        Pages are fetched with the regular fetch_page/parse_results in a thread
+        pool over a shared connection pool and committed strictly in position
+        order, so the result list is the same as the one scrape_all produces.
+        All in-flight requests share self.rate_limiter.
+
+        Args:
+            max_results: Maximum number of results to fetch (None for all available)
+            results_per_page: Number of results per page
+            output_file: File every page is appended to (.csv, .jsonl or .parquet)
+            concurrency: Number of page requests kept in flight
+            requests_per_second: Start rate for the shared rate limiter (None keeps it)
+            sink: ResultSink to write to instead of output_file
+            keep_results: Collect results in self.results (disable for huge crawls)
+            journal_file: SQLite journal recording the crawl position after every page
+                (not with .parquet output - it is only complete once closed)
+            resume: Continue an interrupted crawl from the journal
+                (default journal: <output_file>.journal)
+
+        Returns:
+            List of all scraped results (only those of this run when resuming)
+        """
+        loop = asyncio.get_running_loop()
+        if requests_per_second:
+            self.rate_limiter.rate = requests_per_second
+
+        # One pooled connection per in-flight request
+        tune_session(self.session, pool_size=concurrency)
+
+        own_sink = sink is None and output_file
+        sink, journal = self._open_outputs(output_file, sink, journal_file, resume)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            started = await loop.run_in_executor(
+                executor, self._start_crawl, results_per_page, journal, resume
+            )
+            if started is None:
+                logger.error("Failed to initialize session")
+                if own_sink:
+                    sink.close()
+                if journal:
+                    journal.close()
+                return []
+
+            def fetch(position: int):
+                # fetch_page waits for the shared rate limiter inside the worker thread
+                return loop.run_in_executor(
+                    executor, self._fetch_and_parse, position, results_per_page
+                )
+
+            pending = {}  # position -> task, in scheduling order
+            finished = {}  # position -> page results (None on failure)
+            next_position, total_scraped = started
+            commit_position = next_position
+            resume_position = next_position if resume and journal else None
+            done_scraping = False
+
+            try:
+                while not done_scraping:
+                    # Keep the window full, but only speculate as far as max_results needs
+                    while len(pending) < concurrency:
+                        expected = total_scraped + (len(pending) + len(finished)) * results_per_page
+                        if max_results and expected >= max_results:
+                            break
+                        pending[next_position] = asyncio.ensure_future(fetch(next_position))
+                        next_position += results_per_page
+
+                    if not pending:
+                        break
+
+                    self.metrics.queue_depth.set(len(pending), queue='in_flight')
+                    self.metrics.queue_depth.set(len(finished), queue='commit')
+                    done, _ = await asyncio.wait(pending.values(), return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        position, page_results = task.result()
+                        del pending[position]
+                        finished[position] = page_results
+
+                    # Commit finished pages in position order
+                    while commit_position in finished:
+                        page_results = finished.pop(commit_position)
+
+                        if page_results is None:
+                            logger.error("Too many consecutive failures, stopping.")
+                            done_scraping = True
+                            break
+                        if not page_results:
+                            logger.info(f"No more results found at position {commit_position}")
+                            if journal:
+                                journal.mark_completed()
+                            done_scraping = True
+                            break
+
+                        if commit_position == resume_position:
+                            page_results = journal.drop_replayed(commit_position, page_results)
+
+                        total_scraped += len(page_results)
+                        self._log_progress(total_scraped)
+
+                        self._commit_page(page_results, commit_position,
+                                          commit_position + results_per_page,
+                                          total_scraped, sink, journal)
+                        commit_position += results_per_page
+                        if keep_results:
+                            self.results.extend(page_results)
+
+                        if max_results and total_scraped >= max_results:
+                            logger.info(f"Reached max_results limit: {max_results}")
+                            done_scraping = True
+                            break
+            finally:
+                # Pages past the end are speculative - drop them
+                for task in pending.values():
+                    task.cancel()
+                if pending:
+                    await asyncio.gather(*pending.values(), return_exceptions=True)
+                if own_sink:
+                    sink.close()
+                if journal:
+                    journal.close()
+
+        logger.info(f"Scraping complete. Total results: {total_scraped}")
+        return self.results
+
+    def export_to_parquet(self, filename: str = "gelbeseiten.parquet", compression: str = 'zstd'):
+        """
+        Export scraped results to Parquet with typed columns (requires pyarrow)
+        
+        rating is a float, review_count an int, city/postal_code are
+        dictionary-encoded and empty fields are null.
+        
+        Args:
+            filename: Output Parquet filename
+            compression: Parquet codec (zstd, snappy, gzip, none)
+        """
+        if not self.results:
+            logger.warning("No results to export")
+            return
+        
+        with ParquetSink(filename, compression=compression) as sink:
+            sink.write_many(self.results)
+        logger.info(f"Successfully exported {len(self.results)} results to {filename}")
+
     def export_to_csv(self, filename: str = "gelbeseiten.csv"):
         """
         Export scraped results to CSV
@@ -385,11 +922,7 @@ class GelbeSeitenScraperComplete:
             return
         
         try:
-            fieldnames = [
-                'name', 'address', 'postal_code', 'city', 'phone', 
-                'email', 'website', 'logo_url', 'rating', 'review_count', 
-                'specialties', 'description', 'detail_url'
-            ]
+            fieldnames = FIELDNAMES
             
             with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
@@ -402,9 +935,8 @@ class GelbeSeitenScraperComplete:
             logger.info(f"Successfully exported {len(self.results)} results to {filename}")
             
             # Print statistics
-            emails_found = sum(1 for r in self.results if r.get('email'))
-            websites_found = sum(1 for r in self.results if r.get('website'))
-            logos_found = sum(1 for r in self.results if r.get('logo_url'))
+            stats = coverage_stats(self.results)
+            emails_found, websites_found, logos_found = stats['email'], stats['website'], stats['logo_url']
             
             print(f"\n{'='*70}")
             print("SCRAPING STATISTICS")
@@ -451,7 +983,7 @@ def main():
         print(f"\n➜ Test mode: Scraping first {max_results} results")
     elif choice == "2":
         print("\n➜ Full scrape mode: This will scrape ALL available results.")
-        print("   This may take several hours. Progress will be saved every 100 results.")
+        print("   This may take several hours. Every page is appended to the output file right away.")
         confirm = input("   Continue? (yes/no) [no]: ").strip().lower()
         if confirm != "yes":
             print("Cancelled.")
@@ -469,21 +1001,43 @@ def main():
     # Output file (with search term in filename)
     safe_search_term = search_term.replace(" ", "_").replace("/", "_")
     output_file = f"gelbeseiten_{safe_search_term}.csv"
+    journal_file = f"{output_file}.journal"
+    
+    # Offer to continue an interrupted crawl
+    resume = False
+    if Path(journal_file).exists() and Path(output_file).exists():
+        with CrawlJournal(journal_file) as journal:
+            state = journal.state()
+        if state and not state['completed'] and state['search_term'] == search_term:
+            print(f"➜ Unterbrochener Lauf gefunden: {state['total_scraped']} Einträge bis Position {state['position']}")
+            resume = input("   Fortsetzen? (yes/no) [yes]: ").strip().lower() in ("", "yes")
+            print()
     
     # Start scraping
     print("Starting scraper...")
     print()
     
-    results = scraper.scrape_all(
-        max_results=max_results, 
-        results_per_page=10,
-        output_file=output_file
-    )
+    # Failed pages are retried in the background instead of stopping the crawl
+    with DeadLetterQueue(f"{output_file}.deadletters") as dead_letters:
+        results = scraper.scrape_all(
+            max_results=max_results, 
+            results_per_page=10,
+            output_file=output_file,
+            journal_file=journal_file,
+            resume=resume,
+            page_size=PageSizeController(initial=10, maximum=100),
+            dead_letters=dead_letters
+        )
+    if scraper.missing_ranges:
+        ranges = ', '.join(f"{start}-{end - 1}" for start, end in scraper.missing_ranges)
+        print(f"⚠ Positionen ohne Ergebnis (Seiten dauerhaft fehlgeschlagen): {ranges}")
     
-    # Export to CSV
-    if results:
+    # Export to CSV (a resumed run only holds its own results - the file is already complete)
+    if results and not resume:
         scraper.export_to_csv(output_file)
         print(f"✓ Done! Results saved to: {output_file}")
+    elif results:
+        print(f"✓ Done! {len(results)} more results appended to: {output_file}")
     else:
         print("✗ No results were scraped")
 
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Local scrape job service for the Gelbe Seiten Scraper
+A long-running HTTP server on localhost that queues scrape jobs, runs them on a
+shared worker pool (one rate budget for all jobs) and streams every record as
+NDJSON while the crawl is still running
+
+Endpoints:
+    POST   /jobs                 {"term": "steuerberater", "location": "Hamburg",
+                                  "max_results": 500, "format": "csv"} -> job status
+    GET    /jobs                 status of all jobs
+    GET    /jobs/<id>            status of one job
+    GET    /jobs/<id>/results    NDJSON records, follows the crawl until the job ends
+                                 (?offset=N skips the first N, ?follow=0 returns what is there)
+    DELETE /jobs/<id>            cancel a queued or running job
+
+Usage:
+    python3 gelbeseiten_service.py --port 8765 --workers 2 --rate 1 --output-dir jobs
+    curl -s -X POST localhost:8765/jobs -d '{"term": "steuerberater", "max_results": 100}'
+    curl -sN localhost:8765/jobs/<id>/results
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from gelbeseiten_metrics import CrawlMetrics, MetricsServer
+from gelbeseiten_ratelimit import RateLimiter
+from gelbeseiten_shards import safe_name
+from gelbeseiten_sinks import open_sink, read_records
+
+logger = logging.getLogger(__name__)
+
+# Output files a job can write besides the NDJSON stream (None: stream only)
+OUTPUT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+# Largest anzahl a job may request (the default maximum of PageSizeController)
+MAX_RESULTS_PER_PAGE = 100
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class ScrapeJob:
+    """
+    One scrape request and the records it produced so far
+
+    Records are kept as encoded NDJSON lines, so any number of readers can
+    stream them from any offset while the crawl appends. Once a job with an
+    output file has finished, the lines are dropped and readers are served
+    from the file instead.
+
+    Args:
+        term: Search term
+        location: WO parameter (None searches bundesweit)
+        max_results: Stop after this many records (None for all)
+        output_format: Also write an output file ('csv', 'jsonl', 'parquet' or None)
+        results_per_page: Page size requested from ajaxsuche
+    """
+
+    def __init__(self, term: str, location: str = None, max_results: int = None,
+                 output_format: str = None, results_per_page: int = 10):
+        if not term or not str(term).strip():
+            raise ValueError("term is required")
+        if output_format and output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(OUTPUT_FORMATS)}")
+        if max_results is not None and int(max_results) < 1:
+            raise ValueError("max_results must be positive")
+        if not 1 <= int(results_per_page) <= MAX_RESULTS_PER_PAGE:
+            raise ValueError(f"results_per_page must be between 1 and {MAX_RESULTS_PER_PAGE}")
+        self.job_id = uuid.uuid4().hex[:12]
+        self.term = str(term).strip()
+        self.location = location or None
+        self.max_results = int(max_results) if max_results else None
+        self.output_format = output_format or None
+        self.results_per_page = int(results_per_page)
+        self.output_file: Optional[str] = None
+        self.status = QUEUED
+        self.error = ''
+        self.total_available = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lines: Optional[List[bytes]] = []
+        self._count = 0
+        self._changed = threading.Condition()
+        self._cancel = threading.Event()
+
+    @property
+    def records(self) -> int:
+        return self._count
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> bool:
+        """Ask the job to stop (a queued job never starts); False if it already ended"""
+        with self._changed:
+            if self.status in FINISHED:
+                return False
+            self._cancel.set()
+            if self.status == QUEUED:
+                self._finish(CANCELLED)
+            return True
+
+    def add_many(self, records: List[Dict[str, str]]):
+        lines = [(json.dumps(dict(record), ensure_ascii=False) + '\n').encode('utf-8')
+                 for record in records]
+        with self._changed:
+            self._lines.extend(lines)
+            self._count += len(lines)
+            self._changed.notify_all()
+
+    def start(self) -> bool:
+        """Mark the job running, False if it was cancelled while queued"""
+        with self._changed:
+            if self.status != QUEUED:
+                return False
+            self.status = RUNNING
+            self.started_at = time.time()
+            self._changed.notify_all()
+            return True
+
+    def finish(self, status: str, error: str = ''):
+        with self._changed:
+            self._finish(status, error)
+
+    def _finish(self, status: str, error: str = ''):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self._changed.notify_all()
+
+    def release_lines(self):
+        """Drop the in-memory lines of a finished job whose output file is complete"""
+        with self._changed:
+            if self.status in FINISHED and self.output_file and Path(self.output_file).exists():
+                self._lines = None
+
+    def wait_for_lines(self, offset: int, timeout: float = 1.0) -> Tuple[Optional[List[bytes]], bool]:
+        """
+        NDJSON lines from `offset` on, waiting up to `timeout` for new ones
+
+        Returns:
+            (lines, True once the job has ended and no lines are left);
+            lines is None when they were released - read saved_lines() instead
+        """
+        with self._changed:
+            if self._lines is None:
+                return None, True
+            if offset >= len(self._lines) and self.status not in FINISHED:
+                self._changed.wait(timeout)
+            lines = self._lines[offset:]
+            return lines, not lines and self.status in FINISHED
+
+    def saved_lines(self, offset: int = 0) -> Iterator[bytes]:
+        """NDJSON lines of the output file from `offset` on"""
+        if self.output_format == 'parquet':
+            import pyarrow.parquet as pq
+
+            records = (row for batch in pq.ParquetFile(self.output_file).iter_batches()
+                       for row in batch.to_pylist())
+        else:
+            records = read_records(self.output_file)
+        for record in itertools.islice(records, offset, None):
+            yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.job_id,
+            'term': self.term,
+            'location': self.location,
+            'max_results': self.max_results,
+            'format': self.output_format,
+            'status': self.status,
+            'records': self.records,
+            'total_available': self.total_available,
+            'output_file': self.output_file,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Job queue plus a pool of worker threads running GelbeSeitenScraperComplete
+
+    All jobs share one RateLimiter and one CrawlMetrics, so running several
+    jobs at once never exceeds the configured request rate. Finished jobs are
+    forgotten after `finished_ttl` seconds or beyond the newest
+    `max_finished_jobs` (their output files stay on disk).
+
+    Args:
+        workers: Jobs crawled at the same time
+        output_dir: Directory for the output files of jobs with a format
+        rate_limiter: Shared RateLimiter (default: RateLimiter())
+        metrics: Shared CrawlMetrics (default: a new one)
+        scraper_kwargs: Extra GelbeSeitenScraperComplete arguments (base_url, parser, cache, ...)
+        max_finished_jobs: Finished jobs kept for status and results
+        finished_ttl: Seconds a finished job is kept
+    """
+
+    def __init__(self, workers: int = 2, output_dir: str = "jobs", rate_limiter: RateLimiter = None,
+                 metrics: CrawlMetrics = None, scraper_kwargs: Dict = None,
+                 max_finished_jobs: int = 100, finished_ttl: float = 24 * 3600):
+        self.max_finished_jobs = max_finished_jobs
+        self.finished_ttl = finished_ttl
+        self.output_dir = Path(output_dir)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.metrics = metrics or CrawlMetrics()
+        self.scraper_kwargs = scraper_kwargs or {}
+        self.jobs: Dict[str, ScrapeJob] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[ScrapeJob]]" = queue.Queue()
+        self._threads = [threading.Thread(target=self._work, name=f"scrape-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, term: str, location: str = None, max_results: int = None,
+               output_format: str = None, results_per_page: int = 10) -> ScrapeJob:
+        """Queue a job (ValueError for invalid parameters)"""
+        job = ScrapeJob(term, location, max_results, output_format, results_per_page)
+        if job.output_format:
+            name = safe_name(job.term) + (f"__{safe_name(job.location)}" if job.location else '')
+            job.output_file = str(self.output_dir / f"{job.job_id}_{name}.{job.output_format}")
+        with self._lock:
+            self._prune()
+            self.jobs[job.job_id] = job
+        self._queue.put(job)
+        logger.info(f"Queued job {job.job_id}: '{job.term}'")
+        return job
+
+    def _prune(self):
+        """Forget expired finished jobs and all but the newest max_finished_jobs (holding _lock)"""
+        expired = time.time() - self.finished_ttl
+        finished = sorted((job for job in self.jobs.values() if job.status in FINISHED),
+                          key=lambda job: job.finished_at)
+        excess = len(finished) - self.max_finished_jobs
+        for i, job in enumerate(finished):
+            if i < excess or job.finished_at < expired:
+                del self.jobs[job.job_id]
+
+    def get(self, job_id: str) -> Optional[ScrapeJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[ScrapeJob]:
+        with self._lock:
+            self._prune()
+            return list(self.jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[ScrapeJob]:
+        job = self.get(job_id)
+        if job and job.cancel():
+            logger.info(f"Cancelling job {job_id}")
+        return job
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.start():
+                self._run(job)
+
+    def _run(self, job: ScrapeJob):
+        from gelbeseiten_scraper import GelbeSeitenScraperComplete
+
+        sink = None
+        try:
+            scraper = GelbeSeitenScraperComplete(
+                search_term=job.term, location=job.location, rate_limiter=self.rate_limiter,
+                metrics=self.metrics, **self.scraper_kwargs
+            )
+            if job.output_file:
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                sink = open_sink(job.output_file)
+            records = scraper.iter_results(job.max_results, job.results_per_page, sink=sink)
+            try:
+                # Cancellation takes effect between records, i.e. after the page in flight
+                for record in records:
+                    job.total_available = scraper.total_available
+                    job.add_many([record])
+                    if job.cancel_requested:
+                        break
+            finally:
+                records.close()
+            status, error = (CANCELLED if job.cancel_requested else DONE), ''
+        except Exception as e:
+            logger.exception(f"Job {job.job_id} failed")
+            status, error = FAILED, str(e)
+        try:
+            if sink:
+                sink.close()
+        except Exception as e:
+            logger.exception(f"Job {job.job_id}: closing {job.output_file} failed")
+            status, error = FAILED, error or str(e)
+        job.finish(status, error)
+        if status != FAILED:
+            job.release_lines()
+        logger.info(f"Job {job.job_id} {job.status}: {job.records} records")
+
+    def close(self):
+        """Cancel every job and stop the workers"""
+        for job in self.list():
+            job.cancel()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ScrapeService:
+    """
+    HTTP front end of a JobManager (see the module docstring for the endpoints)
+
+    Args:
+        manager: JobManager running the jobs
+        host: Interface to bind (default: localhost only)
+        port: Port (0 picks a free one)
+    """
+
+    def __init__(self, manager: JobManager, host: str = '127.0.0.1', port: int = 8765):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        manager = self.manager
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, data):
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _route(self) -> Tuple[List[str], Dict[str, List[str]]]:
+                url = urlparse(self.path)
+                return [part for part in url.path.split('/') if part], parse_qs(url.query)
+
+            def _job(self, job_id: str) -> Optional[ScrapeJob]:
+                job = manager.get(job_id)
+                if job is None:
+                    self._send_json(404, {'error': f"no job {job_id}"})
+                return job
+
+            def do_GET(self):
+                parts, query = self._route()
+                if parts == ['jobs']:
+                    self._send_json(200, [job.to_dict() for job in manager.list()])
+                elif len(parts) == 2 and parts[0] == 'jobs':
+                    job = self._job(parts[1])
+                    if job:
+                        self._send_json(200, job.to_dict())
+                elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'results':
+                    job = self._job(parts[1])
+                    if not job:
+                        return
+                    try:
+                        offset = int(query.get('offset', ['0'])[0])
+                        if offset < 0:
+                            raise ValueError(f"offset must not be negative: {offset}")
+                    except ValueError as e:
+                        self._send_json(400, {'error': str(e)})
+                        return
+                    self._stream(job, offset, query.get('follow', ['1'])[0] not in ('0', 'false'))
+                else:
+                    self._send_json(404, {'error': 'not found'})
+
+            def _stream(self, job: ScrapeJob, offset: int, follow: bool):
+                # No Content-Length: the body ends when the connection closes
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    while True:
+                        lines, ended = job.wait_for_lines(offset, timeout=1.0 if follow else 0)
+                        if lines is None:
+                            for line in job.saved_lines(offset):
+                                self.wfile.write(line)
+                            break
+                        if lines:
+                            self.wfile.write(b''.join(lines))
+                            self.wfile.flush()
+                            offset += len(lines)
+                        elif ended or not follow:
+                            break
+                except (BrokenPipeError, ConnectionResetError):
+                    logger.debug(f"Reader of job {job.job_id} disconnected")
+
+            def do_POST(self):
+                parts, _ = self._route()
+                if parts != ['jobs']:
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                    job = manager.submit(
+                        request.get('term'), request.get('location'), request.get('max_results'),
+                        request.get('format'), request.get('results_per_page', 10)
+                    )
+                except (ValueError, TypeError, AttributeError) as e:
+                    self._send_json(400, {'error': str(e)})
+                    return
+                self._send_json(202, job.to_dict())
+
+            def do_DELETE(self):
+                parts, _ = self._route()
+                if len(parts) != 2 or parts[0] != 'jobs':
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                job = self._job(parts[1])
+                if job:
+                    manager.cancel(job.job_id)
+                    self._send_json(200, job.to_dict())
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Scrape service at {self.url}/jobs")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Gelbe Seiten scrape jobs over local HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2, help="Jobs crawled at the same time")
+    parser.add_argument('--rate', type=float, default=1.0, help="Requests per second across all jobs")
+    parser.add_argument('--output-dir', default='jobs', help="Output files of jobs with a format")
+    parser.add_argument('--parser', default='auto', choices=['auto', 'soup', 'lxml'])
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on this port")
+    args = parser.parse_args()
+
+    metrics = CrawlMetrics()
+    manager = JobManager(args.workers, args.output_dir, RateLimiter(rate=args.rate), metrics,
+                         scraper_kwargs={'parser': args.parser})
+    metrics_server = MetricsServer(metrics.registry, port=args.metrics_port).start() if args.metrics_port else None
+    with manager, ScrapeService(manager, args.host, args.port) as service:
+        print(f"✓ Scrape service at {service.url}/jobs (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    if metrics_server:
+        metrics_server.stop()
+
+
+if __name__ == "__main__":
+    main()
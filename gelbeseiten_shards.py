@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Sharded crawl of one search term by region for the Gelbe Seiten Scraper
+Splits the bundesweit result list into regional WO sub-queries, crawls them in parallel,
+merges with entity-level dedup and reports coverage against the bundesweit total
+
+Usage:
+    python3 gelbeseiten_shards.py steuerberater --workers 4 --output gelbeseiten_steuerberater.csv
+    # Spread over 3 machines sharing the shard directory, then merge once:
+    python3 gelbeseiten_shards.py steuerberater --shard-index 0 --shard-count 3
+    python3 gelbeseiten_shards.py steuerberater --merge-only --output gelbeseiten_steuerberater.csv
+    # Continue after an interruption:
+    python3 gelbeseiten_shards.py steuerberater --resume --output gelbeseiten_steuerberater.csv
+"""
+
+import argparse
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from gelbeseiten_dedup import Deduplicator
+from gelbeseiten_ratelimit import RateLimiter
+from gelbeseiten_sinks import open_sink, read_records
+
+logger = logging.getLogger(__name__)
+
+# The 16 Bundesländer partition Germany, so together they cover the bundesweit list
+BUNDESLAENDER = [
+    'baden-württemberg', 'bayern', 'berlin', 'brandenburg', 'bremen', 'hamburg',
+    'hessen', 'mecklenburg-vorpommern', 'niedersachsen', 'nordrhein-westfalen',
+    'rheinland-pfalz', 'saarland', 'sachsen', 'sachsen-anhalt', 'schleswig-holstein',
+    'thüringen',
+]
+
+
+def plz_regions(digits: int = 2) -> List[str]:
+    """PLZ prefixes as regions: '0'..'9' (Zonen) or '01'..'99' (Leitregionen)"""
+    if digits == 1:
+        return [str(d) for d in range(10)]
+    return [f"{d:02d}" for d in range(1, 100)]
+
+
+def safe_name(text: str) -> str:
+    return text.replace(" ", "_").replace("/", "_")
+
+
+def shard_file(output_dir: str, search_term: str, location: str) -> Path:
+    return Path(output_dir) / f"{safe_name(search_term)}__{safe_name(location)}.jsonl"
+
+
+def plan_shards(regions: Iterable[str] = None, shard_index: int = 0,
+                shard_count: int = 1) -> List[str]:
+    """
+    Regions this worker is responsible for
+
+    Args:
+        regions: WO values to split by (default: the 16 Bundesländer)
+        shard_index: This machine's index (0-based)
+        shard_count: Number of machines sharing the crawl
+    """
+    regions = list(regions or BUNDESLAENDER)
+    return regions[shard_index::shard_count]
+
+
+def crawl_shard(search_term: str, location: str, output_dir: str, max_results: int = None,
+                results_per_page: int = 10, requests_per_second: float = 1.0,
+                scraper_kwargs: Dict = None, resume: bool = False) -> Dict:
+    """
+    Crawl one region into <output_dir>/<term>__<region>.jsonl
+
+    Runs in a worker process, so it builds its own scraper and session.
+    Every run journals its progress to <shard file>.journal; with `resume` an
+    interrupted shard continues from there instead of starting over.
+    """
+    from gelbeseiten_scraper import GelbeSeitenScraperComplete
+
+    scraper = GelbeSeitenScraperComplete(
+        search_term=search_term, location=location,
+        rate_limiter=RateLimiter(rate=requests_per_second), **(scraper_kwargs or {})
+    )
+    output_file = shard_file(output_dir, search_term, location)
+    results = scraper.scrape_all(
+        max_results=max_results, results_per_page=results_per_page,
+        output_file=str(output_file), keep_results=False,
+        journal_file=f"{output_file}.journal", resume=resume
+    )
+    del results
+    return {
+        'location': location,
+        'output_file': str(output_file),
+        'total_available': scraper.total_available,
+    }
+
+
+def merge_shards(shard_files: Iterable[str], output_file: str) -> Dict:
+    """
+    Merge shard outputs into one file, keeping the first record of every business
+
+    Shards overlap at region borders; duplicates are found with the Deduplicator
+    (same detail_url, PLZ + phone, or PLZ + similar name).
+
+    Returns:
+        Counts per shard plus merged/duplicate totals
+    """
+    dedup = Deduplicator()
+    shard_counts = {}
+
+    with open_sink(output_file) as sink:
+        for filename in shard_files:
+            count = 0
+            batch = []
+            for record in read_records(str(filename)):
+                count += 1
+                if not dedup.is_new(record):
+                    continue
+                batch.append(record)
+                if len(batch) >= 1000:
+                    sink.write_many(batch)
+                    batch = []
+            sink.write_many(batch)
+            shard_counts[str(filename)] = count
+
+    return {'merged_unique': len(dedup), 'duplicates_removed': dedup.duplicates,
+            'shard_counts': shard_counts}
+
+
+def bundesweit_total(search_term: str, scraper_kwargs: Dict = None) -> int:
+    """Hit count of the unsharded search, 0 if the page does not announce it"""
+    from gelbeseiten_scraper import GelbeSeitenScraperComplete
+
+    scraper = GelbeSeitenScraperComplete(search_term=search_term, **(scraper_kwargs or {}))
+    scraper.initialize_session()
+    return scraper.total_available
+
+
+def coverage_report(search_term: str, merge_stats: Dict, total: int) -> Dict:
+    report = {
+        'search_term': search_term,
+        'bundesweit_total': total,
+        'merged_unique': merge_stats['merged_unique'],
+        'duplicates_removed': merge_stats['duplicates_removed'],
+        'coverage': round(merge_stats['merged_unique'] / total, 4) if total else None,
+        'shards': merge_stats['shard_counts'],
+    }
+    if total:
+        logger.info(f"Coverage: {report['merged_unique']}/{total} ({report['coverage'] * 100:.1f}%)")
+    else:
+        logger.warning("Bundesweit total unknown - coverage cannot be computed")
+    return report
+
+
+class ShardedCrawl:
+    """
+    Crawl a search term region by region in parallel and merge the result
+
+    Args:
+        search_term: What to search for
+        regions: WO values to shard by (default: the 16 Bundesländer)
+        output_dir: Directory for per-shard JSONL files and journals
+        workers: Shards crawled at the same time
+        requests_per_second: Request budget shared by all workers
+        use_processes: Crawl shards in worker processes (False: threads)
+        scraper_kwargs: Extra GelbeSeitenScraperComplete arguments (base_url, parser, ...)
+    """
+
+    def __init__(self, search_term: str, regions: Iterable[str] = None,
+                 output_dir: str = "shards", workers: int = 4,
+                 requests_per_second: float = 2.0, use_processes: bool = True,
+                 scraper_kwargs: Dict = None):
+        self.search_term = search_term
+        self.regions = list(regions or BUNDESLAENDER)
+        self.output_dir = output_dir
+        self.workers = workers
+        self.requests_per_second = requests_per_second
+        self.use_processes = use_processes
+        self.scraper_kwargs = scraper_kwargs or {}
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    def crawl(self, shard_index: int = 0, shard_count: int = 1, max_results: int = None,
+              results_per_page: int = 10, resume: bool = False) -> List[Dict]:
+        """Crawl this machine's share of the regions (`resume`: continue interrupted shards)"""
+        regions = plan_shards(self.regions, shard_index, shard_count)
+        per_worker_rate = self.requests_per_second / min(self.workers, len(regions) or 1)
+        executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+
+        summaries = []
+        with executor_class(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(crawl_shard, self.search_term, location, self.output_dir,
+                                max_results, results_per_page, per_worker_rate,
+                                self.scraper_kwargs, resume): location
+                for location in regions
+            }
+            for future in as_completed(futures):
+                try:
+                    summaries.append(future.result())
+                    logger.info(f"Shard '{futures[future]}' done")
+                except Exception as e:
+                    logger.error(f"Shard '{futures[future]}' failed: {e}")
+        return summaries
+
+    def merge(self, output_file: str, report_file: str = None) -> Dict:
+        """Merge all shard files of this search term and write the coverage report"""
+        shard_files = [shard_file(self.output_dir, self.search_term, location)
+                       for location in self.regions]
+        existing = [str(f) for f in shard_files if f.exists()]
+        missing = len(shard_files) - len(existing)
+        if missing:
+            logger.warning(f"{missing} shards have no output yet")
+
+        stats = merge_shards(existing, output_file)
+        report = coverage_report(self.search_term, stats,
+                                 bundesweit_total(self.search_term, self.scraper_kwargs))
+        report['missing_shards'] = missing
+
+        report_file = report_file or f"{output_file}.coverage.json"
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"Coverage report written to {report_file}")
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded Gelbe Seiten crawl")
+    parser.add_argument('search_term')
+    parser.add_argument('--regions', help="Comma separated WO values (default: Bundesländer)")
+    parser.add_argument('--plz-digits', type=int, choices=[1, 2],
+                        help="Shard by PLZ prefixes instead of Bundesländer")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=2.0, help="Total requests per second")
+    parser.add_argument('--output-dir', default='shards')
+    parser.add_argument('--output', help="Merged output file")
+    parser.add_argument('--max-results', type=int, help="Limit per shard")
+    parser.add_argument('--shard-index', type=int, default=0)
+    parser.add_argument('--shard-count', type=int, default=1)
+    parser.add_argument('--merge-only', action='store_true')
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue interrupted shards from their journals instead of starting over")
+    args = parser.parse_args()
+
+    if args.regions:
+        regions = [r.strip() for r in args.regions.split(',') if r.strip()]
+    elif args.plz_digits:
+        regions = plz_regions(args.plz_digits)
+    else:
+        regions = None
+
+    crawl = ShardedCrawl(args.search_term, regions, args.output_dir, args.workers, args.rate)
+    if not args.merge_only:
+        crawl.crawl(args.shard_index, args.shard_count, args.max_results, resume=args.resume)
+
+    # With several machines only the one called with --merge-only (or a single machine) merges
+    if args.merge_only or args.shard_count == 1:
+        output_file = args.output or f"gelbeseiten_{safe_name(args.search_term)}.csv"
+        report = crawl.merge(output_file)
+        print(json.dumps({k: v for k, v in report.items() if k != 'shards'}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Streaming output sinks for the Gelbe Seiten Scraper
+Append each parsed page to CSV, JSONL or Parquet instead of rewriting the whole file
+
+Usage (convert an existing export, e.g. CSV to typed Parquet):
+    python3 gelbeseiten_sinks.py gelbeseiten_steuerberater.csv gelbeseiten_steuerberater.parquet
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Column order of every export
+FIELDNAMES = [
+    'name', 'address', 'postal_code', 'city', 'phone',
+    'email', 'website', 'logo_url', 'rating', 'review_count',
+    'specialties', 'description', 'detail_url'
+]
+
+
+class ResultSink:
+    """
+    Base class for append-only result writers
+
+    Subclasses implement _write(records) and may override _sync()/_close().
+    Records are written as they arrive; the file is fsynced every
+    `fsync_every` records and on close.
+
+    Args:
+        filename: Output file
+        append: Keep existing content instead of truncating the file
+        fsync_every: Records between two fsyncs (0 disables batching: sync on close only)
+        fieldnames: Columns to write
+    """
+
+    def __init__(self, filename: str, append: bool = False, fsync_every: int = 100,
+                 fieldnames: List[str] = None):
+        self.filename = str(filename)
+        self.append = append
+        self.fsync_every = fsync_every
+        self.fieldnames = fieldnames or FIELDNAMES
+        self.written = 0
+        self._unsynced = 0
+
+    def write_many(self, records: Iterable[Dict[str, str]]):
+        """Append a batch of records (usually one page)"""
+        records = list(records)
+        if not records:
+            return
+        self._write(records)
+        self.written += len(records)
+        self._unsynced += len(records)
+        if self.fsync_every and self._unsynced >= self.fsync_every:
+            self.flush()
+
+    def write(self, record: Dict[str, str]):
+        self.write_many([record])
+
+    def flush(self):
+        """Push buffered records to disk"""
+        self._sync()
+        self._unsynced = 0
+
+    def close(self):
+        self.flush()
+        self._close()
+        logger.info(f"Wrote {self.written} results to {self.filename}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _row(self, record: Dict[str, str]) -> Dict[str, str]:
+        return {field: record.get(field, '') for field in self.fieldnames}
+
+    def _write(self, records: List[Dict[str, str]]):
+        raise NotImplementedError
+
+    def _sync(self):
+        pass
+
+    def _close(self):
+        pass
+
+
+class _TextFileSink(ResultSink):
+    """Shared file handling for line-oriented text formats"""
+
+    def __init__(self, filename: str, append: bool = False, fsync_every: int = 100,
+                 fieldnames: List[str] = None):
+        super().__init__(filename, append, fsync_every, fieldnames)
+        self._file = open(self.filename, 'a' if append else 'w', newline='', encoding='utf-8')
+        self._is_new = self._file.tell() == 0
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _close(self):
+        self._file.close()
+
+
+class CsvSink(_TextFileSink):
+    """CSV with the same columns as export_to_csv"""
+
+    def __init__(self, filename: str, append: bool = False, fsync_every: int = 100,
+                 fieldnames: List[str] = None):
+        super().__init__(filename, append, fsync_every, fieldnames)
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+        if self._is_new:
+            self._writer.writeheader()
+
+    def _write(self, records: List[Dict[str, str]]):
+        self._writer.writerows(self._row(r) for r in records)
+
+
+class JsonlSink(_TextFileSink):
+    """One JSON object per line"""
+
+    def _write(self, records: List[Dict[str, str]]):
+        self._file.writelines(
+            json.dumps(self._row(r), ensure_ascii=False) + '\n' for r in records
+        )
+
+
+def parse_rating(value: str) -> Optional[float]:
+    """'4,8' -> 4.8, None if empty or not a number"""
+    try:
+        return float(value.replace(',', '.')) if value else None
+    except ValueError:
+        return None
+
+
+def parse_count(value: str) -> Optional[int]:
+    """'122' -> 122, None if empty or not a number"""
+    digits = ''.join(ch for ch in value or '' if ch.isdigit())
+    return int(digits) if digits else None
+
+
+# Typed columns of the Arrow/Parquet export; every other field is a nullable string
+NUMERIC_FIELDS = {'rating': parse_rating, 'review_count': parse_count}
+CATEGORICAL_FIELDS = ('city', 'postal_code')
+
+
+def arrow_schema(fieldnames: List[str] = None, typed: bool = True):
+    """
+    Arrow schema for the export columns (requires pyarrow)
+
+    Args:
+        fieldnames: Columns (default: FIELDNAMES)
+        typed: float rating, int review_count, dictionary-encoded city/postal_code
+            (False: every column a string)
+    """
+    import pyarrow as pa
+
+    types = {
+        'rating': pa.float64(),
+        'review_count': pa.int32(),
+        **{field: pa.dictionary(pa.int32(), pa.string()) for field in CATEGORICAL_FIELDS},
+    }
+    return pa.schema([
+        (field, types.get(field, pa.string()) if typed else pa.string())
+        for field in fieldnames or FIELDNAMES
+    ])
+
+
+def typed_row(record: Dict[str, str], fieldnames: List[str]) -> Dict:
+    """Record converted for arrow_schema(typed=True): numbers parsed, empty strings null"""
+    row = {}
+    for field in fieldnames:
+        value = record.get(field) or ''
+        if field in NUMERIC_FIELDS:
+            row[field] = NUMERIC_FIELDS[field](value)
+        else:
+            row[field] = value or None
+    return row
+
+
+def to_arrow(records: Iterable[Dict[str, str]], fieldnames: List[str] = None, typed: bool = True):
+    """In-memory Arrow table of records, e.g. for pandas/duckdb (requires pyarrow)"""
+    import pyarrow as pa
+
+    fieldnames = fieldnames or FIELDNAMES
+    schema = arrow_schema(fieldnames, typed)
+    rows = [typed_row(r, fieldnames) if typed else {f: r.get(f, '') for f in fieldnames}
+            for r in records]
+    return pa.Table.from_pylist(rows, schema=schema)
+
+
+class ParquetSink(ResultSink):
+    """
+    Parquet file written one row group at a time (requires pyarrow)
+
+    Records are buffered until `row_group_size` rows are collected, so even a
+    page-by-page crawl produces large, well-compressed row groups. Columns are
+    typed (see arrow_schema). Parquet files cannot be appended to, so `append`
+    is not supported, and flush() does not put buffered rows on disk - the
+    scraper therefore refuses to journal or resume a Parquet crawl.
+    """
+
+    def __init__(self, filename: str, append: bool = False, fsync_every: int = 0,
+                 fieldnames: List[str] = None, row_group_size: int = 10000,
+                 compression: str = 'zstd', typed: bool = True):
+        if append:
+            raise ValueError("ParquetSink cannot append to an existing file")
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("ParquetSink requires pyarrow: pip3 install pyarrow")
+        super().__init__(filename, append, fsync_every, fieldnames)
+        self._pa = pa
+        self.row_group_size = row_group_size
+        self.typed = typed
+        self.schema = arrow_schema(self.fieldnames, typed)
+        self._writer = pq.ParquetWriter(self.filename, self.schema, compression=compression)
+        self._buffer = []
+
+    def _row(self, record: Dict[str, str]) -> Dict:
+        if self.typed:
+            return typed_row(record, self.fieldnames)
+        return super()._row(record)
+
+    def _write(self, records: List[Dict[str, str]]):
+        self._buffer.extend(self._row(r) for r in records)
+        if len(self._buffer) >= self.row_group_size:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if self._buffer:
+            table = self._pa.Table.from_pylist(self._buffer, schema=self.schema)
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+            self._buffer = []
+
+    def _sync(self):
+        # Row groups are written when full and on close - flushing every page
+        # would defeat the columnar layout
+        pass
+
+    def _close(self):
+        self._write_row_group()
+        self._writer.close()
+
+
+SINKS = {
+    '.csv': CsvSink,
+    '.jsonl': JsonlSink,
+    '.ndjson': JsonlSink,
+    '.parquet': ParquetSink,
+}
+
+
+def open_sink(filename: str, **kwargs) -> ResultSink:
+    """Create the sink matching the file extension (.csv, .jsonl, .parquet)"""
+    suffix = Path(filename).suffix.lower()
+    if suffix not in SINKS:
+        raise ValueError(f"Unsupported output format '{suffix}' (use {', '.join(SINKS)})")
+    return SINKS[suffix](filename, **kwargs)
+
+
+def read_records(filename: str) -> Iterator[Dict[str, str]]:
+    """Records of a CSV or JSONL export"""
+    with open(filename, 'r', encoding='utf-8', newline='') as f:
+        if filename.endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def convert(input_file: str, output_file: str, batch_size: int = 10000) -> int:
+    """Rewrite a CSV/JSONL export in the format of output_file, streaming in batches"""
+    with open_sink(output_file) as sink:
+        batch = []
+        for record in read_records(input_file):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                sink.write_many(batch)
+                batch = []
+        sink.write_many(batch)
+    return sink.written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a Gelbe Seiten export")
+    parser.add_argument('input', help="CSV or JSONL export")
+    parser.add_argument('output', help="Target file (.csv, .jsonl, .parquet)")
+    args = parser.parse_args()
+    print(f"✓ {convert(args.input, args.output)} records written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
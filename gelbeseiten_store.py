@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Persistent record store for incremental Gelbe Seiten crawls
+Every crawl upserts into SQLite; records keep first/last seen and a content hash,
+so a run can report exactly what was added, changed or removed since the last one
+
+Usage:
+    python3 gelbeseiten_store.py runs --store gelbeseiten.sqlite
+    python3 gelbeseiten_store.py delta --store gelbeseiten.sqlite --output delta.csv [--run 12]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from gelbeseiten_sinks import FIELDNAMES, open_sink
+
+logger = logging.getLogger(__name__)
+
+# Columns of a delta export: what happened, then the record as last seen
+DELTA_FIELDNAMES = ['change'] + FIELDNAMES
+
+ADDED, CHANGED, UNCHANGED, DUPLICATE, REMOVED = 'added', 'changed', 'unchanged', 'duplicate', 'removed'
+
+
+def record_key(record: Dict[str, str]) -> str:
+    """Identity of a business: detail_url, or name/address/postal_code without one"""
+    if record.get('detail_url'):
+        return record['detail_url']
+    return '|'.join(record.get(field, '') for field in ('name', 'address', 'postal_code'))
+
+
+def content_hash(record: Dict[str, str]) -> str:
+    """Hash of all exported fields - equal hashes mean nothing changed"""
+    values = [record.get(field, '') or '' for field in FIELDNAMES]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class RecordStore:
+    """
+    SQLite store of all records ever crawled, one row per (search term, business)
+
+    Each crawl is a run. upsert_page() marks rows added/changed in that run;
+    finish_run(complete=True) marks rows the run did not see as removed
+    (incomplete runs, e.g. stopped early, never remove anything).
+
+    Args:
+        filename: SQLite file holding the store
+    """
+
+    def __init__(self, filename: str = "gelbeseiten.sqlite"):
+        self.filename = str(filename)
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        columns = ',\n'.join(f'{field} TEXT' for field in FIELDNAMES if field != 'detail_url')
+        self._conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS records (
+                search_term TEXT NOT NULL,
+                record_key TEXT NOT NULL,
+                detail_url TEXT,
+                {columns},
+                content_hash TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                last_seen_run INTEGER NOT NULL,
+                change TEXT NOT NULL,
+                change_run INTEGER NOT NULL,
+                PRIMARY KEY (search_term, record_key)
+            );
+            CREATE INDEX IF NOT EXISTS records_detail_url ON records (detail_url);
+            CREATE INDEX IF NOT EXISTS records_phone ON records (phone);
+            CREATE INDEX IF NOT EXISTS records_postal_code ON records (postal_code);
+            CREATE INDEX IF NOT EXISTS records_change_run ON records (change_run);
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                search_term TEXT NOT NULL,
+                incremental INTEGER NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                complete INTEGER NOT NULL DEFAULT 0,
+                added INTEGER NOT NULL DEFAULT 0,
+                changed INTEGER NOT NULL DEFAULT 0,
+                removed INTEGER NOT NULL DEFAULT 0
+            );
+        ''')
+        self._conn.commit()
+
+    def start_run(self, search_term: str, incremental: bool = False) -> int:
+        with self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO runs (search_term, incremental, started_at) VALUES (?, ?, ?)',
+                (search_term, int(incremental), time.time())
+            )
+        return cursor.lastrowid
+
+    def _run_term(self, run_id: int) -> str:
+        return self._conn.execute('SELECT search_term FROM runs WHERE run_id = ?',
+                                  (run_id,)).fetchone()[0]
+
+    def upsert_page(self, run_id: int, records: Iterable[Dict[str, str]]) -> List[str]:
+        """
+        Insert or update one page of records in a single transaction
+
+        Returns:
+            Per record: 'added', 'changed', 'unchanged' or 'duplicate' (seen earlier in this run)
+        """
+        search_term = self._run_term(run_id)
+        now = time.time()
+        statuses = []
+        fields = [field for field in FIELDNAMES if field != 'detail_url']
+        with self._conn:
+            for record in records:
+                key = record_key(record)
+                digest = content_hash(record)
+                row = self._conn.execute(
+                    'SELECT content_hash, last_seen_run, change FROM records '
+                    'WHERE search_term = ? AND record_key = ?', (search_term, key)
+                ).fetchone()
+                values = [record.get(field, '') or '' for field in fields]
+
+                if row is None:
+                    status = ADDED
+                    self._conn.execute(
+                        f'INSERT INTO records (search_term, record_key, detail_url, {", ".join(fields)}, '
+                        f'content_hash, first_seen, last_seen, last_seen_run, change, change_run) '
+                        f'VALUES ({", ".join("?" * (len(fields) + 9))})',
+                        [search_term, key, record.get('detail_url', '')] + values
+                        + [digest, now, now, run_id, ADDED, run_id]
+                    )
+                elif row[1] == run_id:
+                    status = DUPLICATE
+                else:
+                    if row[2] == REMOVED:
+                        status = ADDED  # back after having disappeared
+                    elif row[0] != digest:
+                        status = CHANGED
+                    else:
+                        status = UNCHANGED
+                    assignments = ', '.join(f'{field} = ?' for field in fields)
+                    if status == UNCHANGED:
+                        self._conn.execute(
+                            'UPDATE records SET last_seen = ?, last_seen_run = ? '
+                            'WHERE search_term = ? AND record_key = ?',
+                            (now, run_id, search_term, key)
+                        )
+                    else:
+                        self._conn.execute(
+                            f'UPDATE records SET {assignments}, content_hash = ?, last_seen = ?, '
+                            f'last_seen_run = ?, change = ?, change_run = ? '
+                            f'WHERE search_term = ? AND record_key = ?',
+                            values + [digest, now, run_id, status, run_id, search_term, key]
+                        )
+                statuses.append(status)
+        return statuses
+
+    def finish_run(self, run_id: int, complete: bool) -> Dict[str, int]:
+        """Close a run; a complete run marks every record it did not see as removed"""
+        search_term = self._run_term(run_id)
+        with self._conn:
+            if complete:
+                self._conn.execute(
+                    'UPDATE records SET change = ?, change_run = ? '
+                    'WHERE search_term = ? AND last_seen_run != ? AND change != ?',
+                    (REMOVED, run_id, search_term, run_id, REMOVED)
+                )
+            counts = dict(self._conn.execute(
+                'SELECT change, COUNT(*) FROM records WHERE change_run = ? GROUP BY change', (run_id,)
+            ).fetchall())
+            self._conn.execute(
+                'UPDATE runs SET finished_at = ?, complete = ?, added = ?, changed = ?, removed = ? '
+                'WHERE run_id = ?',
+                (time.time(), int(complete), counts.get(ADDED, 0), counts.get(CHANGED, 0),
+                 counts.get(REMOVED, 0), run_id)
+            )
+        summary = {change: counts.get(change, 0) for change in (ADDED, CHANGED, REMOVED)}
+        logger.info(f"Run {run_id} ({'complete' if complete else 'partial'}): {summary}")
+        return summary
+
+    def runs(self, limit: int = 20) -> List[Dict]:
+        cursor = self._conn.execute(
+            'SELECT run_id, search_term, incremental, started_at, finished_at, complete, '
+            'added, changed, removed FROM runs ORDER BY run_id DESC LIMIT ?', (limit,)
+        )
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def last_run_id(self) -> Optional[int]:
+        row = self._conn.execute('SELECT MAX(run_id) FROM runs').fetchone()
+        return row[0]
+
+    def delta(self, run_id: int) -> Iterator[Dict[str, str]]:
+        """Records added, changed or removed by a run (DELTA_FIELDNAMES)"""
+        fields = [field for field in FIELDNAMES if field != 'detail_url']
+        cursor = self._conn.execute(
+            f'SELECT change, detail_url, {", ".join(fields)} FROM records '
+            f'WHERE change_run = ? ORDER BY change, record_key', (run_id,)
+        )
+        for row in cursor:
+            yield dict(zip(['change', 'detail_url'] + fields, row))
+
+    def export_delta(self, run_id: int, filename: str) -> int:
+        """Write a run's delta to a CSV/JSONL/Parquet file, returns the number of rows"""
+        with open_sink(filename, fieldnames=DELTA_FIELDNAMES) as sink:
+            sink.write_many(self.delta(run_id))
+        return sink.written
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gelbe Seiten record store")
+    parser.add_argument('command', choices=['runs', 'delta'])
+    parser.add_argument('--store', default='gelbeseiten.sqlite')
+    parser.add_argument('--run', type=int, help="Run id (default: last run)")
+    parser.add_argument('--output', help="Delta output file (.csv, .jsonl, .parquet)")
+    args = parser.parse_args()
+
+    with RecordStore(args.store) as store:
+        if args.command == 'runs':
+            for run in store.runs():
+                print(json.dumps(run))
+        else:
+            if not args.output:
+                parser.error("delta needs --output")
+            run_id = args.run or store.last_run_id()
+            if run_id is None:
+                parser.error("store has no runs yet")
+            print(f"✓ {store.export_delta(run_id, args.output)} changes of run {run_id}: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
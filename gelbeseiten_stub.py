@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Gelbe Seiten endpoints for offline tests and benchmarks
+Serves recorded /ajaxsuche payloads from fixtures/ on 127.0.0.1
+"""
+
+import hashlib
+import http.client
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# Not passed on by StubProxy
+HOP_BY_HOP_HEADERS = ('connection', 'keep-alive', 'proxy-connection', 'proxy-authorization',
+                      'transfer-encoding', 'te', 'trailer', 'upgrade')
+
+ARTICLE_RE = re.compile(r'<article\b.*?</article>', re.S)
+
+
+def load_recording(name: str = "ajaxsuche_steuerberater.json") -> Dict:
+    """Load a recorded crawl: {'search_term': ..., 'pages': [{'position', 'anzahl', 'payload'}]}"""
+    with open(FIXTURES_DIR / name, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_entries(name: str = "ajaxsuche_steuerberater.json") -> List[str]:
+    """Load a recording and split its pages into single <article> blocks"""
+    entries = []
+    for page in load_recording(name)['pages']:
+        entries.extend(ARTICLE_RE.findall(page['payload']['html']))
+    return entries
+
+
+class StubGelbeSeitenServer:
+    """
+    Threaded HTTP server answering /suche/... and /ajaxsuche like the real site
+
+    Args:
+        entries: Article HTML blocks to page through (default: recorded fixture)
+        latency: Seconds to sleep before every answer
+        failures: {position: [status, status, ...]} answered before succeeding
+        retry_after: Retry-After header value sent with 429/503 failures
+        locations: {WO value: indices into entries} served for regional searches
+        details: {path: HTML} served for detail pages (/gsbiz/...), others answer 404
+        max_page_size: Largest anzahl honoured, larger requests get this many entries
+        files: {path: (content type, bytes)} served as they are (e.g. logo images)
+    """
+
+    def __init__(self, entries: List[str] = None, latency: float = 0.0,
+                 failures: Dict[int, List[int]] = None, retry_after: str = None,
+                 locations: Dict[str, List[int]] = None, details: Dict[str, str] = None,
+                 max_page_size: int = None, files: Dict[str, Tuple[str, bytes]] = None):
+        self.entries = entries if entries is not None else load_entries()
+        self.locations = locations or {}
+        self.details = details or {}
+        self.max_page_size = max_page_size
+        self.files = files or {}
+        self.latency = latency
+        self.failures = {pos: list(codes) for pos, codes in (failures or {}).items()}
+        self.retry_after = retry_after
+        self.requests = []  # (path, form) for every request served
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                stub._record(self.path, {})
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if self.path.startswith('/suche/'):
+                    location = unquote(self.path.rstrip('/').rsplit('/', 1)[-1])
+                    hits = len(stub._entries_for(None if location == 'bundesweit' else location))
+                    body = (f'<html><body><h1><span id="mod-TrefferlisteInfo">{hits}</span> '
+                            f'Treffer</h1></body></html>').encode('utf-8')
+                    self._send(200, 'text/html', body, {'Set-Cookie': 'stub_session=1; Path=/'})
+                elif self.path in stub.details:
+                    self._send(200, 'text/html', stub.details[self.path].encode('utf-8'))
+                elif self.path in stub.files:
+                    self._send(200, *stub.files[self.path])
+                else:
+                    self._send(404, 'text/plain', b'not found')
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+                stub._record(self.path, form)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if self.path != '/ajaxsuche':
+                    self._send(404, 'text/plain', b'not found')
+                    return
+                status, body = stub.answer(form)
+                headers = {}
+                if status in (429, 503) and stub.retry_after:
+                    headers['Retry-After'] = stub.retry_after
+                if status == 200:
+                    # Conditional requests like the real site: unchanged pages answer 304
+                    etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+                    headers['ETag'] = etag
+                    if self.headers.get('If-None-Match') == etag:
+                        status, body = 304, b''
+                self._send(status, 'application/json', body, headers)
+
+            def _send(self, status, content_type, body, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _record(self, path: str, form: Dict[str, str]):
+        with self._lock:
+            self.requests.append((path, form))
+
+    def _entries_for(self, location: str = None) -> List[str]:
+        if location is None:
+            return self.entries
+        return [self.entries[i] for i in self.locations.get(location, [])]
+
+    def answer(self, form: Dict[str, str]):
+        """Build (status, body) for an /ajaxsuche form"""
+        position = int(form.get('position', 0))
+        anzahl = int(form.get('anzahl', 10))
+        if self.max_page_size:
+            anzahl = min(anzahl, self.max_page_size)
+
+        with self._lock:
+            queued = self.failures.get(position)
+            if queued:
+                return queued.pop(0), b'{}'
+
+        entries = self._entries_for(form.get('WO'))
+        html = ''.join(entries[position:position + anzahl])
+        return 200, json.dumps({'html': html}).encode('utf-8')
+
+    @property
+    def ajax_requests(self) -> List[Dict[str, str]]:
+        return [form for path, form in self.requests if path == '/ajaxsuche']
+
+
+class StubProxy:
+    """
+    Minimal forwarding HTTP proxy on 127.0.0.1 for identity pool tests
+
+    Args:
+        fail_status: Answer every request with this status instead of forwarding
+                     (a blocked or broken proxy)
+    """
+
+    def __init__(self, fail_status: int = None):
+        self.fail_status = fail_status
+        self.requests: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._forward()
+
+            def do_POST(self):
+                self._forward()
+
+            def _forward(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else None
+                with proxy._lock:
+                    proxy.requests.append((self.command, self.path))
+                if proxy.fail_status:
+                    self._reply(proxy.fail_status, [], b'')
+                    return
+
+                target = urlsplit(self.path)
+                headers = {k: v for k, v in self.headers.items()
+                           if k.lower() not in HOP_BY_HOP_HEADERS}
+                connection = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+                try:
+                    path = target.path + (f"?{target.query}" if target.query else '')
+                    connection.request(self.command, path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    self._reply(response.status, response.getheaders(), response.read())
+                except OSError:
+                    self._reply(502, [], b'')
+                finally:
+                    connection.close()
+
+            def _reply(self, status, headers, body):
+                self.send_response(status)
+                for key, value in headers:
+                    if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() != 'content-length':
+                        self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
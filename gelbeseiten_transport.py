@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+HTTP transport tuning for the Gelbe Seiten Scraper
+Sized keep-alive connection pools, explicit compression negotiation (gzip/deflate,
+plus brotli and zstd when their decoders are installed) and a cookie warm-up cache
+that lets runs skip the /suche/... page while its cookies are still fresh
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from urllib3.util.request import ACCEPT_ENCODING
+except ImportError:  # urllib3 < 1.26
+    ACCEPT_ENCODING = 'gzip,deflate'
+
+logger = logging.getLogger(__name__)
+
+
+def accept_encoding() -> str:
+    """Accept-Encoding listing every content coding urllib3 can decode here"""
+    return ', '.join(coding.strip() for coding in ACCEPT_ENCODING.split(','))
+
+
+def tune_session(session: requests.Session, pool_size: int = 10,
+                 pool_block: bool = False) -> requests.Session:
+    """
+    Mount keep-alive pools of `pool_size` connections and negotiate compression
+
+    Args:
+        session: Session to tune (returned for chaining)
+        pool_size: Connections kept open per host (match the requests in flight)
+        pool_block: Wait for a free connection instead of opening throwaway ones
+    """
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=pool_block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = accept_encoding()
+    return session
+
+
+def make_session(pool_size: int = 10, pool_block: bool = False) -> requests.Session:
+    return tune_session(requests.Session(), pool_size, pool_block)
+
+
+class WarmupCache:
+    """
+    Session cookies of a site plus the hit count per search, kept in a JSON file
+
+    initialize_session() reuses them while they are younger than `ttl` instead
+    of loading the search page again. The scraper invalidates the entry when
+    the site answers 401/403, so stale cookies cost one failed request.
+
+    Args:
+        filename: JSON file shared by all runs
+        ttl: Seconds cookies stay valid
+    """
+
+    def __init__(self, filename: str = "gelbeseiten_cookies.json", ttl: float = 3600.0):
+        self.filename = str(filename)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, data: Dict):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.filename)
+
+    def get(self, base_url: str, scope: str) -> Optional[Tuple[Dict[str, str], int]]:
+        """(cookies, hit count of `scope` or 0) if fresh cookies are cached, else None"""
+        with self._lock:
+            entry = self._load().get(base_url)
+        if not entry or time.time() - entry['fetched_at'] > self.ttl:
+            return None
+        return entry['cookies'], entry.get('totals', {}).get(scope, 0)
+
+    def put(self, base_url: str, scope: str, cookies: Dict[str, str], total: int = 0):
+        with self._lock:
+            data = self._load()
+            entry = data.get(base_url)
+            if not entry or entry['cookies'] != cookies:
+                entry = data[base_url] = {'cookies': cookies, 'fetched_at': time.time(), 'totals': {}}
+            if total:
+                entry['totals'][scope] = total
+            self._save(data)
+
+    def invalidate(self, base_url: str):
+        with self._lock:
+            data = self._load()
+            if data.pop(base_url, None) is not None:
+                self._save(data)
+                logger.info(f"Dropped cached cookies of {base_url}")
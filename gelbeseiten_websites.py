@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Website email crawler for the Gelbe Seiten Scraper
+Visits the homepage of every record that has a website but no email, follows
+its Impressum/Kontakt links and extracts email addresses. Runs on asyncio with
+a global concurrency limit, a minimum delay per host, hard per-page timeouts and
+size caps; results are cached per domain in SQLite.
+
+Usage:
+    python3 gelbeseiten_websites.py gelbeseiten_steuerberater.csv steuerberater_emails.csv --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urljoin, urlparse
+
+import requests
+
+from gelbeseiten_identity import USER_AGENT
+from gelbeseiten_sinks import FIELDNAMES, open_sink, read_records
+from gelbeseiten_transport import tune_session
+
+logger = logging.getLogger(__name__)
+
+# Field the crawler adds: every address found on the site, '; ' separated
+WEBSITE_FIELDNAMES = ['website_emails']
+WEBSITE_EXPORT_FIELDNAMES = FIELDNAMES + WEBSITE_FIELDNAMES
+
+EMAIL_RE = re.compile(r'(?<![\w.%+-])[\w.%+-]{1,64}@(?:[a-z0-9-]{1,63}\.)+[a-z]{2,24}(?![\w-])',
+                      re.I | re.A)
+# "info (at) kanzlei (dot) de", "info[at]kanzlei.de"
+OBFUSCATED_EMAIL_RE = re.compile(
+    r'([\w.%+-]{1,64})\s*[\[(]\s*(?:at|ät)\s*[\])]\s*([a-z0-9-]{1,63}(?:\s*(?:\.|[\[(]\s*(?:dot|punkt)\s*[\])])\s*[a-z0-9-]{1,63})+)',
+    re.I | re.A)
+DOT_RE = re.compile(r'\s*(?:\.|[\[(]\s*(?:dot|punkt)\s*[\])])\s*', re.I)
+HREF_RE = re.compile(r'<a\b[^>]*?href\s*=\s*["\']([^"\'#]+)["\'][^>]*>(.*?)</a>', re.I | re.S)
+CONTACT_LINK_RE = re.compile(r'impressum|imprint|kontakt|contact', re.I)
+TAG_RE = re.compile(r'<[^>]+>')
+
+# Matches that look like addresses but are file names, placeholders or trackers
+JUNK_EMAIL_RE = re.compile(
+    r'\.(?:png|jpe?g|gif|svg|webp|css|js)$|@(?:example\.|domain\.|sentry|wixpress\.com)|^(?:name|email|ihre?)@',
+    re.I)
+
+
+def extract_emails(html: str) -> List[str]:
+    """Email addresses in a page (plain, mailto: and (at)/(dot) obfuscated), lower case, in page order"""
+    text = unquote(html.replace('&#64;', '@').replace('&commat;', '@'))
+    found = [match.group(0) for match in EMAIL_RE.finditer(text)]
+    found += [f"{user}@{DOT_RE.sub('.', domain)}" for user, domain in OBFUSCATED_EMAIL_RE.findall(text)]
+    emails = []
+    for email in found:
+        email = email.lower().strip('.')
+        if not JUNK_EMAIL_RE.search(email) and email not in emails:
+            emails.append(email)
+    return emails
+
+
+def contact_links(html: str, page_url: str, limit: int = 2) -> List[str]:
+    """Impressum/Kontakt pages linked from a page, same host only"""
+    host = urlparse(page_url).netloc
+    links = []
+    for href, label in HREF_RE.findall(html):
+        if not (CONTACT_LINK_RE.search(href) or CONTACT_LINK_RE.search(TAG_RE.sub('', label))):
+            continue
+        url = urljoin(page_url, href.strip())
+        if urlparse(url).netloc == host and url.startswith('http') and url not in links:
+            links.append(url)
+            if len(links) >= limit:
+                break
+    return links
+
+
+def site_domain(url: str) -> str:
+    """Cache key of a website: host without www. (and without scheme/path)"""
+    if '://' not in url:
+        url = f"http://{url}"
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def best_email(emails: List[str], domain: str) -> str:
+    """Address of the business itself if there is one: same domain first, then the first found"""
+    host = domain.split(':')[0]
+    for email in emails:
+        if email.split('@', 1)[1] == host or host.endswith('.' + email.split('@', 1)[1]):
+            return email
+    return emails[0] if emails else ''
+
+
+class DomainCache:
+    """
+    Emails found per website domain (SQLite, WAL)
+
+    Args:
+        filename: SQLite file
+        ttl: Seconds an entry stays fresh (None: forever)
+    """
+
+    def __init__(self, filename: str = "gelbeseiten_websites.sqlite", ttl: float = 90 * 24 * 3600):
+        self.filename = str(filename)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS domains (
+                domain TEXT PRIMARY KEY,
+                emails TEXT NOT NULL,
+                pages INTEGER NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, domain: str) -> Optional[List[str]]:
+        """Cached emails, None if missing or stale"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT emails, fetched_at FROM domains WHERE domain = ?', (domain,)
+            ).fetchone()
+        if not row or (self.ttl is not None and time.time() - row[1] > self.ttl):
+            return None
+        return json.loads(row[0])
+
+    def put(self, domain: str, emails: List[str], pages: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO domains VALUES (?, ?, ?, ?)',
+                (domain, json.dumps(emails), pages, time.time())
+            )
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class WebsiteEmailCrawler:
+    """
+    Crawl business websites for email addresses
+
+    Pages are fetched with pooled requests in executor threads, like
+    scrape_all_async does; asyncio enforces the limits around them.
+
+    Args:
+        cache: DomainCache (None: crawl every site)
+        concurrency: Pages in flight across all hosts
+        per_host_delay: Minimum seconds between two requests to the same host
+        timeout: Hard limit in seconds for one page, including the download
+        max_bytes: Bytes read per page at most (the rest is ignored)
+        max_pages: Pages per site: the homepage plus Impressum/Kontakt links
+        session: requests session to reuse
+    """
+
+    def __init__(self, cache: DomainCache = None, concurrency: int = 16,
+                 per_host_delay: float = 1.0, timeout: float = 10.0,
+                 max_bytes: int = 512 * 1024, max_pages: int = 3,
+                 session: requests.Session = None):
+        self.cache = cache
+        self.concurrency = concurrency
+        self.per_host_delay = per_host_delay
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.session = tune_session(session or requests.Session(), pool_size=concurrency)
+        if session is None:
+            self.session.headers['User-Agent'] = USER_AGENT
+        self.pages_fetched = 0
+        self.sites_crawled = 0
+        self.cached = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_last: Dict[str, float] = {}
+        self._sites: Dict[str, asyncio.Task] = {}
+
+    def _download(self, url: str) -> Tuple[Optional[int], str, str]:
+        """Blocking GET reading at most max_bytes before the deadline: (status, final url, html)"""
+        deadline = time.monotonic() + self.timeout
+        try:
+            with self.session.get(url, timeout=(min(5.0, self.timeout), self.timeout),
+                                  stream=True, allow_redirects=True) as response:
+                content_type = response.headers.get('Content-Type', '')
+                if response.status_code != 200 or 'html' not in content_type.lower():
+                    return response.status_code, response.url, ''
+                chunks, size = [], 0
+                for chunk in response.iter_content(16384):
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= self.max_bytes or time.monotonic() > deadline:
+                        break
+                body = b''.join(chunks)[:self.max_bytes]
+                return 200, response.url, body.decode(response.encoding or 'utf-8', errors='replace')
+        except Exception as e:
+            logger.debug(f"Error fetching {url}: {e}")
+            return None, url, ''
+
+    async def _fetch(self, url: str) -> Tuple[Optional[int], str, str]:
+        """One polite, bounded page fetch"""
+        host = urlparse(url).netloc.lower()
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            wait = self._host_last.get(host, 0) + self.per_host_delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                try:
+                    # The thread keeps its own deadline; this bounds how long we wait for it
+                    result = await asyncio.wait_for(
+                        loop.run_in_executor(None, self._download, url), self.timeout + 1)
+                except asyncio.TimeoutError:
+                    logger.debug(f"Timeout fetching {url}")
+                    result = (None, url, '')
+            self._host_last[host] = time.monotonic()
+        self.pages_fetched += 1
+        return result
+
+    async def _crawl_site(self, website: str, domain: str) -> List[str]:
+        url = website if '://' in website else f"http://{website}"
+        status, final_url, html = await self._fetch(url)
+        emails = extract_emails(html)
+        pages = 1
+        if status == 200:
+            for link in contact_links(html, final_url, self.max_pages - 1):
+                _, _, page = await self._fetch(link)
+                pages += 1
+                emails += [email for email in extract_emails(page) if email not in emails]
+        self.sites_crawled += 1
+        if self.cache and status is not None:
+            self.cache.put(domain, emails, pages)
+        return emails
+
+    async def crawl_site(self, website: str) -> List[str]:
+        """Emails of one website, from the cache or crawled once per domain and run"""
+        domain = site_domain(website)
+        if self.cache:
+            cached = self.cache.get(domain)
+            if cached is not None:
+                self.cached += 1
+                return cached
+        if domain not in self._sites:
+            self._sites[domain] = asyncio.ensure_future(self._crawl_site(website, domain))
+        return await self._sites[domain]
+
+    async def _enrich_record(self, record: Dict[str, str]) -> Dict[str, str]:
+        merged = dict(record)
+        merged['website_emails'] = merged.get('website_emails') or ''
+        if merged.get('email') or not merged.get('website'):
+            return merged
+        emails = await self.crawl_site(merged['website'])
+        merged['website_emails'] = '; '.join(emails)
+        merged['email'] = best_email(emails, site_domain(merged['website']))
+        return merged
+
+    async def enrich_async(self, records: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Records with emails filled in from their websites, in input order"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._enrich_record(record) for record in records))
+
+    def enrich(self, records: Iterable[Dict[str, str]], batch_size: int = 500) -> Iterator[Dict[str, str]]:
+        """
+        Synchronous streaming wrapper: crawls `batch_size` records at a time on one event loop
+
+        Only records with a website and no email are crawled; the others pass through.
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    yield from loop.run_until_complete(self.enrich_async(batch))
+                    batch = []
+            if batch:
+                yield from loop.run_until_complete(self.enrich_async(batch))
+        finally:
+            self._semaphore = None
+            self._host_locks.clear()
+            self._sites.clear()
+            loop.close()
+        logger.info(f"Website crawl done: {self.sites_crawled} sites, {self.pages_fetched} pages, "
+                    f"{self.cached} domains from cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find missing emails on business websites")
+    parser.add_argument('input', help="Export to enrich (.csv or .jsonl)")
+    parser.add_argument('output', help="Output (.csv, .jsonl, .parquet)")
+    parser.add_argument('--concurrency', type=int, default=16, help="Pages in flight")
+    parser.add_argument('--per-host-delay', type=float, default=1.0,
+                        help="Seconds between requests to one host")
+    parser.add_argument('--timeout', type=float, default=10.0, help="Seconds per page")
+    parser.add_argument('--max-kb', type=int, default=512, help="KB read per page")
+    parser.add_argument('--cache', default='gelbeseiten_websites.sqlite', help="Per-domain cache")
+    parser.add_argument('--ttl-days', type=float, default=90)
+    args = parser.parse_args()
+
+    with DomainCache(args.cache, ttl=args.ttl_days * 24 * 3600) as cache, \
+            open_sink(args.output, fieldnames=WEBSITE_EXPORT_FIELDNAMES) as sink:
+        crawler = WebsiteEmailCrawler(cache, args.concurrency, args.per_host_delay,
+                                      args.timeout, args.max_kb * 1024)
+        found = 0
+        for record in crawler.enrich(read_records(args.input)):
+            found += bool(record.get('website_emails'))
+            sink.write(record)
+    print(f"✓ {sink.written} records, emails found on {found} websites: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,935 @@
+#!/usr/bin/env python3
+"""
+Offline Tests für den Gelbe Seiten Scraper
+Läuft gegen den lokalen Stub-Server mit aufgezeichneten ajaxsuche-Antworten
+"""
+
+import asyncio
+import csv
+import json
+import time
+
+from gelbeseiten_ratelimit import RateLimiter
+from gelbeseiten_cache import ResponseCache
+from gelbeseiten_journal import CrawlJournal
+from gelbeseiten_parsers import parse_html_lxml, parse_html_soup
+from gelbeseiten_scraper import GelbeSeitenScraperComplete
+from gelbeseiten_shards import ShardedCrawl, shard_file
+from gelbeseiten_batch import BatchScraper
+from gelbeseiten_enrich import DetailCache, DetailEnricher, parse_detail_html
+from gelbeseiten_store import RecordStore
+from gelbeseiten_deadletter import DeadLetterQueue
+from gelbeseiten_dedup import Deduplicator, dedup_file, normalize_phone
+from gelbeseiten_metrics import CrawlMetrics, JsonSnapshotWriter, MetricsServer
+from gelbeseiten_sinks import CsvSink, JsonlSink, open_sink, read_records
+from gelbeseiten_coordinator import CrawlWorker, LeaseQueue, merge_leases, plan_crawl
+from gelbeseiten_service import JobManager, ScrapeService
+from gelbeseiten_websites import DomainCache, WebsiteEmailCrawler, extract_emails
+from gelbeseiten_logos import LogoDownloader, LogoStore
+from gelbeseiten_transport import WarmupCache, make_session
+from gelbeseiten_records import Record, RecordBuffer, RecordView
+from gelbeseiten_pagesize import PageSizeController
+from gelbeseiten_identity import Identity, IdentityPool
+from gelbeseiten_stub import StubGelbeSeitenServer, StubProxy, load_entries, load_recording
+
+
+def fast_limiter() -> RateLimiter:
+    return RateLimiter(rate=100, max_rate=1000, backoff_base=0.05)
+
+
+def test_async_matches_sync():
+    """scrape_all_async liefert dieselben Einträge in derselben Reihenfolge"""
+    with StubGelbeSeitenServer() as stub:
+        sync_scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                                  rate_limiter=fast_limiter())
+        sync_results = sync_scraper.scrape_all(max_results=30)
+
+        async_scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                                   rate_limiter=fast_limiter())
+        async_results = asyncio.run(async_scraper.scrape_all_async(max_results=30, concurrency=4))
+
+    assert len(sync_results) == 30
+    assert async_results == sync_results
+
+
+def test_async_full_crawl_stops_at_end():
+    """Ohne Limit wird bis zur ersten leeren Seite gescrapt"""
+    with StubGelbeSeitenServer(latency=0.05, failures={20: [503]}) as stub:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter())
+        results = asyncio.run(scraper.scrape_all_async(concurrency=3))
+
+    assert len(results) == 50
+    assert results[20]['name'] == 'Walther Steuerberatungsgesellschaft mbH'
+
+
+def test_rate_limiter_backs_off_and_honours_retry_after():
+    """429 halbiert die Rate, Retry-After blockiert, gesunde Antworten erhöhen sie"""
+    limiter = RateLimiter(rate=4, increase=0.5, backoff_base=0.01)
+    limiter.record_response(200, 0.1)
+    assert limiter.rate == 4.5
+
+    limiter.record_response(429, 0.1, retry_after='1')
+    assert limiter.rate == 2.25
+    assert limiter.backoff_delay(1) > 0.9
+
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started > 0.9
+    assert limiter.stats()['throttled'] == 1
+
+
+def test_scrape_all_retries_throttled_page():
+    """Ein 429 an einer Position wird wiederholt statt den Lauf abzubrechen"""
+    with StubGelbeSeitenServer(failures={10: [429, 429]}) as stub:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter())
+        results = scraper.scrape_all(max_results=20)
+
+    assert len(results) == 20
+    assert scraper.rate_limiter.stats()['throttled'] == 2
+
+
+
+def test_streaming_sinks(tmp_path):
+    """Seiten werden sofort angehängt, iter_results sammelt nichts in self.results"""
+    csv_file = tmp_path / "out.csv"
+    jsonl_file = tmp_path / "out.jsonl"
+
+    with StubGelbeSeitenServer() as stub:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter())
+        results = scraper.scrape_all(max_results=20, output_file=str(csv_file))
+
+        streamer = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                              rate_limiter=fast_limiter())
+        with JsonlSink(str(jsonl_file), fsync_every=10) as sink:
+            streamed = list(streamer.iter_results(max_results=20, sink=sink))
+
+    with open(csv_file, encoding='utf-8') as f:
+        assert list(csv.DictReader(f)) == results
+    with open(jsonl_file, encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == results
+    assert streamed == results
+    assert streamer.results == []
+
+
+
+def test_resume_after_crash(tmp_path):
+    """Fortsetzen ab Journal-Position ohne doppelte oder fehlende Zeilen"""
+    csv_file = tmp_path / "out.csv"
+    journal_file = tmp_path / "out.journal"
+
+    with StubGelbeSeitenServer() as stub:
+        full = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                          rate_limiter=fast_limiter()).scrape_all()
+
+        first = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                           rate_limiter=fast_limiter())
+        first.scrape_all(max_results=20, output_file=str(csv_file), journal_file=str(journal_file))
+
+        # Crash after the page at position 20 hit the CSV but before the journal commit
+        with CrawlJournal(str(journal_file)) as journal:
+            journal.stage_page(20, [r['detail_url'] for r in full[20:30]])
+        with CsvSink(str(csv_file), append=True) as sink:
+            sink.write_many(full[20:30])
+
+        resumed = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter())
+        resumed.scrape_all(output_file=str(csv_file), resume=True, journal_file=str(journal_file))
+        positions = [int(form['position']) for form in stub.ajax_requests[-4:]]
+
+    with open(csv_file, encoding='utf-8') as f:
+        assert list(csv.DictReader(f)) == full
+    assert positions == [20, 30, 40, 50]
+    assert len(resumed.results) == 20
+    with CrawlJournal(str(journal_file)) as journal:
+        assert journal.state()['completed']
+        assert journal.state()['cookies'] == {'stub_session': '1'}
+
+    # Parquet ist erst beim Schließen vollständig: mit Journal/Resume sofort abgelehnt
+    import pytest
+    parquet_file = tmp_path / "out.parquet"
+    for kwargs in ({'resume': True}, {'journal_file': str(tmp_path / "parquet.journal")}):
+        with pytest.raises(ValueError, match="Parquet"):
+            GelbeSeitenScraperComplete("steuerberater").scrape_all(output_file=str(parquet_file), **kwargs)
+    assert not list(tmp_path.glob("*parquet*"))
+
+
+
+EDGE_CASE_HTML = """
+<article class="mod mod-Treffer mod-Treffer--premium">
+  <a href="/gsbiz/relative-1"><h2 class="mod-Treffer__name extra">  Kanzlei <!-- x --> <b>Müller&nbsp;</b></h2></a>
+  <img class="mod-Treffer__logo" src="/logos/1.png">
+  <address class="mod-AdresseKompakt"><div class="mod-AdresseKompakt__adress-text">Hauptstr. 1, </div></address>
+  <div class="mod-TelefonnummerKompakt"><a class="mod-TelefonnummerKompakt__phoneNumber">040 1<script>x()</script>23</a></div>
+  <div class="mod-WebseiteKompakt"><span class="mod-WebseiteKompakt__text" data-webseiteLink="not base64!">W</span></div>
+  <button id="mod-Chat__button--7" data-parameters="{broken json">Chat</button>
+  <span class="mod-BewertungKompakt__number--big">4,5</span>
+  <span class="mod-BewertungKompakt__text">keine</span>
+</article>
+<article class="mod-Treffer"><img class="mod-Treffer__logo" src="https://x/pixel.png"></article>
+<article class="mod-Treffer"><h2 class="mod-Treffer__name">Zweite</h2>
+  <address class="mod-AdresseKompakt"><div class="mod-AdresseKompakt__adress-text">
+  Weg 2 <span class="mod-AdresseKompakt__adress__ort">Berlin</span></div></address>
+</article>
+"""
+
+
+def test_lxml_parser_matches_soup():
+    """lxml-Backend liefert feldgenau dieselben Dicts wie BeautifulSoup"""
+    base_url = "https://www.gelbeseiten.de"
+    for page in load_recording()['pages']:
+        html = page['payload']['html']
+        assert parse_html_lxml(html, base_url) == parse_html_soup(html, base_url)
+
+    soup_count, soup_results = parse_html_soup(EDGE_CASE_HTML, base_url)
+    assert parse_html_lxml(EDGE_CASE_HTML, base_url) == (soup_count, soup_results)
+    assert soup_count == 3
+    assert soup_results[0]['name'] == 'KanzleiMüller'
+    assert soup_results[0]['detail_url'] == base_url + '/gsbiz/relative-1'
+    assert soup_results[1]['address'] == 'Weg 2'
+    assert parse_html_lxml('', base_url) == parse_html_soup('', base_url) == (0, [])
+
+
+
+def test_pipelined_matches_sync():
+    """Pipeline mit Prozess-Pool: geordnet identisch, ungeordnet dieselbe Menge"""
+    with StubGelbeSeitenServer(latency=0.01) as stub:
+        sync_results = GelbeSeitenScraperComplete(
+            "steuerberater", base_url=stub.base_url, rate_limiter=fast_limiter()
+        ).scrape_all()
+
+        ordered = GelbeSeitenScraperComplete(
+            "steuerberater", base_url=stub.base_url, rate_limiter=fast_limiter()
+        ).scrape_all_pipelined(parse_workers=2, queue_size=2)
+
+        unordered = GelbeSeitenScraperComplete(
+            "steuerberater", base_url=stub.base_url, rate_limiter=fast_limiter()
+        ).scrape_all_pipelined(parse_workers=2, ordered=False)
+
+    key = lambda r: (r['detail_url'], r['name'], r['phone'])
+    assert ordered == sync_results
+    assert sorted(unordered, key=key) == sorted(sync_results, key=key)
+
+
+
+def test_cache_and_reparse(tmp_path):
+    """Gecachte Seiten ersetzen den Netzwerkzugriff, reparse baut die CSV offline neu"""
+    cache = ResponseCache(str(tmp_path / "cache"), ttl=3600)
+
+    with StubGelbeSeitenServer() as stub:
+        crawled = GelbeSeitenScraperComplete(
+            "steuerberater", base_url=stub.base_url, rate_limiter=fast_limiter(), cache=cache
+        ).scrape_all()
+        fetched = len(stub.ajax_requests)
+
+        again = GelbeSeitenScraperComplete(
+            "steuerberater", base_url=stub.base_url, rate_limiter=fast_limiter(), cache=cache
+        ).scrape_all()
+        assert len(stub.ajax_requests) == fetched
+        assert again == crawled
+
+    # Server is gone - reparse must not need it
+    out_file = tmp_path / "reparsed.csv"
+    reparsed = GelbeSeitenScraperComplete(
+        "steuerberater", base_url="http://127.0.0.1:9", cache=cache, parser="soup"
+    ).reparse(output_file=str(out_file))
+    assert reparsed == crawled
+    with open(out_file, encoding='utf-8') as f:
+        assert len(list(csv.DictReader(f))) == 50
+
+    pages = cache.pages("steuerberater")
+    assert next(pages)[:2] == (0, 10) and len(list(pages)) == fetched - 1  # Generator, Seite für Seite
+
+    # Die Stub-Antworten tragen ETags: abgelaufen, aber zur Revalidierung behalten
+    assert ResponseCache(str(tmp_path / "cache"), ttl=0).evict() == 0
+    tiny = ResponseCache(str(tmp_path / "cache"), max_bytes=1)
+    assert tiny.evict() == fetched
+    assert tiny.stats()['responses'] == 0
+
+
+def test_sharded_crawl_merges_and_reports_coverage(tmp_path):
+    """Regionale Shards überlappen, der Merge entfernt Duplikate und meldet die Coverage"""
+    locations = {'bayern': list(range(0, 30)), 'hessen': list(range(25, 50))}
+    with StubGelbeSeitenServer(locations=locations) as stub:
+        crawl = ShardedCrawl("steuerberater", regions=['bayern', 'hessen'],
+                             output_dir=str(tmp_path / "shards"), workers=2,
+                             requests_per_second=200, use_processes=False,
+                             scraper_kwargs={'base_url': stub.base_url})
+        summaries = crawl.crawl(max_results=10)
+        assert {s['location'] for s in summaries} == {'bayern', 'hessen'}
+        assert {s['total_available'] for s in summaries} == {30, 25}
+        assert len(stub.ajax_requests) == 2
+        # resume setzt die abgebrochenen Shards ab Position 10 fort
+        assert {s['location'] for s in crawl.crawl(resume=True)} == {'bayern', 'hessen'}
+        assert {form.get('WO') for form in stub.ajax_requests} == {'bayern', 'hessen'}
+        assert len(stub.ajax_requests) == 2 + 6  # je Shard Positionen 10, 20 und die leere 30
+
+        def shard_lines():
+            files = {location: shard_file(crawl.output_dir, "steuerberater", location)
+                     for location in locations}
+            return {location: len(list(read_records(str(f)))) for location, f in files.items()}
+
+        assert shard_lines() == {'bayern': 30, 'hessen': 25}  # nichts doppelt angehängt
+
+        # Ohne resume beginnt jeder Shard neu und überschreibt seine Datei
+        crawl.crawl()
+        assert len(stub.ajax_requests) == 8 + 8
+        assert shard_lines() == {'bayern': 30, 'hessen': 25}
+
+        out_file = tmp_path / "merged.csv"
+        report = crawl.merge(str(out_file))
+
+    assert report['bundesweit_total'] == 50
+    # The recording itself lists 6 businesses twice, hessen/bayern overlap by 5
+    assert report['merged_unique'] == 44
+    assert report['duplicates_removed'] == 55 - 44
+    assert report['coverage'] == 0.88
+    with open(out_file, encoding='utf-8') as f:
+        assert len(list(csv.DictReader(f))) == 44
+    with open(f"{out_file}.coverage.json", encoding='utf-8') as f:
+        assert json.load(f)['missing_shards'] == 0
+
+
+def test_batch_interleaves_terms_and_dedups(tmp_path):
+    """Mehrere Suchbegriffe: eine Session, faire Verzahnung, kombinierte Datei ohne Duplikate"""
+    with StubGelbeSeitenServer() as stub:
+        batch = BatchScraper(["steuerberater", "buchhaltung"], concurrency=1,
+                             rate_limiter=fast_limiter(),
+                             scraper_kwargs={'base_url': stub.base_url})
+        summary = batch.run(str(tmp_path), combined_file=str(tmp_path / "alle.csv"))
+        order = [form['WAS'] for form in stub.ajax_requests]
+
+    assert order[:4] == ["steuerberater", "buchhaltung", "steuerberater", "buchhaltung"]
+    assert {info['results'] for info in summary.values()} == {50}
+    with open(summary['buchhaltung']['output_file'], encoding='utf-8') as f:
+        assert len(list(csv.DictReader(f))) == 50
+    with open(tmp_path / "alle.csv", encoding='utf-8') as f:
+        combined = list(csv.DictReader(f))
+    assert len(combined) == 44
+    assert {r['search_term'] for r in combined} == {"steuerberater"}
+
+
+DETAIL_HTML = """
+<html><head><script type="application/ld+json">
+{"@context": "https://schema.org", "@type": "AccountingService", "telephone": "089 123456",
+ "faxNumber": "089 123457", "url": "https://www.kanzlei-beispiel.de",
+ "openingHoursSpecification": [{"dayOfWeek": "https://schema.org/Monday", "opens": "08:00", "closes": "17:00"}]}
+</script></head><body><a href="mailto:info@kanzlei-beispiel.de?subject=Anfrage">E-Mail</a></body></html>
+"""
+
+
+def test_detail_enrichment_with_cache(tmp_path):
+    """Detailseiten ergänzen fehlende Felder, der Cache verhindert erneute Abrufe"""
+    assert parse_detail_html(DETAIL_HTML) == {
+        'opening_hours': 'Monday 08:00-17:00', 'fax': '089 123457',
+        'email': 'info@kanzlei-beispiel.de', 'website': 'https://www.kanzlei-beispiel.de',
+        'phone': '089 123456',
+    }
+
+    with StubGelbeSeitenServer(details={'/gsbiz/1': DETAIL_HTML}) as stub:
+        records = [
+            {'name': 'A', 'email': '', 'phone': '0800 1', 'detail_url': stub.base_url + '/gsbiz/1'},
+            {'name': 'B', 'detail_url': stub.base_url + '/gsbiz/weg'},
+            {'name': 'C', 'detail_url': ''},
+        ]
+        with DetailCache(str(tmp_path / "details.sqlite")) as cache:
+            enriched = list(DetailEnricher(cache, fast_limiter(), concurrency=2).enrich(records))
+            again = list(DetailEnricher(cache, fast_limiter()).enrich(records))
+        detail_requests = [path for path, _ in stub.requests if path.startswith('/gsbiz/')]
+
+    assert [r['name'] for r in enriched] == ['A', 'B', 'C']
+    assert enriched[0]['email'] == 'info@kanzlei-beispiel.de'
+    assert enriched[0]['phone'] == '0800 1'
+    assert enriched[0]['opening_hours'] == 'Monday 08:00-17:00'
+    assert enriched[1]['opening_hours'] == '' and enriched[2]['fax'] == ''
+    assert again == enriched
+    assert sorted(detail_requests) == ['/gsbiz/1', '/gsbiz/weg']
+
+
+def test_store_delta_and_incremental_stop(tmp_path):
+    """Store: Delta (neu/geändert/entfernt) und frühes Abbrechen im inkrementellen Modus"""
+    entries = load_entries()
+    with RecordStore(str(tmp_path / "store.sqlite")) as store, \
+            StubGelbeSeitenServer(entries=list(entries)) as stub:
+        def crawl(**kwargs):
+            return GelbeSeitenScraperComplete(
+                "steuerberater", base_url=stub.base_url, rate_limiter=fast_limiter()
+            ).scrape_all(store=store, **kwargs)
+
+        crawl()
+        assert store.runs()[0]['added'] == 45
+
+        # Next day: one new business, one new phone number, one closed
+        stub.entries = ([entries[0].replace('/gsbiz/', '/gsbiz/neu-')]
+                        + [e.replace('089 7 44 20 60', '089 7 44 20 99') for e in entries[:45]]
+                        + entries[46:])
+        crawl(delta_file=str(tmp_path / "delta.csv"))
+        with open(tmp_path / "delta.csv", encoding='utf-8') as f:
+            delta = {r['change']: r for r in csv.DictReader(f)}
+        assert store.runs()[0]['added'] == store.runs()[0]['changed'] == store.runs()[0]['removed'] == 1
+        assert delta['added']['detail_url'].startswith('https://www.gelbeseiten.de/gsbiz/neu-')
+        assert delta['changed']['phone'] == '089 7 44 20 99'
+        assert delta['removed']['detail_url'] == GelbeSeitenScraperComplete().parse_results(
+            {'html': entries[45]})[0]['detail_url']
+
+        stub.requests.clear()
+        partial = crawl(incremental=True, stop_after_unchanged=15)
+        assert len(partial) == 20
+        assert len(stub.ajax_requests) == 2
+        assert store.runs()[0]['complete'] == 0 and store.runs()[0]['removed'] == 0
+
+
+def test_dedup_matches_variants_and_keeps_richest_fields(tmp_path):
+    """Dedup erkennt Schreibvarianten über Blocking-Keys und behält die reichsten Felder"""
+    assert normalize_phone('+49 (89) 7 44 20-60') == normalize_phone('089 7442060') == '0897442060'
+    records = [
+        {'name': 'Müller & Partner Steuerberater GmbH', 'address': 'Hauptstraße 5', 'postal_code': '80331',
+         'phone': '089 123 45', 'email': '', 'detail_url': 'https://x/gsbiz/1'},
+        {'name': 'Mueller und Partner Steuerberater', 'address': 'Hauptstr. 5', 'postal_code': '80331',
+         'phone': '', 'email': 'info@mueller.de', 'detail_url': 'https://x/gsbiz/2'},
+        {'name': 'Andere Kanzlei', 'address': 'Weg 1', 'postal_code': '80331',
+         'phone': '+49 89 12345', 'email': '', 'detail_url': 'https://x/gsbiz/3'},
+        {'name': 'Müller & Partner Steuerberater', 'address': 'Hauptstraße 5', 'postal_code': '10115',
+         'phone': '030 1', 'email': '', 'detail_url': 'https://x/gsbiz/4'},
+    ]
+    streaming = Deduplicator()
+    # 2: name/address variant, 3: same PLZ + phone, 4: same name in another PLZ
+    assert [r['detail_url'][-1] for r in streaming.filter(records)] == ['1', '4']
+    assert len(streaming) == 2 and not streaming._clusters  # nur Schlüssel, keine Datensätze
+    dedup = Deduplicator(keep_records=True)
+    assert [r['detail_url'][-1] for r in dedup.filter(records)] == ['1', '4']
+    merged = dedup.records()[0]
+    assert merged['email'] == 'info@mueller.de' and merged['phone'] == '089 123 45'
+    # Telefon des zweiten Cluster-Mitglieds (nicht des ersten) erkennt das dritte
+    members = [
+        {'name': 'Kanzlei Alpha', 'postal_code': '80331', 'phone': '', 'detail_url': 'https://x/gsbiz/5'},
+        {'name': 'Kanzlei Alpha GmbH', 'postal_code': '80331', 'phone': '089 111',
+         'detail_url': 'https://x/gsbiz/6'},
+        {'name': 'Steuerbüro Zentrum', 'postal_code': '80331', 'phone': '089/111',
+         'detail_url': 'https://x/gsbiz/7'},
+    ]
+    assert [r['detail_url'][-1] for r in Deduplicator().filter(members)] == ['5']
+
+    # Batch pass over the recorded crawl: one extra business has two detail pages
+    with StubGelbeSeitenServer() as stub:
+        GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                   rate_limiter=fast_limiter()).scrape_all(output_file=str(tmp_path / "in.csv"))
+    stats = dedup_file(str(tmp_path / "in.csv"), str(tmp_path / "out.csv"))
+    assert stats == {'records': 50, 'unique': 44, 'duplicates': 6}
+
+
+def test_benchmark_baseline_comparison():
+    """Benchmark-Vergleich meldet nur Verschlechterungen über der Toleranz"""
+    from bench_gelbeseiten import compare
+    baseline = {'parse_lxml_records_per_s': 1000.0, 'crawl_sync_pages_per_s': 50.0, 'peak_rss_mb': 100.0}
+    metrics = {'parse_lxml_records_per_s': 700.0, 'crawl_sync_pages_per_s': 45.0,
+               'peak_rss_mb': 130.0, 'new_metric': 1.0}
+    regressions = compare(metrics, baseline, tolerance=0.2)
+    assert [line.split(':')[0] for line in regressions] == ['parse_lxml_records_per_s', 'peak_rss_mb']
+
+
+def test_metrics_count_requests_retries_and_records(tmp_path):
+    """Metriken: Status-Codes, Retries, Parse-Zeiten, geschriebene Einträge, Trefferzahl"""
+    import urllib.request
+    metrics = CrawlMetrics()
+    with StubGelbeSeitenServer(failures={10: [503]}) as stub:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter(), metrics=metrics)
+        with JsonSnapshotWriter(metrics.registry, str(tmp_path / "metrics.json"), interval=60), \
+                MetricsServer(metrics.registry, port=0) as server:
+            scraper.scrape_all(output_file=str(tmp_path / "out.csv"))
+            with urllib.request.urlopen(server.url + "/metrics") as response:
+                text = response.read().decode('utf-8')
+
+    assert scraper.total_available == 50
+    assert metrics.requests.value(status=200) == 6 and metrics.requests.value(status=503) == 1
+    assert metrics.retries.value() == 1
+    assert metrics.records_written.value() == 50
+    assert metrics.parse_seconds.count == 6
+    assert 'gelbeseiten_requests_total{status="503"} 1' in text
+    assert 'gelbeseiten_total_available 50' in text
+    with open(tmp_path / "metrics.json", encoding='utf-8') as f:
+        snapshot = json.load(f)['metrics']
+    assert snapshot['gelbeseiten_entries_per_page']['count'] == 6
+
+
+def test_typed_parquet_export(tmp_path):
+    """Parquet-Export mit Typen: rating float, review_count int, city kategorisch, leere Felder null"""
+    import pytest
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    from gelbeseiten_sinks import convert
+
+    csv_file = tmp_path / "in.csv"
+    with StubGelbeSeitenServer() as stub:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter())
+        results = scraper.scrape_all(output_file=str(csv_file))
+    scraper.export_to_parquet(str(tmp_path / "out.parquet"))
+    assert convert(str(csv_file), str(tmp_path / "converted.parquet")) == 50
+
+    for name in ("out.parquet", "converted.parquet"):
+        table = pq.read_table(tmp_path / name)
+        assert table.schema.field('rating').type == pa.float64()
+        assert table.schema.field('review_count').type == pa.int32()
+        assert pa.types.is_dictionary(table.schema.field('city').type)
+        rows = table.to_pylist()
+        assert len(rows) == 50
+        for row, record in zip(rows, results):
+            assert row['city'] == record['city']
+            assert row['email'] == (record['email'] or None)
+            if record['rating']:
+                assert row['rating'] == float(record['rating'].replace(',', '.'))  # 4,7 bleibt 4.7
+            assert row['review_count'] == (int(record['review_count']) if record['review_count'] else None)
+
+
+def test_identity_pool_rotates_out_blocked_proxy():
+    """Identitäten-Pool: eigene Cookies pro Proxy, gesperrter Proxy wird ausrotiert"""
+    with StubGelbeSeitenServer() as stub, StubProxy() as good1, StubProxy() as good2, \
+            StubProxy(fail_status=403) as blocked:
+        pool = IdentityPool([
+            Identity("good1", 'chrome-macos', good1.url, fast_limiter()),
+            Identity("good2", 'firefox-linux', good2.url, fast_limiter()),
+            Identity("blocked", 'safari-macos', blocked.url, fast_limiter()),
+        ], max_consecutive_failures=1, cooldown=60)
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter(), identity_pool=pool)
+        results = scraper.scrape_all()
+
+    assert len(results) == 50
+    stats = {entry['name']: entry for entry in pool.stats()}
+    assert stats['blocked']['strikes'] == 1 and stats['blocked']['cooling_down']
+    # The blocked proxy never got a search request through; the good ones carried all 6 pages
+    assert not any(path.endswith('/ajaxsuche') for _, path in blocked.requests if _ == 'POST')
+    assert stats['good1']['requests'] + stats['good2']['requests'] == 6
+    assert stats['good1']['errors'] == stats['good2']['errors'] == 0
+    # Every identity fetched its own cookies through its own proxy
+    assert any('/suche/' in path for _, path in good1.requests + good2.requests)
+    assert len(stub.ajax_requests) == 6
+
+
+def test_coordinator_reissues_expired_leases_and_merges(tmp_path):
+    """Verteilter Crawl: Leases, abgelaufener Lease wird neu vergeben, Merge mit Dedup"""
+    import threading
+    with StubGelbeSeitenServer() as stub:
+        def worker(queue, name):
+            return CrawlWorker(queue, str(tmp_path / "leases"), name, scraper_kwargs={
+                'base_url': stub.base_url, 'rate_limiter': fast_limiter()})
+
+        queue = LeaseQueue(str(tmp_path / "queue.sqlite"), lease_seconds=0.3)
+        assert plan_crawl(queue, "steuerberater", lease_size=20,
+                          scraper_kwargs={'base_url': stub.base_url}) == 3
+        stale = queue.claim("crashed")  # a worker that dies holding its lease
+        time.sleep(0.35)
+
+        workers = [worker(queue, f"w{i}") for i in range(2)]
+        threads = [threading.Thread(target=w.run) for w in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert queue.complete(stale['id'], "crashed", 0, "late.jsonl") is False
+        assert queue.progress()['done'] == 3
+        assert sum(w.records_written for w in workers) == 50
+        assert len(stub.ajax_requests) == 5
+        stats = merge_leases(queue, str(tmp_path / "merged.csv"))
+        assert stats['merged_unique'] == 44 and stats['duplicates_removed'] == 6
+        assert not list((tmp_path / "leases").glob("*.tmp"))
+
+        # Leases behind the end of the results are closed without fetching them
+        queue = LeaseQueue(str(tmp_path / "queue2.sqlite"))
+        queue.plan("steuerberater", 80, lease_size=30)
+        before = len(stub.ajax_requests)
+        assert worker(queue, "w").run() == {'leases': 2, 'records': 50}
+        assert len(stub.ajax_requests) - before == 6
+        assert queue.progress()['done'] == 3
+
+
+def test_coordinator_work_gives_each_worker_its_own_id(tmp_path, monkeypatch):
+    """`work --workers 2` startet Worker mit unterschiedlichen IDs im selben Prozess"""
+    import sys
+    import gelbeseiten_coordinator
+
+    claimed = []
+    monkeypatch.setattr(CrawlWorker, 'run', lambda self: claimed.append(self.worker_id))
+    monkeypatch.setattr(sys, 'argv', ['gelbeseiten_coordinator.py', 'work', '--workers', '2',
+                                      '--queue', str(tmp_path / "queue.sqlite"),
+                                      '--output-dir', str(tmp_path / "leases")])
+    gelbeseiten_coordinator.main()
+    assert len(claimed) == 2 and len(set(claimed)) == 2
+
+
+def test_adaptive_page_size_respects_endpoint_limit(tmp_path):
+    """Seitengröße: wächst bis zum Limit des Endpoints, keine Einträge übersprungen oder doppelt"""
+    entries = load_entries() * 4
+    cache = ResponseCache(str(tmp_path / "cache"))
+    with StubGelbeSeitenServer(entries=entries, max_page_size=25) as stub:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter(), cache=cache)
+        controller = PageSizeController(initial=10, maximum=100)
+        results = scraper.scrape_all(page_size=controller)
+        positions = [(int(form['position']), int(form['anzahl'])) for form in stub.ajax_requests]
+
+    expected = parse_html_soup(''.join(entries), "https://www.gelbeseiten.de")[1]
+    assert [r['name'] for r in results] == [r['name'] for r in expected]
+    assert controller.cap == 25
+    assert positions[:4] == [(0, 10), (10, 20), (30, 40), (55, 25)]
+    assert len(positions) == 10  # statt 21 Requests mit anzahl=10
+
+    # Reparse folgt den tatsächlich gelieferten Einträgen, nicht den angefragten Größen
+    reparsed = GelbeSeitenScraperComplete("steuerberater", base_url="http://127.0.0.1:9",
+                                          cache=cache).reparse()
+    assert [r['name'] for r in reparsed] == [r['name'] for r in expected]
+
+    # Eine fehlgeschlagene übergroße Seite überspringt nur, was die letzte Seite lieferte
+    with StubGelbeSeitenServer(entries=entries, max_page_size=25, failures={30: [500]}) as stub, \
+            DeadLetterQueue(str(tmp_path / "deadletters.sqlite"), backoff_base=0.05) as dead_letters:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter())
+        results = scraper.scrape_all(page_size=PageSizeController(initial=10, maximum=100),
+                                     dead_letters=dead_letters)
+    assert scraper.missing_ranges == []
+    assert sorted(r['name'] for r in results) == sorted(r['name'] for r in expected)
+
+    # Ohne bekannte Trefferzahl: kurze Seite ist erst ein Limit, wenn danach noch etwas kommt
+    controller = PageSizeController(initial=40, maximum=100)
+    controller.record(0, 40, 25, 0.1)
+    assert controller.cap == 100
+    controller.record(25, 40, 25, 0.1)
+    assert controller.cap == 25 and controller.size == 25
+    # Langsame oder fehlgeschlagene Seiten halbieren die Größe
+    controller.record(50, 25, 25, 6.0)
+    assert controller.size == 12
+    controller.record_failure()
+    assert controller.size == 10
+
+
+def test_compact_results_behave_like_dicts(tmp_path):
+    """Kompakte Ergebnisse (Slots/Spalten): gleicher Export, dict-kompatibel, weniger Speicher"""
+    from bench_gelbeseiten import bench_memory
+    exports = {}
+    with StubGelbeSeitenServer() as stub:
+        for compact in (None, 'records', 'columns'):
+            scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                                 rate_limiter=fast_limiter(), compact=compact)
+            results = scraper.scrape_all()
+            scraper.save_progress(str(tmp_path / f"{compact}.csv"))
+            exports[compact] = (tmp_path / f"{compact}.csv").read_text(encoding='utf-8')
+            assert len(results) == 50
+            assert [dict(r) for r in results[:3]] == [dict(r) for r in list(results)[:3]]
+    assert exports[None] == exports['records'] == exports['columns']
+    assert isinstance(results, RecordBuffer) and isinstance(results[-1], RecordView)
+
+    record = Record({'name': 'Kanzlei', 'city': 'München'}, search_term='steuerberater')
+    assert record['city'] == 'München' and record.get('email') == '' and 'search_term' in record
+    assert dict(record) == {**{field: '' for field in record}, 'name': 'Kanzlei',
+                            'city': 'München', 'search_term': 'steuerberater'}
+    buffer = RecordBuffer([{'name': 'A', 'city': 'Berlin'}, {'name': 'B', 'search_term': 'x'}])
+    assert buffer[0].get('search_term') is None and buffer[1]['search_term'] == 'x'
+    assert buffer.column('name') == ['A', 'B']
+    # Schreiben in eine Zeile landet in den Spalten statt in einer Kopie
+    buffer[0]['email'] = 'a@example.de'
+    for row in buffer:
+        row['opening_hours'] = 'Mo-Fr'
+    del buffer[1]['search_term']
+    assert buffer.column('email') == ['a@example.de', '']
+    assert dict(buffer[1]) == {**{field: '' for field in record if field != 'search_term'},
+                               'name': 'B', 'opening_hours': 'Mo-Fr'}
+
+    memory = bench_memory(parse_html_soup(''.join(load_entries()), "https://www.gelbeseiten.de")[1], 2000)
+    assert memory['memory_columns_mb'] < memory['memory_records_mb'] < memory['memory_dicts_mb']
+
+
+def test_cookie_warmup_cache_and_etag_revalidation(tmp_path):
+    """Cookie-Cache spart die Suchseite, ETag-Revalidierung spart unveränderte Seiten"""
+    session = make_session(pool_size=8)
+    assert session.get_adapter("https://www.gelbeseiten.de")._pool_maxsize == 8
+    assert 'gzip' in session.headers['Accept-Encoding']
+
+    warmup = WarmupCache(str(tmp_path / "cookies.json"), ttl=3600)
+    cache = ResponseCache(str(tmp_path / "cache"), ttl=0)  # sofort abgelaufen: jede Seite revalidieren
+    with StubGelbeSeitenServer() as stub:
+        def crawl():
+            metrics = CrawlMetrics()
+            scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                                 rate_limiter=fast_limiter(), cache=cache,
+                                                 warmup_cache=warmup, metrics=metrics)
+            return scraper, metrics, scraper.scrape_all()
+
+        first, first_metrics, first_results = crawl()
+        second, second_metrics, second_results = crawl()
+        searches = [path for path, _ in stub.requests if path.startswith('/suche/')]
+        base_url = stub.base_url
+
+    assert len(searches) == 1  # der zweite Lauf nutzt die gespeicherten Cookies
+    assert second.total_available == 50
+    assert second.session.cookies.get('stub_session') == '1'
+    assert first_metrics.not_modified.value() == 0
+    assert second_metrics.not_modified.value() == 6
+    assert second_metrics.requests.value(status=304) == 6
+    assert second_results == first_results
+
+    warmup.invalidate(base_url)
+    assert warmup.get(base_url, "steuerberater") is None
+
+
+def test_logo_download_dedups_by_content(tmp_path):
+    """Logos: parallel geladen, gleiche Bilder einmal gespeichert, Thumbnails, Re-Run ohne Downloads"""
+    import io
+    import pytest
+    Image = pytest.importorskip('PIL.Image')
+
+    def png(color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (200, 100), color).save(buffer, format='PNG')
+        return ('image/png', buffer.getvalue())
+
+    red, blue = png('red'), png('blue')
+    files = {'/logos/a.png': red, '/logos/a-copy.png': red, '/logos/b.png': blue}
+    with StubGelbeSeitenServer(files=files) as stub:
+        urls = ['/logos/a.png', '/logos/a-copy.png', '/logos/b.png', '/logos/a.png',
+                '/logos/missing.png', None]
+        records = [{'name': f"Kanzlei {i}", 'logo_url': stub.base_url + url if url else ''}
+                   for i, url in enumerate(urls)]
+
+        with LogoStore(str(tmp_path / "logos")) as store:
+            downloader = LogoDownloader(store, fast_limiter(), concurrency=4,
+                                        thumbnail_size=(32, 32), thumbnail_workers=1)
+            stream = downloader.process(records)
+            results = [next(stream) for _ in records]
+            assert not downloader._in_flight  # zusammengeführte Downloads werden vergessen
+            assert next(stream, None) is None
+            assert downloader.downloaded == 3 and downloader.reused == 0
+            logo_gets = [path for path, _ in stub.requests if path.startswith('/logos/')]
+            assert sorted(logo_gets) == sorted(set(url for url in urls if url))  # a.png nur einmal
+
+            assert [r['name'] for r in results] == [r['name'] for r in records]
+            a, a_copy, b, a_again, missing, none = results
+            assert a['logo_sha256'] == a_copy['logo_sha256'] == a_again['logo_sha256'] != b['logo_sha256']
+            assert a['logo_path'] == a_copy['logo_path']
+            assert missing['logo_path'] == none['logo_path'] == ''
+            assert len(list((tmp_path / "logos" / "objects").rglob("*.png"))) == 2
+            with Image.open(a['logo_thumbnail']) as thumbnail:
+                assert max(thumbnail.size) <= 32
+
+            # Re-run: everything known from the index, no further downloads
+            again = LogoDownloader(store, fast_limiter(), thumbnail_size=(32, 32))
+            assert list(again.process(records)) == results
+            assert again.downloaded == 0 and again.reused == 4  # vier verschiedene URLs
+            assert len([p for p, _ in stub.requests if p.startswith('/logos/')]) == len(logo_gets)
+
+
+def test_website_crawler_finds_emails_politely(tmp_path):
+    """Website-Crawler: Impressum/Kontakt folgen, Limits pro Host, Größen- und Zeitlimit, Cache"""
+    def html(body):
+        return ('text/html; charset=utf-8', f"<html><body>{body}</body></html>".encode('utf-8'))
+
+    site_a = {
+        '/': html('<a href="/impressum">Impressum</a> <a href="/kontakt">Kontakt</a> '
+                  '<a href="https://andere-seite.de/impressum">Impressum extern</a>'),
+        '/impressum': html('Kanzlei A, E-Mail: <a href="mailto:info@kanzlei-a.de">info@kanzlei-a.de</a> '
+                           '<img src="logo@2x.png">'),
+        '/kontakt': html('Schreiben Sie an office (at) kanzlei-a (dot) de'),
+    }
+    site_b = {'/': html('x' * 200000 + ' spaet@kanzlei-b.de')}
+    assert extract_emails(site_a['/kontakt'][1].decode()) == ['office@kanzlei-a.de']
+
+    with StubGelbeSeitenServer(files=site_a) as a, StubGelbeSeitenServer(files=site_b) as b, \
+            StubGelbeSeitenServer(files={'/': html('langsam@kanzlei-c.de')}, latency=1.5) as c:
+        records = [
+            {'name': 'A', 'website': a.base_url + '/', 'email': ''},
+            {'name': 'A2', 'website': a.base_url, 'email': ''},
+            {'name': 'Hat Mail', 'website': a.base_url, 'email': 'schon@da.de'},
+            {'name': 'B', 'website': b.base_url + '/', 'email': ''},
+            {'name': 'C', 'website': c.base_url + '/', 'email': ''},
+            {'name': 'Ohne Website', 'website': '', 'email': ''},
+        ]
+        with DomainCache(str(tmp_path / "websites.sqlite")) as cache:
+            crawler = WebsiteEmailCrawler(cache, concurrency=4, per_host_delay=0.2, timeout=0.5,
+                                          max_bytes=64 * 1024)
+            started = time.monotonic()
+            results = list(crawler.enrich(records))
+            elapsed = time.monotonic() - started
+            a_requests = len(a.requests)
+
+            again = WebsiteEmailCrawler(cache, per_host_delay=0.2)
+            assert list(again.enrich(records[:2])) == results[:2]
+            assert again.pages_fetched == 0 and len(a.requests) == a_requests
+
+    assert [r['name'] for r in results] == [r['name'] for r in records]
+    assert results[0]['email'] == results[1]['email'] == 'info@kanzlei-a.de'
+    assert results[0]['website_emails'] == 'info@kanzlei-a.de; office@kanzlei-a.de'
+    assert results[2]['email'] == 'schon@da.de' and results[2]['website_emails'] == ''
+    assert results[3]['email'] == ''  # hinter dem Größenlimit
+    assert results[4]['email'] == ''  # Timeout
+    assert results[5]['email'] == ''
+    assert a_requests == 3  # Homepage + Impressum + Kontakt, einmal pro Domain
+    assert 0.4 <= elapsed < 2.5  # 2 x per_host_delay bei Seite A, Timeout bei C
+
+
+def test_geo_index_radius_and_top_rated(tmp_path):
+    """Geo-Index: Umkreis um eine PLZ, Top-bewertete im PLZ-Bereich, Regionsbericht, Parquet laden"""
+    import pytest
+    pytest.importorskip('numpy')
+    pytest.importorskip('pyarrow')
+    from gelbeseiten_geo import GeoIndex, coverage_stats, load_results
+
+    records = parse_html_soup(''.join(load_entries()), "steuerberater")[1]
+    with open_sink(str(tmp_path / "results.parquet")) as sink:
+        sink.write_many(records)
+    index = GeoIndex(records)
+    from_parquet = GeoIndex(load_results(str(tmp_path / "results.parquet")))
+
+    with pytest.raises(ValueError):
+        index.within('20354', 20)  # feiner als die Leitregionen-Mittelpunkte (~35 km)
+    near = index.within('20354', 50)
+    assert {r['postal_code'] for r, _ in near} == {'20354', '22529'}  # Hamburg, nicht Lüneburg/Itzehoe
+    assert [d for _, d in near] == sorted(d for _, d in near)
+    advisors = index.within('20354', 50, specialty='steuerberat')
+    assert advisors and all('steuerberat' in r['specialties'].lower() for r, _ in advisors)
+    assert len(advisors) < len(near)
+    assert [r['name'] for r, _ in from_parquet.within('20354', 50)] == [r['name'] for r, _ in near]
+
+    top = index.top_rated('8')
+    assert [r['postal_code'] for r in top] == ['81737', '81679']  # 5,0 mit 5 vor 5,0 mit 1 Bewertung
+    assert [r['name'] for r in from_parquet.top_rated('8')] == [r['name'] for r in top]
+    assert len(index.with_city('Hamburg')) == 4 and len(index.with_postal_prefix('8')) == 8
+
+    report = {row['region']: row for row in index.region_report()}
+    assert sum(row['entries'] for row in report.values()) == 50
+    assert report['20']['name'] == 'Hamburg' and report['20']['entries'] == 3
+    stats = coverage_stats(RecordBuffer(records))
+    assert stats == coverage_stats(records)
+    assert sum(row['email'] for row in report.values()) == stats['email']
+
+
+def test_service_streams_ndjson_and_cancels(tmp_path):
+    """Service-Modus: Jobs per HTTP, NDJSON-Stream während des Crawls, Status, Abbruch"""
+    import requests
+
+    with StubGelbeSeitenServer(latency=0.3) as stub, \
+            JobManager(workers=2, output_dir=str(tmp_path), rate_limiter=fast_limiter(),
+                       scraper_kwargs={'base_url': stub.base_url}, max_finished_jobs=1) as manager, \
+            ScrapeService(manager, port=0) as service:
+        assert requests.post(f"{service.url}/jobs", json={'term': 'x', 'format': 'xls'}).status_code == 400
+        assert requests.post(f"{service.url}/jobs",
+                             json={'term': 'x', 'results_per_page': 0}).status_code == 400
+        job = requests.post(f"{service.url}/jobs",
+                            json={'term': 'steuerberater', 'format': 'jsonl'}).json()
+        assert job['status'] in ('queued', 'running')
+
+        started = time.monotonic()
+        first_row_after = None
+        rows = []
+        with requests.get(f"{service.url}/jobs/{job['id']}/results", stream=True) as response:
+            assert response.headers['Content-Type'] == 'application/x-ndjson'
+            for line in response.iter_lines():
+                if first_row_after is None:
+                    first_row_after = time.monotonic() - started
+                rows.append(json.loads(line))
+        elapsed = time.monotonic() - started
+
+        status = requests.get(f"{service.url}/jobs/{job['id']}").json()
+        released = manager.get(job['id'])._lines is None  # Zeilen liegen jetzt nur noch in der Datei
+        again = requests.get(f"{service.url}/jobs/{job['id']}/results?offset=45&follow=0")
+
+        slow = requests.post(f"{service.url}/jobs", json={'term': 'steuerberater'}).json()
+        while requests.get(f"{service.url}/jobs/{slow['id']}").json()['records'] == 0:
+            time.sleep(0.05)
+        assert requests.delete(f"{service.url}/jobs/{slow['id']}").status_code == 200
+        while requests.get(f"{service.url}/jobs/{slow['id']}").json()['status'] == 'running':
+            time.sleep(0.05)
+        cancelled = requests.get(f"{service.url}/jobs/{slow['id']}").json()
+        remaining = [j['id'] for j in requests.get(f"{service.url}/jobs").json()]
+        assert requests.get(f"{service.url}/jobs/nope").status_code == 404
+        bad_offsets = [requests.get(f"{service.url}/jobs/{slow['id']}/results?offset={value}&follow=0")
+                       for value in ('abc', '-1')]
+
+    expected = parse_html_soup(''.join(load_entries()), "steuerberater")[1]
+    assert [r['name'] for r in rows] == [r['name'] for r in expected]
+    assert first_row_after < elapsed / 2  # erste Zeilen lange vor dem Ende des Crawls
+    assert status['status'] == 'done' and status['records'] == 50
+    with open(status['output_file'], encoding='utf-8') as f:
+        assert [json.loads(line)['name'] for line in f] == [r['name'] for r in expected]
+    assert released and len(again.text.splitlines()) == 5
+    assert [json.loads(line)['name'] for line in again.text.splitlines()] == [r['name'] for r in expected[45:]]
+    assert remaining == [slow['id']]  # nur der neueste beendete Job bleibt
+    assert cancelled['status'] == 'cancelled' and 0 < cancelled['records'] < 50
+    assert [r.status_code for r in bad_offsets] == [400, 400]
+
+
+def test_dead_letter_queue_keeps_crawl_moving(tmp_path):
+    """Dead-Letter-Queue: fehlgeschlagene Seiten blockieren den Lauf nicht, werden nachgeholt oder gemeldet"""
+    expected = parse_html_soup(''.join(load_entries()), "steuerberater")[1]
+    queue_file = str(tmp_path / "deadletters.sqlite")
+    with StubGelbeSeitenServer(failures={10: [500, 500], 30: [500] * 20}) as stub, \
+            DeadLetterQueue(queue_file, max_attempts=3, backoff_base=0.05) as dead_letters:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter())
+        results = scraper.scrape_all(output_file=str(tmp_path / "out.jsonl"), dead_letters=dead_letters)
+        stats = dead_letters.stats("steuerberater")
+
+    # Seite 10 kommt über den Retrier nach, Seite 30 bleibt verloren
+    assert scraper.missing_ranges == [(30, 40)]
+    assert stats == {'pending': 0, 'recovered': 1, 'lost': 1}
+    names = [r['name'] for r in expected[:30] + expected[40:]]
+    assert sorted(r['name'] for r in results) == sorted(names)
+    assert [r['name'] for r in results[:10]] == names[:10]  # Lauf ging ohne Warten weiter
+    with open(tmp_path / "out.jsonl", encoding='utf-8') as f:
+        assert sorted(json.loads(line)['name'] for line in f) == sorted(names)
+    assert scraper.metrics.dead_letters.value() == 2
+    with DeadLetterQueue(queue_file) as reopened:
+        assert reopened.missing_ranges("steuerberater") == [(30, 40)]
+
+    # Ein neuer Lauf gegen eine gesunde Seite meldet die alten Lücken nicht mehr
+    with StubGelbeSeitenServer() as stub, DeadLetterQueue(queue_file) as dead_letters:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter())
+        assert len(scraper.scrape_all(dead_letters=dead_letters)) == 50
+        assert scraper.missing_ranges == [] and dead_letters.missing_ranges("steuerberater") == []
+    # Ein Stopp bei max_results wartet nicht auf den Abgleich, die Seite bleibt offen
+    with StubGelbeSeitenServer(failures={10: [500] * 20}) as stub, \
+            DeadLetterQueue(queue_file, backoff_base=30) as dead_letters:
+        scraper = GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                             rate_limiter=fast_limiter())
+        started = time.monotonic()
+        assert len(scraper.scrape_all(max_results=20, dead_letters=dead_letters)) == 20
+        assert time.monotonic() - started < 5
+        assert scraper.missing_ranges == [(10, 20)]
+        assert dead_letters.stats("steuerberater")['pending'] == 1
+    # ... und eine Position, die der Crawl selbst wieder holt, gilt als erledigt
+    with DeadLetterQueue(queue_file) as dead_letters:
+        dead_letters.push("steuerberater", 30, 10)
+        dead_letters.resolve("steuerberater", 30)
+        assert dead_letters.missing_ranges("steuerberater") == [(10, 20)]
+
+
+def test_resumed_crawl_does_not_mark_earlier_pages_removed(tmp_path):
+    """Store + Fortsetzen: Einträge der Seiten vor dem Absturz gelten nicht als entfernt"""
+    csv_file = tmp_path / "out.csv"
+    journal_file = str(tmp_path / "out.journal")
+    with RecordStore(str(tmp_path / "store.sqlite")) as store, StubGelbeSeitenServer() as stub:
+        def scraper():
+            return GelbeSeitenScraperComplete("steuerberater", base_url=stub.base_url,
+                                              rate_limiter=fast_limiter())
+
+        scraper().scrape_all(store=store)
+        # Lauf bricht nach zwei Seiten ab und wird fortgesetzt
+        scraper().scrape_all(max_results=20, output_file=str(csv_file), journal_file=journal_file,
+                             store=store)
+        scraper().scrape_all(output_file=str(csv_file), journal_file=journal_file, resume=True,
+                             store=store)
+        runs = store.runs()
+
+    assert runs[0]['complete'] == 0 and runs[0]['removed'] == 0
+    assert runs[1]['complete'] == 0 and runs[1]['removed'] == 0
+    assert runs[2]['complete'] == 1
+
+
+if __name__ == "__main__":
+    import sys
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))